@@ -1,18 +1,95 @@
-from typing import TypedDict, Dict, Any, Annotated, Optional
-import json
+from typing import Dict, Any, Annotated, Optional, AsyncIterator, Tuple, List
+import asyncio
+from dataclasses import dataclass, field
+import time
 from langgraph.graph import StateGraph, END
+from langgraph.config import get_stream_writer
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel
 from app.services.rag_service import rag_service
+from app.services.semantic_cache import story_cache
 from app.config import settings
 from app.utils.logger import logger
+from app.utils.http_client import openai_http_client
+from app.utils.incremental_json import IncrementalJSONParser
 
-# Initialize LLM
-llm = ChatOpenAI(
-    api_key=settings.openai_api_key,
-    model="gpt-5-mini",
-    temperature=0.7
-)
+# Model routing: short stories for young readers go to a faster model
+STORY_MODEL = "gpt-5-mini"
+FAST_STORY_MODEL = "gpt-4o-mini"
+FAST_MODEL_MAX_PAGES = 3
+FAST_MODEL_MAX_AGE = 7
+
+# One LLM client per model, all sharing the pooled HTTP client
+_llms: Dict[str, ChatOpenAI] = {}
+
+
+def get_llm(model: str) -> ChatOpenAI:
+    """Return the (cached) LLM for a model."""
+    if model not in _llms:
+        _llms[model] = ChatOpenAI(
+            api_key=settings.openai_api_key,
+            model=model,
+            temperature=0.7,
+            streaming=True,
+            stream_usage=True,
+            http_async_client=openai_http_client
+        )
+    return _llms[model]
+
+
+def pick_model(child_age: int, max_pages: int) -> str:
+    """Choose the story model based on how demanding the request is."""
+    if max_pages <= FAST_MODEL_MAX_PAGES and child_age <= FAST_MODEL_MAX_AGE:
+        return FAST_STORY_MODEL
+    return STORY_MODEL
+
+class StoryPage(BaseModel):
+    """A single generated page."""
+    pageText: str
+
+
+class StorySchema(BaseModel):
+    """
+    Structured output schema for the story LLM.
+    
+    Only the pages are generated; title and description are already known
+    and are merged in by the server.
+    """
+    storyContent: List[StoryPage]
+
+
+# Static instructions sent as an identical first message on every call so
+# OpenAI's automatic prompt caching can reuse the prefix. Anything that
+# varies per request belongs in the user message.
+SYSTEM_PROMPT = """You are a helpful and creative assistant designed to generate engaging and age-appropriate stories for children. Your stories should be fun, imaginative, and suitable for the given age group.
+
+Every story you write must follow these rules:
+- Each page has a "pageText" field containing a portion of the story.
+- Each page should have a minimum of 250 words.
+- The story must be age-appropriate for the child's age.
+- Create an original and unique story.
+- If you are told which books the child has read, you may draw inspiration from themes, styles, or concepts they enjoyed, but create something completely original and unique.
+
+Return the pages in order as the storyContent list."""
+
+# Per-request values; library_section is empty when no context was retrieved
+USER_PROMPT_TEMPLATE = """Generate a story for a child of age {child_age} with the following details:
+- Story Title: "{title}"
+- Story Description: "{desc}"
+- The story should contain a maximum of {max_pages} pages.{library_section}"""
+
+LIBRARY_SECTION_HEADER = "\n\nThe child has read the following books:\n\n"
+
+# Parsed once at import; only the placeholders are filled per request
+STORY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", SYSTEM_PROMPT),
+    ("human", USER_PROMPT_TEMPLATE)
+])
+
+# Library context limits (characters per excerpt / across all excerpts)
+LIBRARY_EXCERPT_CHARS = 400
+LIBRARY_CONTEXT_MAX_CHARS = 4000
 
 def merge_usage(a: Dict[str, int], b: Dict[str, int]) -> Dict[str, int]:
     """Merge two token usage dictionaries."""
@@ -24,7 +101,12 @@ def merge_usage(a: Dict[str, int], b: Dict[str, int]) -> Dict[str, int]:
         "total_tokens": a.get("total_tokens", 0) + b.get("total_tokens", 0)
     }
 
-class StoryState(TypedDict):
+def merge_timings(a: Dict[str, float], b: Dict[str, float]) -> Dict[str, float]:
+    """Merge per-stage timing dictionaries."""
+    return {**(a or {}), **(b or {})}
+
+@dataclass(slots=True)
+class StoryState:
     # Input keys
     story_title: str
     story_description: str
@@ -35,125 +117,131 @@ class StoryState(TypedDict):
     use_history_context: bool
     
     # Internal/Output keys
-    library_context: Optional[str]
-    story_content: Optional[Dict]
-    token_usage: Annotated[Dict[str, int], merge_usage]
+    library_context: Optional[str] = None
+    story_content: Optional[Dict] = None
+    token_usage: Annotated[Dict[str, int], merge_usage] = field(default_factory=dict)
+    timings: Annotated[Dict[str, float], merge_timings] = field(default_factory=dict)
 
 async def retrieve_context(state: StoryState) -> Dict:
     """Node: Retrieve context from RAG service."""
+    started = time.perf_counter()
     try:
-        if not (state.get("use_books_context") or state.get("use_history_context")):
-            return {"library_context": ""}
-            
-        query = f"{state['story_title']} {state['story_description']}"
+        # Skip the embedding call and vector search for users without a library
+        if not await rag_service.user_has_library(
+            state.user_id, state.child_age, state.use_books_context, state.use_history_context
+        ):
+            retrieve_ms = (time.perf_counter() - started) * 1000
+            return {"library_context": "", "timings": {"retrieve_ms": retrieve_ms}}
+        
+        query = f"{state.story_title} {state.story_description}"
+        top_k = 3
+        
+        # Books and reading history are searched together in one filtered query
         library_docs = await rag_service.retrieve_from_user_library(
             query=query,
-            user_id=state["user_id"],
-            child_age=state["child_age"],
-            top_k=3,
-            include_books=state["use_books_context"],
-            include_stories=state["use_history_context"]
+            user_id=state.user_id,
+            child_age=state.child_age,
+            top_k=top_k,
+            include_books=state.use_books_context,
+            include_stories=state.use_history_context
         )
         
-        context_str = ""
-        if library_docs:
-            context_str = "\n\n".join([
-                f"From your reading history {i+1}:\n{doc.page_content[:400]}..."
-                for i, doc in enumerate(library_docs)
-            ])
-            logger.info(f"Retrieved {len(library_docs)} documents")
+        # Cap the total excerpt size so the prompt stays bounded as top_k grows
+        context_parts = []
+        total_chars = 0
+        for i, doc in enumerate(library_docs):
+            excerpt = doc.page_content[:LIBRARY_EXCERPT_CHARS]
+            context_parts.append(f"From your reading history {i+1}:\n{excerpt}...")
+            total_chars += len(excerpt)
+            if total_chars >= LIBRARY_CONTEXT_MAX_CHARS:
+                break
+        
+        context_str = "\n\n".join(context_parts)
+        retrieve_ms = (time.perf_counter() - started) * 1000
+        logger.info("retrieve_context took %.1fms, docs=%d", retrieve_ms, len(library_docs))
             
-        return {"library_context": context_str}
+        return {"library_context": context_str, "timings": {"retrieve_ms": retrieve_ms}}
         
     except Exception as e:
-        logger.error(f"Error in retrieve_context: {e}")
-        return {"library_context": ""}
+        logger.error("Error in retrieve_context: %s", e)
+        return {
+            "library_context": "",
+            "timings": {"retrieve_ms": (time.perf_counter() - started) * 1000}
+        }
 
 async def generate_story_content(state: StoryState) -> Dict:
     """Node: Generate the story JSON."""
     try:
         # Construct parameters
-        child_age = state["child_age"]
-        max_pages = state["max_pages"]
-        title = state["story_title"]
-        desc = state["story_description"]
-        library_context = state.get("library_context", "")
-
-        # System Prompt
-        system_prompt = """You are a helpful and creative assistant designed to generate engaging and age-appropriate stories for children. Your stories should be fun, imaginative, and suitable for the given age group."""
-        
-        if library_context:
-            system_prompt += f"\n\nThe child has read the following books. You may draw inspiration from themes, styles, or concepts they enjoyed, but create something completely original and unique:\n\n{library_context}"
-
-        # User Prompt
-        user_prompt = f"""Generate a story for a child of age {child_age} with the following details:
-        - Story Title: "{title}"
-        - Story Description: "{desc}"
-        - The story should contain a maximum of {max_pages} pages.
-        - Each page should have a "pageText" field containing a portion of the story.
-        - Each page should have a minimum of 250 words.
-        - The response should follow this format:
-        
-        {{
-          "storyTitle": "{title}",
-          "storyDescription": "{desc}",
-          "storyContent": [
-            {{
-              "pageText": "Text for page 1"
-            }},
-            {{
-              "pageText": "Text for page 2"
-            }}
-          ]
-        }}
+        child_age = state.child_age
+        max_pages = state.max_pages
+        title = state.story_title
+        desc = state.story_description
+        library_context = state.library_context or ""
+
+        # Build messages from the precompiled template
+        messages = STORY_PROMPT.format_messages(
+            child_age=child_age,
+            title=title,
+            desc=desc,
+            max_pages=max_pages,
+            library_section=LIBRARY_SECTION_HEADER + library_context if library_context else ""
+        )
         
-        Ensure that the story is age-appropriate for a child of age {child_age}.
-        Create an original and unique story.
-        Return ONLY valid JSON."""
-
-        # Call LLM
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt)
-        ]
+        # Stream tokens and parse incrementally so each page can be surfaced
+        # (see stream_story_generation) as soon as its closing brace arrives
+        writer = get_stream_writer()
+        parser = IncrementalJSONParser("storyContent")
+        response = None
+        page_index = 0
+        llm = get_llm(pick_model(child_age, max_pages))
+        started = time.perf_counter()
+        ttft_ms = None
+        async for chunk in llm.astream(messages, response_format=StorySchema):
+            if ttft_ms is None and chunk.content:
+                ttft_ms = (time.perf_counter() - started) * 1000
+            response = chunk if response is None else response + chunk
+            for page in parser.feed(chunk.content):
+                writer({"index": page_index, "page": page})
+                page_index += 1
         
-        response = await llm.ainvoke(messages)
+        # Track usage (reported on the final chunk when stream_usage=True)
+        usage_metadata = (response.usage_metadata if response else None) or {}
+        usage = {
+            "prompt_tokens": usage_metadata.get("input_tokens", 0),
+            "completion_tokens": usage_metadata.get("output_tokens", 0),
+            "total_tokens": usage_metadata.get("total_tokens", 0)
+        }
+        cached_tokens = usage_metadata.get("input_token_details", {}).get("cache_read", 0)
+        logger.info("Token usage for story generation: %s (cached prompt tokens: %s)", usage, cached_tokens)
         
-        # Track usage
-        usage = response.response_metadata.get("token_usage", {})
-        logger.info(f"Token usage for story generation: {usage}")
-
-        content_str = response.content
+        generate_ms = (time.perf_counter() - started) * 1000
+        logger.info("generate_story_content TTFT %.1fms, total %.1fms", ttft_ms or 0.0, generate_ms)
         
-        # Parse JSON
+        # Parse and validate against the schema the output was constrained to
         try:
-            # Clean markdown code blocks
-            original_content = content_str
-            if "```json" in content_str:
-                content_str = content_str.split("```json")[1].split("```")[0].strip()
-            elif "```" in content_str:
-                content_str = content_str.split("```")[1].split("```")[0].strip()
-            
-            logger.info(f"Parsing story JSON (length: {len(content_str)} chars)")
-            story_json = json.loads(content_str)
-            
-            # Validate structure
-            if "storyContent" not in story_json or not isinstance(story_json.get("storyContent"), list):
-                raise ValueError("Invalid story structure: missing or invalid storyContent")
+            story = StorySchema.model_validate(parser.close())
+            story_json = {
+                "storyTitle": title,
+                "storyDescription": desc,
+                **story.model_dump()
+            }
             
-        except (json.JSONDecodeError, ValueError) as e:
-            logger.error(f"JSON parse error: {e}")
-            logger.error(f"Content preview: {content_str[:500]}...")
+        except ValueError as e:
+            content_str = response.content if response else ""
+            logger.error("JSON parse error: %s", e)
+            logger.error("Content preview: %.500s...", content_str)
             # Better fallback - return error instead of malformed data
             raise Exception(f"Failed to parse story JSON from GPT: {str(e)}")
 
         return {
             "story_content": story_json,
-            "token_usage": usage
+            "token_usage": usage,
+            "timings": {"ttft_ms": ttft_ms or 0.0, "generate_ms": generate_ms}
         }
 
     except Exception as e:
-        logger.error(f"Error in generate_story_content: {e}")
+        logger.error("Error in generate_story_content: %s", e)
         raise
 
 # Build Graph
@@ -162,12 +250,72 @@ workflow = StateGraph(StoryState)
 workflow.add_node("retrieve_context", retrieve_context)
 workflow.add_node("generate_story_content", generate_story_content)
 
-workflow.set_entry_point("retrieve_context")
+def route_entry(state: StoryState) -> str:
+    """Skip retrieval entirely when no library context was requested."""
+    if state.use_books_context or state.use_history_context:
+        return "retrieve_context"
+    return "generate_story_content"
+
+workflow.set_conditional_entry_point(
+    route_entry,
+    ["retrieve_context", "generate_story_content"]
+)
 workflow.add_edge("retrieve_context", "generate_story_content")
 workflow.add_edge("generate_story_content", END)
 
 story_graph = workflow.compile()
 
+def _initial_state(
+    story_title: str,
+    story_description: str,
+    child_age: int,
+    max_pages: int,
+    user_id: str,
+    use_books_context: bool,
+    use_history_context: bool
+) -> StoryState:
+    """Build the initial graph state."""
+    return StoryState(
+        story_title=story_title,
+        story_description=story_description,
+        child_age=child_age,
+        max_pages=max_pages,
+        user_id=user_id,
+        use_books_context=use_books_context,
+        use_history_context=use_history_context
+    )
+
+
+def _cache_partition(state: StoryState) -> Tuple:
+    """Requests may only share a cached story when these parameters match."""
+    uses_context = state.use_books_context or state.use_history_context
+    return (
+        state.child_age,
+        state.max_pages,
+        state.use_books_context,
+        state.use_history_context,
+        # Library context is personal, so cached stories built on it are too
+        state.user_id if uses_context else None
+    )
+
+
+async def _cache_lookup(state: StoryState) -> Tuple[Optional[Any], Optional[Dict]]:
+    """
+    Look up a semantically similar story.
+    
+    Returns:
+        (query embedding or None if caching is unavailable, cached story or None)
+    """
+    if not settings.semantic_cache_enabled:
+        return None, None
+    try:
+        vector = await story_cache.embed(f"{state.story_title} {state.story_description}")
+    except Exception as e:
+        logger.warning("Semantic cache lookup failed, generating without cache: %s", e)
+        return None, None
+    return vector, story_cache.get(_cache_partition(state), vector)
+
+
 async def run_story_generation(
     story_title: str,
     story_description: str,
@@ -179,21 +327,92 @@ async def run_story_generation(
 ) -> Dict:
     """Wrapper to run the graph."""
     
-    initial_state = {
-        "story_title": story_title,
-        "story_description": story_description,
-        "child_age": child_age,
-        "max_pages": max_pages,
-        "user_id": user_id,
-        "use_books_context": use_books_context,
-        "use_history_context": use_history_context,
-        "token_usage": {}
-    }
+    initial_state = _initial_state(
+        story_title, story_description, child_age, max_pages,
+        user_id, use_books_context, use_history_context
+    )
+    
+    vector, cached_story = await _cache_lookup(initial_state)
+    if cached_story is not None:
+        return cached_story
     
     result = await story_graph.ainvoke(initial_state)
     
     # Log final usage
     total_usage = result.get("token_usage", {})
-    logger.info(f"Total story generation usage: {total_usage}")
+    logger.info("Total story generation usage: %s", total_usage)
+    logger.info("Story generation timings: %s", result.get("timings", {}))
+    
+    if vector is not None:
+        story_cache.put(_cache_partition(initial_state), vector, result["story_content"])
     
     return result["story_content"]
+
+
+async def run_story_generation_batch(requests: List[Dict]) -> List[Any]:
+    """
+    Run several story generations concurrently.
+    
+    Args:
+        requests: Keyword arguments for run_story_generation, one per story
+        
+    Returns:
+        Story content (or the raised exception) for each request, in input order
+    """
+    semaphore = asyncio.Semaphore(settings.story_batch_concurrency)
+    
+    async def _run(request: Dict) -> Dict:
+        async with semaphore:
+            return await run_story_generation(**request)
+    
+    return await asyncio.gather(
+        *[_run(request) for request in requests],
+        return_exceptions=True
+    )
+
+
+async def stream_story_generation(
+    story_title: str,
+    story_description: str,
+    child_age: int,
+    max_pages: int,
+    user_id: str,
+    use_books_context: bool = False,
+    use_history_context: bool = False
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Run the graph and yield events as the story is generated.
+    
+    Yields:
+        ("page", dict) for each page as soon as it is generated, then
+        ("story", dict) once with the parsed story content
+    """
+    initial_state = _initial_state(
+        story_title, story_description, child_age, max_pages,
+        user_id, use_books_context, use_history_context
+    )
+    
+    vector, cached_story = await _cache_lookup(initial_state)
+    if cached_story is not None:
+        for index, page in enumerate(cached_story["storyContent"]):
+            yield "page", {"index": index, "page": page}
+        yield "story", cached_story
+        return
+    
+    final_state: Dict = {}
+    async for mode, payload in story_graph.astream(
+        initial_state,
+        stream_mode=["custom", "values"]
+    ):
+        if mode == "custom":
+            yield "page", payload
+        else:
+            final_state = payload
+    
+    logger.info("Total story generation usage: %s", final_state.get("token_usage", {}))
+    logger.info("Story generation timings: %s", final_state.get("timings", {}))
+    
+    if vector is not None:
+        story_cache.put(_cache_partition(initial_state), vector, final_state["story_content"])
+    
+    yield "story", final_state["story_content"]
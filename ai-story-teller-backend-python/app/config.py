@@ -1,6 +1,6 @@
 """Application configuration with environment variable validation."""
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -15,6 +15,9 @@ class Settings(BaseSettings):
     jwt_algorithm: str = "HS256"
     jwt_expiration_days: int = 15
     
+    # Password hashing cost (log2 rounds); lower it only for tests
+    bcrypt_rounds: int = 12
+    
     # OpenAI
     openai_api_key: str
     
@@ -26,6 +29,8 @@ class Settings(BaseSettings):
     aws_secret_access_key: str
     aws_region: str = "us-east-1"
     s3_bucket_name: str
+    # CDN (e.g. CloudFront) in front of the bucket; generated images are served from it when set
+    cdn_base_url: Optional[str] = None
     
     # Server URLs
     frontend_url: str = "http://localhost:5173"
@@ -37,8 +42,47 @@ class Settings(BaseSettings):
     # Logging
     log_level: str = "INFO"
     
-    # ChromaDB
+    # ChromaDB (embedded at chroma_db_path unless a Chroma server host is set)
     chroma_db_path: str = "./chroma_db"
+    chroma_host: Optional[str] = None
+    chroma_port: int = 8000
+    
+    # Semantic cache for generated stories (env SEMANTIC_CACHE_ENABLED). Opt-in:
+    # requests whose prompts embed within the threshold get back the same stored
+    # story, even across users
+    semantic_cache_enabled: bool = False
+    semantic_cache_threshold: float = 0.95
+    semantic_cache_max_entries: int = 256
+    
+    # Use the compressed system prompt for generate_story (env STORYGEN_COMPRESSED)
+    storygen_compressed: bool = False
+    
+    # Maximum concurrent story completion streams per process
+    story_generation_concurrency: int = 40
+    
+    # Maximum concurrent generations in a batch request
+    story_batch_concurrency: int = 8
+    
+    # Maximum concurrent image generations per story
+    image_generation_concurrency: int = 8
+    
+    # Client-side DALL-E limit in images per minute; this, not the concurrency
+    # above, bounds image throughput. The default is OpenAI's usage tier 1
+    # limit (a 10-page story takes about two minutes); raise it to match the
+    # account's tier (env OPENAI_IMAGES_PER_MINUTE)
+    openai_images_per_minute: int = 5
+    
+    # Maximum concurrent embedding batches while indexing, per process
+    embedding_concurrency: int = 10
+    
+    # Generate comprehension questions while a story's images render (env
+    # PREFETCH_QUESTIONS). Off by default: it costs an LLM call per story even
+    # if the quiz is never opened
+    prefetch_questions: bool = False
+    
+    # Client-side OpenAI rate limits (per model)
+    openai_requests_per_minute: int = 500
+    openai_tokens_per_minute: int = 200000
     
     class Config:
         env_file = ".env"
@@ -46,4 +90,3 @@ class Settings(BaseSettings):
 
 
 settings = Settings()
-
@@ -2,6 +2,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 from app.config import settings
 from app.database import connect_db, close_db
 from app.routers import users, stories, audio, books
@@ -15,7 +16,20 @@ from app.exceptions import AppException
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from app.utils.logger import logger
+from app.utils.responses import ORJSONResponse
+from app.utils.http_client import close_http_client
+from app.utils.pdf import shutdown_pdf_pool
+from app.utils.background import wait_for_background_tasks
+from app.openai_client._client import warm_up_openai
+from app.services.rag_service import rag_service
+import asyncio
 import logging
+import os
+
+# Threads behind asyncio.to_thread. Most offloaded work (S3, Chroma, text
+# extraction) waits on I/O or C code without holding the GIL, so size the
+# pool well past the core count
+THREAD_POOL_WORKERS = min(32, (os.cpu_count() or 1) * 4)
 
 
 @asynccontextmanager
@@ -23,11 +37,18 @@ async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown."""
     # Startup
     logger.info("Starting application...")
+    executor = ThreadPoolExecutor(max_workers=THREAD_POOL_WORKERS, thread_name_prefix="worker")
+    asyncio.get_running_loop().set_default_executor(executor)
     await connect_db()
+    await asyncio.gather(warm_up_openai(), rag_service.warm_up())
     yield
     # Shutdown
     logger.info("Shutting down application...")
+    await wait_for_background_tasks()
+    await close_http_client()
+    shutdown_pdf_pool()
     await close_db()
+    executor.shutdown(wait=False)
 
 
 # Create FastAPI app
@@ -35,7 +56,8 @@ app = FastAPI(
     title="AI Storyteller API",
     description="AI-powered storytelling platform with RAG enhancement",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -74,6 +96,8 @@ if __name__ == "__main__":
         "app.main:app",
         host="0.0.0.0",
         port=8000,
+        loop="uvloop",
+        http="httptools",
         reload=True
     )
 
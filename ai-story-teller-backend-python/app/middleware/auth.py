@@ -1,18 +1,33 @@
 """Authentication middleware for protected routes."""
 from fastapi import Request, HTTPException, status, Cookie
-from typing import Optional
-from app.utils.jwt import verify_token
-from app.schemas.user import User
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+from collections import OrderedDict
+import time
+from beanie import PydanticObjectId
+from app.utils.jwt import decode_token
+from app.schemas.user import AuthUser, User
 from app.exceptions import UnauthorizedError
 from app.utils.logger import logger
 
 
-async def get_current_user(request: Request) -> User:
-    """
-    Dependency function for protected routes.
-    Extracts JWT token from cookie and returns authenticated user.
-    """
-    # Try to get token from cookie
+# Authenticated users cached by token: token -> (expires_at, user)
+USER_CACHE_TTL_SECONDS = 60
+USER_CACHE_MAX_SIZE = 10_000
+_user_cache: "OrderedDict[str, Tuple[float, User]]" = OrderedDict()
+_auth_user_cache: "OrderedDict[str, Tuple[float, AuthUser]]" = OrderedDict()
+
+UserT = TypeVar("UserT")
+
+
+def invalidate_user_cache(token: Optional[str]) -> None:
+    """Drop a token from the authenticated user caches (e.g. on logout)."""
+    if token:
+        _user_cache.pop(token, None)
+        _auth_user_cache.pop(token, None)
+
+
+def _get_token(request: Request) -> str:
+    """Extract the JWT token from the request cookie."""
     token = request.cookies.get("jwt")
     
     if not token:
@@ -22,30 +37,93 @@ async def get_current_user(request: Request) -> User:
             detail="Not authenticated",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    # Verify token
-    user_id = verify_token(token)
-    if not user_id:
+    return token
+
+
+def _verify(token: str) -> Dict:
+    """Verify a token and return its payload."""
+    payload = decode_token(token)
+    if not payload or not payload.get("userId"):
         logger.warning("Invalid or expired JWT token")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token"
         )
+    return payload
+
+
+async def get_current_user_id(request: Request) -> str:
+    """
+    Lightweight dependency for routes that only need the caller's ID.
+    Verifies the JWT cookie without loading the user from the database.
+    """
+    return _verify(_get_token(request))["userId"]
+
+
+async def _authenticate(
+    request: Request,
+    cache: "OrderedDict[str, Tuple[float, UserT]]",
+    load: Callable[[str], Awaitable[Optional[UserT]]]
+) -> UserT:
+    """Verify the JWT cookie and load its user, serving recent tokens from cache."""
+    # Try to get token from cookie
+    token = _get_token(request)
+    
+    # Serve recently authenticated tokens from memory
+    now = time.time()
+    cached = cache.get(token)
+    if cached:
+        expires_at, user = cached
+        if expires_at > now:
+            return user
+        del cache[token]
+    
+    # Verify token
+    payload = _verify(token)
+    user_id = payload["userId"]
     
     # Get user from database
     try:
-        user = await User.get(user_id)
-        if not user:
-            logger.warning(f"User not found for ID: {user_id}")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found"
-            )
-        return user
+        user = await load(user_id)
     except Exception as e:
         logger.error(f"Error fetching user: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error authenticating user"
         )
+    
+    if not user:
+        logger.warning(f"User not found for ID: {user_id}")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found"
+        )
+    
+    # Never cache past the token's own expiry
+    expires_at = min(now + USER_CACHE_TTL_SECONDS, payload.get("exp", now))
+    cache[token] = (expires_at, user)
+    while len(cache) > USER_CACHE_MAX_SIZE:
+        cache.popitem(last=False)
+    
+    return user
+
+
+async def _load_auth_user(user_id: str) -> Optional[AuthUser]:
+    """Fetch only the AuthUser fields of a user."""
+    return await User.find_one(User.id == PydanticObjectId(user_id)).project(AuthUser)
 
+
+async def get_current_user(request: Request) -> User:
+    """
+    Dependency function for protected routes.
+    Extracts JWT token from cookie and returns authenticated user.
+    """
+    return await _authenticate(request, _user_cache, User.get)
+
+
+async def get_auth_user(request: Request) -> AuthUser:
+    """
+    Lighter get_current_user for routes that only read the caller's id,
+    parent name or child age. Only those fields are fetched and validated.
+    """
+    return await _authenticate(request, _auth_user_cache, _load_auth_user)
@@ -1,17 +1,17 @@
 """Global error handling middleware."""
 from fastapi import Request, status
-from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from app.exceptions import AppException
+from app.utils.responses import ORJSONResponse
 from app.utils.logger import logger
 from typing import Any, Dict
 
 
-async def app_exception_handler(request: Request, exc: AppException) -> JSONResponse:
+async def app_exception_handler(request: Request, exc: AppException) -> ORJSONResponse:
     """Handle custom application exceptions."""
-    logger.error(f"Application exception: {exc.message} - {exc.details}")
-    return JSONResponse(
+    logger.error("Application exception: %s - %s", exc.message, exc.details)
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={
             "error": exc.message,
@@ -21,10 +21,10 @@ async def app_exception_handler(request: Request, exc: AppException) -> JSONResp
     )
 
 
-async def http_exception_handler(request: Request, exc: StarletteHTTPException) -> JSONResponse:
+async def http_exception_handler(request: Request, exc: StarletteHTTPException) -> ORJSONResponse:
     """Handle HTTP exceptions."""
-    logger.warning(f"HTTP exception: {exc.detail}")
-    return JSONResponse(
+    logger.warning("HTTP exception: %s", exc.detail)
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={
             "error": exc.detail,
@@ -33,7 +33,7 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException)
     )
 
 
-async def validation_exception_handler(request: Request, exc: RequestValidationError) -> JSONResponse:
+async def validation_exception_handler(request: Request, exc: RequestValidationError) -> ORJSONResponse:
     """Handle request validation errors."""
     errors = exc.errors()
     error_details = {}
@@ -41,8 +41,8 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         field = ".".join(str(loc) for loc in error["loc"])
         error_details[field] = error["msg"]
     
-    logger.warning(f"Validation error: {error_details}")
-    return JSONResponse(
+    logger.warning("Validation error: %s", error_details)
+    return ORJSONResponse(
         status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
         content={
             "error": "Validation error",
@@ -52,10 +52,10 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     )
 
 
-async def general_exception_handler(request: Request, exc: Exception) -> JSONResponse:
+async def general_exception_handler(request: Request, exc: Exception) -> ORJSONResponse:
     """Handle unexpected exceptions."""
-    logger.error(f"Unexpected error: {str(exc)}", exc_info=True)
-    return JSONResponse(
+    logger.error("Unexpected error: %s", exc, exc_info=True)
+    return ORJSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         content={
             "error": "Internal server error",
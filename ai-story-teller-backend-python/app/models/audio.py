@@ -1,7 +1,9 @@
 """Pydantic models for audio requests and responses."""
+from beanie import PydanticObjectId
 from pydantic import BaseModel, ConfigDict, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
+from app.models.story import PageContent
 
 
 class AudioResponse(BaseModel):
@@ -20,8 +22,35 @@ class AudioResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True, populate_by_name=True)
 
 
+class FeedbackAudio(BaseModel):
+    """Audio fields returned with final feedback."""
+    id: PydanticObjectId
+    file_path: str = Field(..., alias="filePath")
+    file_name: str = Field(..., alias="fileName")
+    transcript: Optional[str] = None
+    score: Optional[float] = None
+    whole_story: str = Field(..., alias="wholeStory")
+    sid: Optional[PydanticObjectId] = None
+    created_at: datetime = Field(..., alias="createdAt")
+    
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
+
+class FeedbackStory(BaseModel):
+    """Story fields returned with final feedback."""
+    id: PydanticObjectId
+    story_title: str = Field(..., alias="storyTitle")
+    story_description: str = Field(..., alias="storyDescription")
+    story_content: List[PageContent] = Field(..., alias="storyContent")
+    story_author: str = Field(..., alias="storyAuthor")
+    max_pages: int = Field(..., alias="maxPages")
+    
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
+
 class AudioFeedbackResponse(BaseModel):
     """Audio feedback response model."""
-    audio: AudioResponse
-    story: dict
-
+    audio: FeedbackAudio
+    story: Optional[FeedbackStory] = None
+    
+    model_config = ConfigDict(from_attributes=True)
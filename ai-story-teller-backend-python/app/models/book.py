@@ -12,6 +12,25 @@ class UploadBookMetadata(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
 
 
+class CreateUploadRequest(BaseModel):
+    """Request to start a direct-to-S3 book upload."""
+    file_name: str = Field(..., min_length=1, max_length=255, description="File name", alias="fileName")
+    file_size: int = Field(..., gt=0, description="File size in bytes", alias="fileSize")
+    content_type: Optional[str] = Field(None, description="File MIME type", alias="contentType")
+    book_title: Optional[str] = Field(None, max_length=200, description="Book title", alias="bookTitle")
+    book_author: Optional[str] = Field(None, max_length=100, description="Book author", alias="bookAuthor")
+    
+    model_config = ConfigDict(populate_by_name=True)
+
+
+class UploadSessionResponse(BaseModel):
+    """Presigned upload for a pending book; PUT the file, then finalize the book."""
+    book_id: str = Field(..., serialization_alias="bookId")
+    upload_url: str = Field(..., serialization_alias="uploadUrl")
+    content_type: str = Field(..., serialization_alias="contentType")
+    expires_in: int = Field(..., serialization_alias="expiresIn")
+
+
 class BookResponse(BaseModel):
     """Book response model."""
     id: str
@@ -35,3 +54,4 @@ class BookListResponse(BaseModel):
     total: int
     page: int
     limit: int
+    next_cursor: Optional[str] = Field(None, serialization_alias="nextCursor")
@@ -8,6 +8,8 @@ class PageContent(BaseModel):
     """Page content model."""
     page_text: str = Field(..., alias="pageText")
     page_image: Optional[str] = Field(None, alias="pageImage")
+    
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
 
 
 class CreateStoryRequest(BaseModel):
@@ -23,6 +25,11 @@ class CreateStoryRequest(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
 
 
+class CreateStoryBatchRequest(BaseModel):
+    """Batch story creation request model."""
+    stories: List[CreateStoryRequest] = Field(..., min_length=1, max_length=30, description="Stories to create (1-30)")
+
+
 class StoryResponse(BaseModel):
     """Story response model."""
     id: str
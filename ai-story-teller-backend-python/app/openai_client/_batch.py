@@ -0,0 +1,78 @@
+"""OpenAI Batch API helpers for bulk chat completions."""
+import asyncio
+import orjson
+from typing import Any, Dict, List, Tuple, Union
+from app.openai_client._client import client
+from app.utils.logger import logger
+
+# Polling schedule for Batch API jobs (seconds)
+BATCH_POLL_INITIAL_DELAY = 5.0
+BATCH_POLL_MAX_DELAY = 300.0
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+async def run_chat_batch(
+    requests: List[Tuple[str, Dict[str, Any]]],
+    name: str = "batch"
+) -> Dict[str, Union[str, Exception]]:
+    """
+    Run chat completions through the Batch API and wait for the results.
+
+    Batch jobs are billed at a discount and use a separate rate limit pool,
+    but may take up to 24 hours, so this is only meant for bulk/offline work.
+
+    Args:
+        requests: List of (custom_id, chat completion body) tuples
+        name: Label used for the uploaded file and log messages
+
+    Returns:
+        Message content per custom_id; failed requests hold an Exception
+    """
+    lines = [
+        orjson.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": body
+        })
+        for custom_id, body in requests
+    ]
+
+    input_file = await client.files.create(
+        file=(f"{name}.jsonl", b"\n".join(lines)),
+        purpose="batch"
+    )
+    batch = await client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    logger.info("Submitted %s %s with %d requests", name, batch.id, len(requests))
+
+    delay = BATCH_POLL_INITIAL_DELAY
+    while batch.status not in BATCH_TERMINAL_STATUSES:
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, BATCH_POLL_MAX_DELAY)
+        batch = await client.batches.retrieve(batch.id)
+
+    if batch.status != "completed" or not batch.output_file_id:
+        raise Exception(f"Batch {batch.id} ended with status {batch.status}")
+
+    output = await client.files.content(batch.output_file_id)
+
+    results: Dict[str, Union[str, Exception]] = {
+        custom_id: Exception("No result returned for batch request") for custom_id, _ in requests
+    }
+    for line in output.text.splitlines():
+        if not line.strip():
+            continue
+        record: Dict[str, Any] = orjson.loads(line)
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            results[record["custom_id"]] = Exception(
+                f"Batch request failed: {record.get('error') or response.get('body')}"
+            )
+            continue
+        results[record["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+
+    return results
@@ -0,0 +1,26 @@
+"""Shared OpenAI client."""
+from openai import AsyncOpenAI
+from app.config import settings
+from app.utils.http_client import openai_http_client
+from app.utils.logger import logger
+
+# One client for all OpenAI integrations, backed by the shared aiohttp connection pool.
+# Retries are handled by _limiter.guarded_call so they respect the rate limiter.
+client = AsyncOpenAI(api_key=settings.openai_api_key, http_client=openai_http_client, max_retries=0)
+
+# Seconds to wait for the startup warm-up request
+WARMUP_TIMEOUT = 5.0
+
+
+async def warm_up_openai() -> None:
+    """
+    Open a pooled connection to the OpenAI API before the first request needs it.
+    
+    The TCP and TLS handshake is paid here, once per worker, instead of by the
+    first user. Failures are logged and ignored so startup never depends on OpenAI.
+    """
+    try:
+        await client.with_options(timeout=WARMUP_TIMEOUT).models.list()
+        logger.info("OpenAI connection pool warmed up")
+    except Exception as e:
+        logger.warning("OpenAI warm-up failed: %s", e)
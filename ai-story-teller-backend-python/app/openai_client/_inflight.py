@@ -0,0 +1,28 @@
+"""Coalescing of identical in-flight OpenAI requests."""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+async def coalesce(
+    inflight: Dict[Hashable, "asyncio.Future[Any]"],
+    key: Hashable,
+    request: Callable[[], Awaitable[Any]]
+) -> Any:
+    """
+    Run `request` once per key, sharing its result with concurrent callers.
+
+    Args:
+        inflight: Registry of pending requests owned by the caller's module
+        key: Identity of the request (e.g. a cache key)
+        request: Factory for the coroutine doing the actual work
+
+    Returns:
+        The request's result
+    """
+    task = inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(request())
+        inflight[key] = task
+        task.add_done_callback(lambda _: inflight.pop(key, None))
+    # Shield so one caller's cancellation does not cancel the shared request
+    return await asyncio.shield(task)
@@ -0,0 +1,144 @@
+"""Client-side rate limiting and retries for OpenAI calls."""
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional
+import openai
+from app.config import settings
+from app.utils.logger import logger
+
+MAX_ATTEMPTS = 5
+MAX_BACKOFF_SECONDS = 60.0
+# Upper bound on a server-sent Retry-After, so one bad header cannot stall a request
+MAX_RETRY_AFTER_SECONDS = 30.0
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError
+)
+
+
+class AsyncLimiter:
+    """
+    Token bucket limiting both requests and tokens per minute.
+
+    Buckets refill continuously based on elapsed time, and are tightened by
+    the `x-ratelimit-remaining-*` headers OpenAI returns with each response.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_available = float(requests_per_minute)
+        self.tokens_available = float(tokens_per_minute)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed_minutes = (now - self._updated_at) / 60
+        self._updated_at = now
+        self.requests_available = min(
+            self.requests_per_minute,
+            self.requests_available + elapsed_minutes * self.requests_per_minute
+        )
+        self.tokens_available = min(
+            self.tokens_per_minute,
+            self.tokens_available + elapsed_minutes * self.tokens_per_minute
+        )
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """Wait until one request and `tokens` tokens are available, then take them."""
+        # Never ask for more than a full bucket, or the wait would never end
+        tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.requests_available >= 1 and self.tokens_available >= tokens:
+                    self.requests_available -= 1
+                    self.tokens_available -= tokens
+                    return
+                wait_minutes = max(
+                    (1 - self.requests_available) / self.requests_per_minute,
+                    (tokens - self.tokens_available) / self.tokens_per_minute
+                )
+                await asyncio.sleep(max(wait_minutes * 60, 0.01))
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        """Clamp the buckets to the remaining quota reported by OpenAI."""
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        try:
+            if remaining_requests is not None:
+                self.requests_available = min(self.requests_available, float(remaining_requests))
+            if remaining_tokens is not None:
+                self.tokens_available = min(self.tokens_available, float(remaining_tokens))
+        except ValueError:
+            pass
+
+
+# Models limited in images per minute rather than chat requests; each call
+# generates one image
+IMAGE_MODELS = frozenset({"dall-e-2", "dall-e-3"})
+
+_limiters: Dict[str, AsyncLimiter] = {}
+
+
+def get_limiter(model: str) -> AsyncLimiter:
+    """Return the shared limiter for a model."""
+    if model not in _limiters:
+        _limiters[model] = AsyncLimiter(
+            requests_per_minute=(
+                settings.openai_images_per_minute if model in IMAGE_MODELS
+                else settings.openai_requests_per_minute
+            ),
+            tokens_per_minute=settings.openai_tokens_per_minute
+        )
+    return _limiters[model]
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Seconds to wait before retrying, honoring Retry-After when present."""
+    response = getattr(error, "response", None)
+    retry_after: Optional[str] = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), MAX_RETRY_AFTER_SECONDS)
+        except ValueError:
+            pass
+    return min(2 ** attempt + random.uniform(0, 1), MAX_BACKOFF_SECONDS)
+
+
+async def guarded_call(
+    call: Callable[[], Awaitable[Any]],
+    model: str,
+    est_tokens: int = 0
+) -> Any:
+    """
+    Run a raw-response OpenAI call under the model's rate limiter.
+
+    Args:
+        call: Factory returning a `with_raw_response` API coroutine
+        model: Model name, used to pick the limiter
+        est_tokens: Estimated tokens consumed by the request
+
+    Returns:
+        The parsed API response
+    """
+    limiter = get_limiter(model)
+    for attempt in range(MAX_ATTEMPTS):
+        await limiter.acquire(est_tokens)
+        try:
+            raw_response = await call()
+        except RETRYABLE_ERRORS as e:
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            delay = _retry_delay(e, attempt)
+            logger.warning("OpenAI call to %s failed (%s), retrying in %.1fs", model, type(e).__name__, delay)
+            await asyncio.sleep(delay)
+            continue
+
+        limiter.update_from_headers(raw_response.headers)
+        return raw_response.parse()
@@ -1,41 +1,56 @@
 """Feedback generation for story comprehension answers."""
-import json
-from openai import AsyncOpenAI
-from typing import List, Dict
-from app.config import settings
+import asyncio
+import hashlib
+import orjson
+from collections import OrderedDict
+from typing import List, Dict, Optional
+from app.openai_client._client import client
+from app.openai_client._inflight import coalesce
+from app.openai_client._limiter import guarded_call
 from app.utils.logger import logger
 
-client = AsyncOpenAI(api_key=settings.openai_api_key)
+FEEDBACK_MODEL = "gpt-5-mini"
 
+# Generated feedback keyed by a hash of the prompt (story, questions and answers)
+FEEDBACK_CACHE_SIZE = 256
+_feedback_cache: "OrderedDict[str, bytes]" = OrderedDict()
+_feedback_inflight: Dict[str, "asyncio.Future[bytes]"] = {}
 
-async def generate_feedback(questions: List[Dict], story_content: List[Dict]) -> Dict:
+SYSTEM_PROMPT = """You are a supportive reading assistant focused on enhancing children's reading comprehension. 
+        You will be given the full story, the question, the child's answer, 
+        and the correct answer. Use this information to compare the child's response with the correct answer and assess their understanding. 
+        Provide constructive and encouraging feedback that highlights key areas for improvement, 
+        helping the child connect with important details and themes in the story. Offer a rating to indicate their comprehension level, and keep the feedback positive and motivating to foster a love for reading."""
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+
+def _build_messages(
+    questions: List[Dict],
+    story_content: List[Dict],
+    whole_story: Optional[str] = None
+) -> List[Dict[str, str]]:
     """
-    Generate feedback for user answers.
+    Build the chat messages for a feedback request.
     
     Args:
         questions: List of questions with user answers
         story_content: List of story page content
+        whole_story: Pre-joined story text; built from story_content if omitted
         
     Returns:
-        Dictionary with feedback results
+        List of chat messages
     """
-    try:
-        # Combine story content
+    # Combine story content
+    if whole_story is None:
         whole_story = " ".join([page.get("pageText", "") for page in story_content])
-        
-        system_prompt = """You are a supportive reading assistant focused on enhancing children's reading comprehension. 
-        You will be given the full story, the question, the child's answer, 
-        and the correct answer. Use this information to compare the child's response with the correct answer and assess their understanding. 
-        Provide constructive and encouraging feedback that highlights key areas for improvement, 
-        helping the child connect with important details and themes in the story. Offer a rating to indicate their comprehension level, and keep the feedback positive and motivating to foster a love for reading."""
-        
-        # Build questions prompt
-        questions_prompt = "\n".join([
-            f"{i+1}. Question: \"{q.get('question', '')}\"\n   - Correct Answer: \"{q.get('answer', '')}\"\n   - User's Answer: \"{q.get('userAnswer', '')}\""
-            for i, q in enumerate(questions)
-        ])
-        
-        user_prompt = f"""Evaluate the user's responses to the following questions based on the provided story.
+    
+    # Build questions prompt
+    questions_prompt = "\n".join([
+        f"{i+1}. Question: \"{q.get('question', '')}\"\n   - Correct Answer: \"{q.get('answer', '')}\"\n   - User's Answer: \"{q.get('userAnswer', '')}\""
+        for i, q in enumerate(questions)
+    ])
+    
+    user_prompt = f"""Evaluate the user's responses to the following questions based on the provided story.
 
 Full Story:
 "{whole_story}"
@@ -64,32 +79,92 @@ For each question, provide:
 }}
 
 Generate feedback for all {len(questions)} questions. Remember to keep the feedback child-friendly and focused on helping them build reading comprehension skills."""
+    
+    return [
+        SYSTEM_MESSAGE,
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def _parse_feedback(data: str) -> Dict:
+    """
+    Parse the model's feedback JSON.
+    
+    Args:
+        data: Message content from the model (JSON mode)
         
-        response = await client.chat.completions.create(
-            model="gpt-5-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-        )
+    Returns:
+        Dictionary with feedback results
+    """
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError as e:
+        logger.error("JSON parse error: %s", data[:500])
+        raise Exception(f"Failed to parse feedback: {str(e)}")
+
+
+async def generate_feedback(
+    questions: List[Dict],
+    story_content: List[Dict],
+    whole_story: Optional[str] = None
+) -> Dict:
+    """
+    Generate feedback for user answers.
+    
+    Args:
+        questions: List of questions with user answers
+        story_content: List of story page content
+        whole_story: Pre-joined story text; built from story_content if omitted
         
-        data = response.choices[0].message.content
-        sanitized_data = data.strip().replace("\r\n", "").replace("\n", "")
+    Returns:
+        Dictionary with feedback results
+    """
+    try:
+        messages = _build_messages(questions, story_content, whole_story)
         
-        # Try to extract JSON from markdown
-        if "```json" in sanitized_data:
-            sanitized_data = sanitized_data.split("```json")[1].split("```")[0].strip()
-        elif "```" in sanitized_data:
-            sanitized_data = sanitized_data.split("```")[1].split("```")[0].strip()
+        cache_key = hashlib.blake2b(messages[-1]["content"].encode("utf-8"), digest_size=16).hexdigest()
+        cached = _feedback_cache.get(cache_key)
+        if cached is not None:
+            _feedback_cache.move_to_end(cache_key)
+            logger.info("Feedback cache hit")
+            return orjson.loads(cached)
         
-        try:
-            feedback = json.loads(sanitized_data)
-            return feedback
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parse error: {sanitized_data[:500]}")
-            raise Exception(f"Failed to parse feedback: {str(e)}")
+        # Identical concurrent submissions share one OpenAI call
+        return orjson.loads(await coalesce(
+            _feedback_inflight,
+            cache_key,
+            lambda: _request_feedback(cache_key, messages)
+        ))
             
     except Exception as e:
-        logger.error(f"Error generating feedback: {e}")
+        logger.error("Error generating feedback: %s", e)
         raise Exception(f"Failed to generate feedback: {str(e)}")
 
+
+async def _request_feedback(cache_key: str, messages: List[Dict[str, str]]) -> bytes:
+    """
+    Call OpenAI for feedback and cache the serialized result.
+    
+    Args:
+        cache_key: Feedback cache key for these messages
+        messages: Chat messages built by _build_messages
+        
+    Returns:
+        Feedback dictionary serialized with orjson
+    """
+    response = await guarded_call(
+        lambda: client.chat.completions.with_raw_response.create(
+            model=FEEDBACK_MODEL,
+            messages=messages,
+            response_format={"type": "json_object"}
+        ),
+        model=FEEDBACK_MODEL,
+        est_tokens=sum(len(m["content"]) for m in messages) // 4
+    )
+    
+    payload = orjson.dumps(_parse_feedback(response.choices[0].message.content))
+    
+    _feedback_cache[cache_key] = payload
+    if len(_feedback_cache) > FEEDBACK_CACHE_SIZE:
+        _feedback_cache.popitem(last=False)
+    return payload
@@ -1,30 +1,57 @@
 """Image generation using OpenAI DALL-E."""
-from openai import AsyncOpenAI
+import asyncio
+import base64
+import hashlib
+import logging
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field
 from app.config import settings
+from app.openai_client._client import client
+from app.openai_client._inflight import coalesce
+from app.openai_client._limiter import guarded_call
 from app.utils.logger import logger
+from app.utils.s3_client import s3_client
 
-client = AsyncOpenAI(api_key=settings.openai_api_key)
+# Rewritten DALL-E prompts keyed by page_key(page_text, child_age, story_title)
+PROMPT_CACHE_SIZE = 512
+_prompt_cache: "OrderedDict[str, str]" = OrderedDict()
+_prompt_inflight: Dict[str, "asyncio.Future[Optional[str]]"] = {}
 
+# S3 URLs of rendered illustrations, keyed like the prompt cache
+IMAGE_CACHE_SIZE = 512
+_image_cache: "OrderedDict[str, str]" = OrderedDict()
 
-async def generate_image(page_text: str, child_age: int = 5, story_title: str = "") -> str | None:
-    """
-    Generate image for story page using OpenAI DALL-E.
-    
-    Args:
-        page_text: Text content of the page
-        child_age: Age of the target child reader
-        story_title: Title of the story for character consistency
-        
-    Returns:
-        Image URL or None if generation fails
-    """
-    try:
-        # Create system prompt for image prompt generation
-        system_prompt = """You are an expert at creating detailed, accurate image prompts for children's book illustrations in the style of DISNEY, PIXAR, and DC Comics. You MUST maintain absolute character accuracy for established characters.
+# System prompt for image prompt generation; character rules are appended per page
+SYSTEM_PROMPT = """You are an expert at creating detailed, accurate image prompts for children's book illustrations in the style of DISNEY, PIXAR, and DC Comics. You MUST maintain absolute character accuracy for established characters.
+
+VISUAL STYLE REQUIREMENTS:
+- Modern digital illustration matching DISNEY/PIXAR/DC storybook quality
+- Rich, vibrant colors appropriate to the character
+- Proper lighting that enhances mood and character recognition
+- Clear composition with strong focal point
+- Detailed but not cluttered environments
+
+SCENE ACCURACY:
+- Show the EXACT ACTION described in the text
+- Character body language must match the emotional state
+- Include only props and details mentioned or implied in the text
+- Visual mood MUST match narrative mood
 
-ABSOLUTE CHARACTER ACCURACY - NON-NEGOTIABLE:
+SETTING CONSISTENCY:
+- Modern stories: Contemporary settings with accurate modern equipment
+- Fantasy stories: Consistent internal world-building
+- NO mixing of anachronistic elements
 
-BATMAN (DC Comics):
+STRICT PROHIBITIONS - NEVER DO THESE:
+- Putting modern characters in medieval armor or settings
+- Adding random decorative elements that don't match the character
+- Having characters smile inappropriately during tense scenes"""
+
+# Canonical appearance rules, included only for characters a page mentions
+CHARACTER_GUIDE = {
+    ("batman", "gotham", "joker"): """BATMAN (DC Comics):
 - ALL BLACK suit with subtle dark gray/charcoal accents - NO OTHER COLORS on the suit
 - Black cape that is dark and imposing
 - Black cowl/mask that covers entire head and face except jaw and mouth - pointed bat ears on top
@@ -34,32 +61,28 @@ BATMAN (DC Comics):
 - NO fantasy warrior aesthetic - Batman is a modern crime fighter in tactical suit
 - Strong, athletic build but human proportions
 - Serious, determined expression (when jaw is visible)
-- Gotham City: Dark, gothic modern city with Art Deco buildings, NOT fantasy or medieval
-
-SUPERMAN (DC Comics):
+- Gotham City: Dark, gothic modern city with Art Deco buildings, NOT fantasy or medieval""",
+    ("superman", "metropolis"): """SUPERMAN (DC Comics):
 - BLUE suit with RED cape
 - RED and YELLOW "S" symbol on chest
 - RED boots
 - Strong heroic build
 - Hopeful, confident expression
-- Metropolis: Bright, modern, futuristic city
-
-WONDER WOMAN (DC Comics):
+- Metropolis: Bright, modern, futuristic city""",
+    ("wonder woman",): """WONDER WOMAN (DC Comics):
 - RED and GOLD armor with BLUE skirt/shorts
 - Golden tiara with red star
 - Silver bracelets
 - Golden lasso
 - Strong warrior but compassionate expression
-- Greek-inspired armor details
-
-SPIDER-MAN (Marvel):
+- Greek-inspired armor details""",
+    ("spider-man", "spiderman"): """SPIDER-MAN (Marvel):
 - RED and BLUE suit with black web pattern
 - Large white eye pieces on mask
 - Spider symbol on chest
 - Agile, dynamic poses
-- New York City setting with skyscrapers
-
-FIREFIGHTER (Real profession):
+- New York City setting with skyscrapers""",
+    ("firefighter", "fireman", "fire engine", "fire truck"): """FIREFIGHTER (Real profession):
 - TAN or YELLOW turnout coat with REFLECTIVE YELLOW/SILVER STRIPES
 - Helmet: typically yellow, red, or white with front shield showing number/department
 - Heavy black boots with steel toes
@@ -67,63 +90,115 @@ FIREFIGHTER (Real profession):
 - SCBA (air tank) on back with straps
 - Gloves (usually black or tan)
 - Modern fire engine: RED with chrome details, ladder, hoses
-- Focused, professional demeanor during emergencies
-
-POLICE OFFICER (Real profession):
+- Focused, professional demeanor during emergencies""",
+    ("police", "officer", "sheriff"): """POLICE OFFICER (Real profession):
 - NAVY BLUE or BLACK uniform
 - Silver or gold badge prominently displayed on chest
 - Duty belt with radio, handcuffs, flashlight
 - Police cap or no hat
 - Black polished shoes
 - Modern police car: typically black and white, or dark blue
-- Professional, alert bearing
-
-DOCTOR/NURSE (Real profession):
+- Professional, alert bearing""",
+    ("doctor", "nurse", "hospital"): """DOCTOR/NURSE (Real profession):
 - Medical scrubs: solid colors (blue, green, burgundy) or patterns
 - White coat for doctors (optional)
 - Stethoscope around neck
 - ID badge clipped to scrubs
 - Comfortable medical shoes
-- Hospital setting with medical equipment, clean modern environment
+- Hospital setting with medical equipment, clean modern environment""",
+}
+
+
+def _system_message(page_text: str) -> Dict[str, str]:
+    """Build the system message with rules for the characters a page mentions."""
+    text_lower = page_text.lower()
+    relevant = [
+        guide for keywords, guide in CHARACTER_GUIDE.items()
+        if any(keyword in text_lower for keyword in keywords)
+    ]
+    if not relevant:
+        return {"role": "system", "content": SYSTEM_PROMPT}
+    return {
+        "role": "system",
+        "content": SYSTEM_PROMPT + "\n\nCHARACTER ACCURACY - NON-NEGOTIABLE:\n\n" + "\n\n".join(relevant)
+    }
+
+
+class ImagePromptSchema(BaseModel):
+    """Structured description of a page illustration."""
+    character: str = Field(description="Character appearance, expression and body language (max 400 characters)")
+    action: str = Field(description="The specific action happening in this moment (max 400 characters)")
+    setting: str = Field(description="Where and when the scene takes place (max 400 characters)")
+    props: str = Field(description="Story-relevant objects and equipment (max 400 characters)")
+    lighting: str = Field(description="Lighting and atmosphere matching the mood (max 400 characters)")
+    composition: str = Field(description="Camera angle, focal point and depth (max 400 characters)")
+    palette: str = Field(description="Color palette matching canonical appearances and mood (max 400 characters)")
+
+
+IMAGE_PROMPT_TEMPLATE = (
+    "Professional children's book illustration in DISNEY/PIXAR/DC storybook style: "
+    "{character}. {action}. Setting: {setting}. Props: {props}. Lighting: {lighting}. "
+    "Composition: {composition}. Color palette: {palette}. High quality children's book "
+    "illustration, rich colors, detailed but clear, emotionally expressive, accurate character design."
+)
+
+# Short pages without established characters skip the rewrite step and use this template
+FAST_PATH_MAX_CHARS = 200
+CHARACTER_KEYWORDS = tuple(keyword for keywords in CHARACTER_GUIDE for keyword in keywords)
+FAST_PROMPT_TEMPLATE = (
+    "Professional children's book illustration in DISNEY/PIXAR/DC storybook style for the story "
+    "\"{story_title}\", for a {child_age}-year-old reader, showing this scene: {page_text} "
+    "High quality children's book illustration, rich colors, detailed but clear, emotionally "
+    "expressive, mood-appropriate lighting, composition focused on the main action."
+)
+
+
+def _needs_rewrite(page_text: str) -> bool:
+    """Whether a page is long or mentions characters that need the accuracy rules."""
+    if len(page_text) >= FAST_PATH_MAX_CHARS:
+        return True
+    text_lower = page_text.lower()
+    return any(keyword in text_lower for keyword in CHARACTER_KEYWORDS)
+
+
+def page_key(page_text: str, child_age: int, story_title: str) -> str:
+    """Return a compact hash identifying the illustration inputs for a page."""
+    return hashlib.blake2b(
+        f"{story_title}\x00{child_age}\x00{page_text}".encode("utf-8"),
+        digest_size=16
+    ).hexdigest()
 
-VISUAL STYLE REQUIREMENTS:
-- Modern digital illustration matching DISNEY/PIXAR/DC storybook quality
-- Rich, vibrant colors appropriate to the character
-- Proper lighting that enhances mood and character recognition
-- Professional children's book illustration quality
-- Clear composition with strong focal point
-- Detailed but not cluttered environments
-
-SCENE ACCURACY:
-- Show the EXACT ACTION described in the text
-- Character body language must match the emotional state
-- Include only props and details mentioned or implied in the text
-- Proper perspective and depth
-- Visual mood MUST match narrative mood
 
-SETTING CONSISTENCY:
-- Modern superhero stories: Contemporary city with modern architecture
-- Professional stories: Accurate modern equipment and settings
-- Fantasy stories: Consistent internal world-building
-- NO mixing of anachronistic elements
-
-STRICT PROHIBITIONS - NEVER DO THESE:
-- Changing Batman's black suit to blue, gold, purple, or any other color
-- Adding golden bird emblems or fantasy elements to Batman
-- Removing superhero masks or cowls
-- Putting modern characters in medieval armor or settings
-- Making Batman look like a fantasy warrior or knight
-- Adding random decorative elements that don't match the character
-- Changing professional uniforms to incorrect colors or styles
-- Having characters smile inappropriately during tense scenes
-- Mixing modern and historical elements incorrectly
-
-QUALITY STANDARDS:
-- Illustration should look like it came from an official DISNEY/PIXAR/DC storybook
-- Character should be instantly recognizable
-- Setting should support the story without overwhelming it
-- Colors should be rich but appropriate to the character's palette
-- Composition should guide the eye to the main action"""
+async def generate_image(page_text: str, child_age: int = 5, story_title: str = "") -> str | None:
+    """
+    Generate image for story page using OpenAI DALL-E and store it in S3.
+    
+    Args:
+        page_text: Text content of the page
+        child_age: Age of the target child reader
+        story_title: Title of the story for character consistency
+        
+    Returns:
+        S3 image URL or None if generation fails
+    """
+    try:
+        cache_key = page_key(page_text, child_age, story_title)
+        image_url = _image_cache.get(cache_key)
+        if image_url is not None:
+            _image_cache.move_to_end(cache_key)
+            return image_url
+        
+        final_prompt = _prompt_cache.get(cache_key)
+        if final_prompt is not None:
+            _prompt_cache.move_to_end(cache_key)
+            return await _render_image(cache_key, final_prompt)
+        
+        if not _needs_rewrite(page_text):
+            return await _render_image(cache_key, FAST_PROMPT_TEMPLATE.format(
+                story_title=story_title,
+                child_age=child_age,
+                page_text=page_text.strip()
+            ))
         
         # Create user prompt to extract visual elements
         user_prompt = f"""Create a DALL-E prompt for a children's book illustration based on this story page.
@@ -156,49 +231,44 @@ Step 4 - MOOD ASSESSMENT:
 - Should the lighting be dramatic, soft, bright?
 - What colors support this mood?
 
-CREATE YOUR DALL-E PROMPT (250-350 words):
-
-MANDATORY STRUCTURE:
-"Professional children's book illustration in DISNEY/PIXAR/DC storybook style: 
+DESCRIBE THE ILLUSTRATION FIELD BY FIELD (each field at most 400 characters):
 
-[CHARACTER DESCRIPTION - Be SPECIFIC and ACCURATE]:
+character - Be SPECIFIC and ACCURATE:
 - If Batman: "Batman in his iconic ALL BLACK suit with black cape and black cowl mask covering his face (pointed bat ears visible), large black bat symbol on chest, yellow utility belt"
 - If firefighter: "Firefighter in tan/yellow turnout coat with reflective stripes, helmet, black boots, SCBA air tank on back"
 - If original character: Detailed description with consistent traits
 - Current expression and body language matching the emotion
 
-[ACTION - What's happening NOW]:
+action - What's happening NOW:
 - Specific physical action being performed
 - How the character is positioned
 - What they're interacting with
 
-[SETTING - Accurate and detailed]:
+setting - Accurate and detailed:
 - If Gotham: "Dark gothic modern city with Art Deco buildings, nighttime with city lights"
 - If hospital: "Modern hospital with medical equipment, clean bright environment"
 - Specific environmental details that support the story
 
-[PROPS AND DETAILS]:
+props:
 - Only items that make sense for this character and scene
 - Accurate equipment for professionals
 - Story-relevant objects
 
-[LIGHTING AND ATMOSPHERE]:
+lighting:
 - Time of day lighting that matches the scene
 - Mood-appropriate lighting (dramatic for action, soft for gentle moments)
 - Color temperature that enhances the story
 
-[COMPOSITION]:
+composition:
 - Camera angle that best shows the action
 - Focal point on the main character/action
 - Depth with foreground, midground, background
 
-[COLOR PALETTE]:
+palette:
 - Colors that match the character's canonical appearance
 - Supporting environmental colors
 - Overall mood through color choices
 
-High quality children's book illustration, rich colors, detailed but clear, emotionally expressive, accurate character design."
-
 VERIFICATION BEFORE FINALIZING:
 ✓ If Batman: Is he in ALL BLACK? (Not blue, not gold?)
 ✓ If Batman: Does he have the BLACK bat symbol? (Not a golden bird?)
@@ -216,43 +286,147 @@ CRITICAL REMINDERS:
 - Professional uniforms must be accurate to real-world standards
 - NO random costume changes or fantasy elements on modern characters
 
-Create your detailed prompt now, ensuring absolute accuracy for any established characters."""
+Fill in every field now, ensuring absolute accuracy for any established characters."""
+        
+        # Identical concurrent pages share one rewrite call
+        final_prompt = await coalesce(
+            _prompt_inflight,
+            cache_key,
+            lambda: _rewrite_prompt(cache_key, _system_message(page_text), user_prompt)
+        )
+        if final_prompt is None:
+            return None
+        
+        return await _render_image(cache_key, final_prompt)
+            
+    except Exception as e:
+        logger.error("Error generating image: %s", e)
+        return None
+
+
+async def _rewrite_prompt(
+    cache_key: str,
+    system_message: Dict[str, str],
+    user_prompt: str
+) -> Optional[str]:
+    """
+    Turn a page into a DALL-E prompt via a structured gpt-4o-mini description.
+    
+    Args:
+        cache_key: Prompt cache key for the page
+        system_message: System message with the relevant character rules
+        user_prompt: Page analysis prompt
         
-        # Get image prompt from GPT with stricter settings
-        chat_response = await client.chat.completions.create(
+    Returns:
+        DALL-E prompt, or None if the model refused
+    """
+    # Get structured image description from GPT with stricter settings
+    chat_response = await guarded_call(
+        lambda: client.chat.completions.with_raw_response.parse(
             model="gpt-4o-mini",
             messages=[
-                {"role": "system", "content": system_prompt},
+                system_message,
                 {"role": "user", "content": user_prompt}
             ],
+            response_format=ImagePromptSchema,
             temperature=0.3
-        )
-        
-        final_prompt = chat_response.choices[0].message.content.strip()
+        ),
+        model="gpt-4o-mini",
+        est_tokens=(len(system_message["content"]) + len(user_prompt)) // 4
+    )
+    
+    description = chat_response.choices[0].message.parsed
+    if description is None:
+        logger.error("Image prompt request refused: %s", chat_response.choices[0].message.refusal)
+        return None
+    final_prompt = IMAGE_PROMPT_TEMPLATE.format(**{
+        field: value.strip().rstrip(".") for field, value in description.model_dump().items()
+    })
+    _prompt_cache[cache_key] = final_prompt
+    if len(_prompt_cache) > PROMPT_CACHE_SIZE:
+        _prompt_cache.popitem(last=False)
+    return final_prompt
+
+
+async def _render_image(cache_key: str, final_prompt: str) -> str | None:
+    """
+    Render a rewritten prompt with DALL-E 3 and upload the result to S3.
+    
+    Args:
+        cache_key: Image cache key for the page
+        final_prompt: Image prompt produced by the rewrite step
         
+    Returns:
+        S3 image URL or None if generation fails
+    """
+    try:
         # Add strong enforcement suffix for DALL-E 3
         enhanced_prompt = f"{final_prompt} CRITICAL: Maintain exact character accuracy - Batman in ALL BLACK suit with BLACK bat symbol, firefighters in proper turnout gear, all established characters in their canonical appearance. High quality DISNEY/PIXAR/DC children's book illustration, professional digital art, detailed and expressive, accurate character design, appropriate setting."
         
-        logger.info(f"Generated image prompt: {enhanced_prompt[:400]}...")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Generated image prompt: %s...", enhanced_prompt[:400])
         
         # Generate image with landscape orientation for better composition
-        image_response = await client.images.generate(
-            model="dall-e-3",
-            prompt=enhanced_prompt,
-            n=1,
-            size="1792x1024",
-            quality="standard",
-            style="vivid"
+        image_response = await guarded_call(
+            lambda: client.images.with_raw_response.generate(
+                model="dall-e-3",
+                prompt=enhanced_prompt,
+                n=1,
+                size="1792x1024",
+                quality="standard",
+                style="vivid",
+                response_format="b64_json"
+            ),
+            model="dall-e-3"
         )
         
-        if image_response.data and len(image_response.data) > 0:
-            image_url = image_response.data[0].url
-            logger.info("Image generated successfully")
-            return image_url
-        else:
-            logger.error("No image URL returned in response")
+        if not image_response.data or not image_response.data[0].b64_json:
+            logger.error("No image data returned in response")
             return None
+        
+        # OpenAI image URLs expire, so persist the bytes to S3 before handing
+        # out the URL; other pages keep generating while this one uploads
+        image_bytes = base64.b64decode(image_response.data[0].b64_json)
+        image_url = await s3_client.upload_image(image_bytes, f"{uuid.uuid4()}.png")
+        logger.info("Image generated successfully")
+        
+        _image_cache[cache_key] = image_url
+        if len(_image_cache) > IMAGE_CACHE_SIZE:
+            _image_cache.popitem(last=False)
+        return image_url
             
     except Exception as e:
-        logger.error(f"Error generating image: {e}")
-        return None
\ No newline at end of file
+        logger.error("Error generating image: %s", e)
+        return None
+
+
+async def generate_images_for_pages(
+    pages: List[str],
+    child_age: int = 5,
+    story_title: str = "",
+    concurrency: Optional[int] = None
+) -> List[str | None]:
+    """
+    Generate images for several pages concurrently.
+    
+    Args:
+        pages: Page texts to illustrate
+        child_age: Age of the target child reader
+        story_title: Title of the story for character consistency
+        concurrency: Maximum number of images generated at once
+        
+    Returns:
+        Image URLs in page order (None where generation failed)
+    """
+    semaphore = asyncio.Semaphore(concurrency or settings.image_generation_concurrency)
+    
+    async def _generate(page_text: str) -> str | None:
+        async with semaphore:
+            return await generate_image(
+                page_text=page_text,
+                child_age=child_age,
+                story_title=story_title
+            )
+    
+    results = await asyncio.gather(*[_generate(page) for page in pages], return_exceptions=True)
+    return [None if isinstance(url, Exception) else url for url in results]
\ No newline at end of file
@@ -1,70 +1,202 @@
 """Question generation for story comprehension."""
-import json
-from openai import AsyncOpenAI
-from typing import List, Dict
-from app.config import settings
+import argparse
+import asyncio
+import hashlib
+import orjson
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple, Union
+from app.openai_client._batch import run_chat_batch
+from app.openai_client._client import client
+from app.openai_client._inflight import coalesce
+from app.openai_client._limiter import guarded_call
 from app.utils.logger import logger
 
-client = AsyncOpenAI(api_key=settings.openai_api_key)
+QUESTIONS_MODEL = "gpt-5-mini"
 
+SYSTEM_PROMPT = """You are a helpful and creative assistant designed to generate engaging and age-appropriate questions for children. Your questions should be fun, imaginative, and suitable for the given story, ensuring they are both entertaining and educational."""
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
 
-async def generate_questions(story_content: List[Dict], story_title: str) -> Dict:
+# Generated questions keyed by a hash of the story title and text
+QUESTIONS_CACHE_SIZE = 256
+_questions_cache: "OrderedDict[str, bytes]" = OrderedDict()
+_questions_inflight: Dict[str, "asyncio.Future[bytes]"] = {}
+
+
+def _build_user_prompt(story_title: str, whole_story: str) -> str:
+    """Build the question generation prompt for a story."""
+    return f"""Generate questions and answers for the story "{story_title}" with the story content: \n\n{whole_story}.
+        The output should be strictly in JSON format with the following structure:
+        {{
+          "questions": [
+            {{
+              "question": "The question you want to ask",
+              "answer": "The correct answer which you think is right",
+              "userAnswer": ""
+            }}
+          ]
+        }}
+        Generate exactly 5 questions. Ensure that the JSON is valid, properly formatted, and contains no additional commentary or explanations."""
+
+
+async def generate_questions(
+    story_content: List[Dict],
+    story_title: str,
+    whole_story: Optional[str] = None
+) -> Dict:
     """
     Generate comprehension questions for a story.
     
     Args:
         story_content: List of page content dictionaries
         story_title: Title of the story
+        whole_story: Pre-joined story text; built from story_content if omitted
         
     Returns:
         Dictionary with questions list
     """
     try:
         # Combine all story content
-        whole_story = " ".join([page.get("pageText", "") for page in story_content])
+        if whole_story is None:
+            whole_story = " ".join([page.get("pageText", "") for page in story_content])
         
-        system_prompt = """You are a helpful and creative assistant designed to generate engaging and age-appropriate questions for children. Your questions should be fun, imaginative, and suitable for the given story, ensuring they are both entertaining and educational."""
+        cache_key = hashlib.blake2b(
+            f"{story_title}\x00{whole_story}".encode("utf-8"),
+            digest_size=16
+        ).hexdigest()
+        cached = _questions_cache.get(cache_key)
+        if cached is not None:
+            _questions_cache.move_to_end(cache_key)
+            logger.info("Questions cache hit")
+            return orjson.loads(cached)
         
-        user_prompt = f"""Generate questions and answers for the story "{story_title}" with the story content: \n\n{whole_story}.
-        The output should be strictly in JSON format with the following structure:
-        {{
-          "questions": [
-            {{
-              "question": "The question you want to ask",
-              "answer": "The correct answer which you think is right",
-              "userAnswer": ""
-            }}
-          ]
-        }}
-        Generate exactly 5 questions. Ensure that the JSON is valid, properly formatted, and contains no additional commentary or explanations."""
+        user_prompt = _build_user_prompt(story_title, whole_story)
+        
+        # Identical concurrent requests share one OpenAI call
+        payload = await coalesce(
+            _questions_inflight,
+            cache_key,
+            lambda: _request_questions(cache_key, user_prompt)
+        )
+        return orjson.loads(payload)
+            
+    except Exception as e:
+        logger.error("Error generating questions: %s", e)
+        raise Exception(f"Failed to generate questions: {str(e)}")
+
+
+async def _request_questions(cache_key: str, user_prompt: str) -> bytes:
+    """
+    Call OpenAI for questions and cache the serialized result.
+    
+    Args:
+        cache_key: Questions cache key for this story
+        user_prompt: Question generation prompt
         
-        response = await client.chat.completions.create(
-            model="gpt-5-mini",
+    Returns:
+        Questions dictionary serialized with orjson
+    """
+    response = await guarded_call(
+        lambda: client.chat.completions.with_raw_response.create(
+            model=QUESTIONS_MODEL,
             messages=[
-                {"role": "system", "content": system_prompt},
+                SYSTEM_MESSAGE,
                 {"role": "user", "content": user_prompt}
-            ]
-        )
+            ],
+            response_format={"type": "json_object"}
+        ),
+        model=QUESTIONS_MODEL,
+        est_tokens=(len(SYSTEM_PROMPT) + len(user_prompt)) // 4
+    )
+    
+    questions_text = response.choices[0].message.content
+    
+    # JSON mode guarantees a valid object, so no sanitizing is needed
+    try:
+        payload = orjson.dumps(orjson.loads(questions_text))
+    except orjson.JSONDecodeError as e:
+        logger.error("JSON parse error: %s", questions_text[:500])
+        raise Exception(f"Failed to parse questions: {str(e)}")
+    
+    _questions_cache[cache_key] = payload
+    if len(_questions_cache) > QUESTIONS_CACHE_SIZE:
+        _questions_cache.popitem(last=False)
+    return payload
+
+
+async def generate_questions_batch(
+    stories: List[Tuple[str, str, str]]
+) -> Dict[str, Union[Dict, Exception]]:
+    """
+    Generate questions for many stories through the OpenAI Batch API.
+    
+    Meant for bulk backfills (e.g. after a prompt change); use
+    `generate_questions` for live requests.
+    
+    Args:
+        stories: List of (story_id, story_title, whole_story) tuples
         
-        questions_text = response.choices[0].message.content
+    Returns:
+        Questions dictionary per story_id; failed stories hold an Exception
+    """
+    try:
+        contents = await run_chat_batch(
+            [
+                (story_id, {
+                    "model": QUESTIONS_MODEL,
+                    "messages": [
+                        SYSTEM_MESSAGE,
+                        {"role": "user", "content": _build_user_prompt(story_title, whole_story)}
+                    ],
+                    "response_format": {"type": "json_object"}
+                })
+                for story_id, story_title, whole_story in stories
+            ],
+            name="questions_batch"
+        )
         
-        # Sanitize and parse
-        sanitized_text = questions_text.strip().replace("\r\n", "").replace("\n", "")
+        results: Dict[str, Union[Dict, Exception]] = {}
+        for story_id, content in contents.items():
+            if isinstance(content, Exception):
+                results[story_id] = content
+                continue
+            try:
+                results[story_id] = orjson.loads(content)
+            except orjson.JSONDecodeError as e:
+                results[story_id] = Exception(f"Failed to parse questions: {str(e)}")
         
-        # Try to extract JSON from markdown code blocks
-        if "```json" in sanitized_text:
-            sanitized_text = sanitized_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in sanitized_text:
-            sanitized_text = sanitized_text.split("```")[1].split("```")[0].strip()
+        return results
         
-        try:
-            questions = json.loads(sanitized_text)
-            return questions
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parse error: {sanitized_text[:500]}")
-            raise Exception(f"Failed to parse questions: {str(e)}")
-            
     except Exception as e:
-        logger.error(f"Error generating questions: {e}")
-        raise Exception(f"Failed to generate questions: {str(e)}")
+        logger.error("Error generating questions batch: %s", e)
+        raise Exception(f"Failed to generate questions batch: {str(e)}")
+
+
+async def _run_batch_file(input_path: str, output_path: str) -> None:
+    """Generate questions for a JSONL file of stories and write JSONL results."""
+    stories = []
+    with open(input_path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = orjson.loads(line)
+            whole_story = record.get("whole_story")
+            if whole_story is None:
+                whole_story = " ".join([page.get("pageText", "") for page in record.get("story_content", [])])
+            stories.append((str(record["story_id"]), record["story_title"], whole_story))
+    
+    results = await generate_questions_batch(stories)
+    
+    with open(output_path, "wb") as f:
+        for story_id, result in results.items():
+            if isinstance(result, Exception):
+                f.write(orjson.dumps({"story_id": story_id, "error": str(result)}) + b"\n")
+            else:
+                f.write(orjson.dumps({"story_id": story_id, **result}) + b"\n")
+
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate story questions with the OpenAI Batch API")
+    parser.add_argument("--input", required=True, help="JSONL with story_id, story_title and story_content or whole_story")
+    parser.add_argument("--output", required=True, help="JSONL file to write questions to")
+    args = parser.parse_args()
+    asyncio.run(_run_batch_file(args.input, args.output))
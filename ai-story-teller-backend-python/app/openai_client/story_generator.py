@@ -1,69 +1,92 @@
 """Story generation with RAG enhancement."""
-import json
-from openai import AsyncOpenAI
-from typing import Dict, List, Optional
+import asyncio
+import hashlib
+import time
+import numpy as np
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from app.config import settings
+from app.openai_client._client import client
+from app.openai_client._limiter import guarded_call
 from app.services.rag_service import rag_service
+from app.services.semantic_cache import story_cache, story_type_cache
+from app.utils.incremental_json import IncrementalJSONParser
 from app.utils.logger import logger
+from app.utils.tokens import truncate_tokens
 from langchain_core.documents import Document
+from pydantic import BaseModel, ConfigDict, Field
 
 
-client = AsyncOpenAI(api_key=settings.openai_api_key)
+STORY_MODEL = "gpt-4o-mini"
 
+# Seconds to wait for the response (and for each streamed chunk) before failing
+STORY_REQUEST_TIMEOUT = 30.0
 
-async def generate_story(
-    story_description: str,
-    story_title: str,
-    max_pages: int,
-    child_age: int,
-    user_id: str,
-    use_books_context: bool = False,
-    use_history_context: bool = False
-) -> Dict:
-    """
-    Generate story using OpenAI with optional RAG enhancement.
+# Seconds a cache miss waits for the story type classifier before generating
+# with guidance for every type
+STORY_TYPE_TIMEOUT = 1.0
+
+# Caps in-flight story streams so bursts queue here instead of piling onto OpenAI
+_generation_slots = asyncio.Semaphore(settings.story_generation_concurrency)
+
+# Routes story requests to the same prompt cache bucket; each system prompt
+# variant gets its own bucket since they share no prefix
+PROMPT_CACHE_KEY = "storygen-v1-compressed" if settings.storygen_compressed else "storygen-v1"
+
+# Library context budget, appended after the static system prompt
+LIBRARY_EXCERPT_TOKENS = 150
+LIBRARY_CONTEXT_MAX_TOKENS = 450
+
+# Formatted library context keyed by (user_id, retrieved docs hash), so a child's
+# repeated requests skip re-tokenizing the same excerpts
+LIBRARY_CONTEXT_CACHE_SIZE = 1024
+LIBRARY_CONTEXT_TTL = 300
+_library_context_cache: "OrderedDict[Tuple[str, str], Tuple[float, str]]" = OrderedDict()
+
+# Output budget: ~225 words (~310 tokens) per page plus headroom for the JSON wrapper
+COMPLETION_TOKENS_PER_PAGE = 400
+COMPLETION_TOKENS_OVERHEAD = 200
+
+
+class StoryPage(BaseModel):
+    """A single generated page."""
+    model_config = ConfigDict(extra="forbid")
     
-    Args:
-        story_description: Description of the story
-        story_title: Title of the story
-        max_pages: Maximum number of pages
-        child_age: Child's age for age-appropriate content
-        user_id: User ID for retrieving personal library content
-        use_books_context: Whether to use uploaded books for context
-        use_history_context: Whether to use reading history for context
-        
-    Returns:
-        Generated story dictionary
-    """
-    try:
-        # Retrieve from user's personal library using RAG
-        library_context = ""
-        
-        if use_books_context or use_history_context:
-            try:
-                # Retrieve from user's books and stories
-                query = f"{story_title} {story_description}"
-                library_docs = await rag_service.retrieve_from_user_library(
-                    query=query,
-                    user_id=user_id,
-                    child_age=child_age,
-                    top_k=3,
-                    include_books=use_books_context,
-                    include_stories=use_history_context
-                )
-                
-                if library_docs:
-                    library_context = "\n\n".join([
-                        f"From your reading history {i+1}:\n{doc.page_content[:400]}..."
-                        for i, doc in enumerate(library_docs)
-                    ])
-                    logger.info(f"Retrieved {len(library_docs)} documents from user library")
-                    
-            except Exception as e:
-                logger.warning(f"RAG retrieval failed, continuing without retrieval: {e}")
-        
-        # Build enhanced system prompt
-        system_prompt = """You are a masterful storytelling companion who creates engaging, emotionally authentic stories for children of {child_age} in the spirit of DISNEY, PIXAR, and DC storytelling. Your stories balance wonder with lots realism, a bit magic with genuine emotion, and adventure with heart.
+    pageText: str
+
+
+class StoryOut(BaseModel):
+    """Structured output schema for generated stories."""
+    model_config = ConfigDict(extra="forbid")
+    
+    storyTitle: str
+    storyDescription: str = Field(
+        description="A compelling 1-2 sentence summary that conveys the story's true nature and emotional journey"
+    )
+    storyContent: List[StoryPage]
+
+
+# Strict JSON schema sent as the response format. Passed as a plain dict to
+# `create` rather than a model to `.stream()`, which re-parses the whole
+# accumulated snapshot on every chunk.
+STORY_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "story",
+        "strict": True,
+        "schema": StoryOut.model_json_schema()
+    }
+}
+
+
+def _parse_story(content: str) -> Dict:
+    """Validate the completed story JSON (CPU-bound, run off the event loop)."""
+    return StoryOut.model_validate_json(content).model_dump()
+
+# The system prompt is fully static so OpenAI can cache it as a shared prefix;
+# per-request values (child age, title, ...) only appear in the user prompt.
+_SYSTEM_PROMPT = """You are a masterful storytelling companion who creates engaging, emotionally authentic stories for children in the spirit of DISNEY, PIXAR, and DC storytelling. Your stories balance wonder with lots realism, a bit magic with genuine emotion, and adventure with heart.
 
 CORE PRINCIPLE: Scale your story to match its scope. Not every story needs a world-saving climax. A story about watching a sunset can be gentle and contemplative. A story about a superhero facing danger should have real tension and stakes. Match the emotional intensity to the subject matter.
 
@@ -166,34 +189,47 @@ AVOID THESE PITFALLS:
 - Inaccurate depiction of established characters or professional roles
 - Anachronistic or illogical setting elements
 - Removing superhero masks or changing their canonical costumes"""
-        
-        if library_context:
-            system_prompt += f"\n\nREADING HISTORY CONTEXT:\nThis child has enjoyed these books:\n{library_context}\n\nUse this to understand their interests and reading level, but create something completely new and original. Capture the emotional resonance and themes they enjoyed, not specific plots or characters."
-        
-        # Build user prompt
-        user_prompt = f"""Create an engaging, emotionally authentic story for a {child_age}-year-old child.
 
-STORY DETAILS:
-- Title: "{story_title}"
-- Concept: "{story_description}"
-- Total Pages: {max_pages}
+# Condensed rewrite of _SYSTEM_PROMPT (about a third of its length). Enabled with
+# settings.storygen_compressed; the full prompt is kept for rollback.
+_SYSTEM_PROMPT_COMPRESSED = """You write emotionally authentic children's stories in the spirit of DISNEY, PIXAR and DC: wonder with realism, magic with genuine emotion, adventure with heart.
 
-STEP 1 - ANALYZE THE STORY TYPE:
-First, determine what kind of story this is:
-- ACTION/EMERGENCY: Involves danger, rescues, superhero conflicts, urgent situations (think The Dark Knight, Batman Begins)
-- ADVENTURE: Involves exploration, quests, overcoming obstacles, discovery (think Moana, Finding Nemo)
-- GENTLE/CONTEMPLATIVE: Focuses on beauty, quiet moments, observation, peace (think quiet moments in Up)
-- FRIENDSHIP/RELATIONSHIP: Centers on connections, understanding, emotional bonds (think Toy Story, Inside Out)
-- SLICE-OF-LIFE: Everyday moments, small joys, routine experiences with meaning
+SCALE: Match intensity to the subject. Gentle stories stay calm and contemplative; action stories have real tension and stakes. Never force world-saving drama or conflict into a quiet story.
 
-STEP 2 - ASSESS CHARACTER TYPE:
-- Is this an established character (Batman, Superman, firefighter, doctor)? If yes, maintain accurate appearance and behavior
-- Is this an original character? If yes, develop them with consistent traits
-- What setting does this character belong in? (Gotham City, Metropolis, modern city, fantasy world, real neighborhood, etc.)
+EMOTION: Characters feel what the situation warrants (worry, fear, determination, relief, wonder, contentment). Brave can also be nervous. Show urgency in danger, warmth in calm. Happy endings are earned through effort and growth. No toxic positivity.
 
-STEP 3 - APPLY APPROPRIATE AUTHENTICITY:
+CRAFT: Vivid sensory language; show, don't tell. Clear cause and effect. Obstacles fit the type: danger for superheroes, interpersonal for friendship, internal for contemplative. Natural read-aloud rhythm.
+
+STRUCTURE:
+- Action/adventure: normal world (15-20%), problem with clear stakes (15-20%), clever courageous attempts with setbacks (30-40%), uncertain climax (15-20%), earned resolution and warm reflection (10-15%).
+- Gentle/contemplative: sensory scene-setting (20-25%), small events, feelings and discoveries (50-60%), realization or peaceful satisfaction (15-20%).
+- Friendship: characters and bond (20%), misunderstanding or challenge (20-25%), navigating emotions (30-40%), resolution through empathy and communication (15-20%).
+
+AGE: Vocabulary fits the age while respecting the reader's intelligence. No graphic violence or terror, but real urgency when danger is present. Give characters agency and visible thought.
+
+CHARACTER ACCURACY (never alter canonical looks):
+- Batman: dark armored suit, cape, cowl always covering his face, bat symbol, serious detective, modern Gotham, no killing.
+- Superman: blue suit, red cape, "S" shield, hopeful, Metropolis, strength and flight.
+- Wonder Woman: warrior armor, tiara, lasso of truth, compassionate warrior.
+- Spider-Man: red and blue web suit, full mask, agile and quippy, New York.
+- Firefighters: turnout gear, helmet, air tank, modern trucks. Police: uniform, badge, duty belt. Doctors/nurses: scrubs or white coat, stethoscope, modern hospital.
+
+SETTING: Modern stories use contemporary settings. Gotham is dark gothic modern noir; Metropolis is bright and optimistic. Keep fantasy and historical worlds internally consistent; no anachronisms.
+
+AVOID: smiling through emergencies; calm victims in crises; problems that solve themselves; saccharine "everything is wonderful" tone; illogical events; wrong costumes or unmasked heroes."""
 
-For ACTION/EMERGENCY stories:
+# Story types the classifier can pick. Each maps to the only authenticity and
+# pacing guidance sent for it; adventure follows the action structure and
+# slice-of-life the gentle one, as in the system prompt.
+STORY_TYPES = {
+    "action": "ACTION/EMERGENCY: Involves danger, rescues, superhero conflicts, urgent situations (think The Dark Knight, Batman Begins)",
+    "adventure": "ADVENTURE: Involves exploration, quests, overcoming obstacles, discovery (think Moana, Finding Nemo)",
+    "gentle": "GENTLE/CONTEMPLATIVE: Focuses on beauty, quiet moments, observation, peace (think quiet moments in Up)",
+    "friendship": "FRIENDSHIP/RELATIONSHIP: Centers on connections, understanding, emotional bonds (think Toy Story, Inside Out)",
+    "slice_of_life": "SLICE-OF-LIFE: Everyday moments, small joys, routine experiences with meaning"
+}
+
+_ACTION_AUTHENTICITY = """For ACTION/EMERGENCY stories:
 - Show appropriate urgency and concern
 - Characters have realistic reactions: worried expressions, focused movements, determined action
 - If someone is in danger, the hero should be CONCERNED and PURPOSEFUL, not casually cheerful
@@ -201,22 +237,87 @@ For ACTION/EMERGENCY stories:
 - Explain WHY the emergency happened and HOW it's being addressed
 - People in danger act frightened or distressed, not calm and sleepy
 - Relief and gratitude come AFTER safety is achieved
-- For superhero stories: Show the weight of responsibility, the focus during action, the determination to protect
+- For superhero stories: Show the weight of responsibility, the focus during action, the determination to protect"""
 
-For GENTLE/CONTEMPLATIVE stories:
+_GENTLE_AUTHENTICITY = """For GENTLE/CONTEMPLATIVE stories:
 - Focus on sensory details and small observations
 - Allow characters to feel wonder, contentment, or peaceful reflection
 - Don't force unnecessary conflict or drama
 - Let the story breathe and flow naturally
 - Moments of beauty or realization are earned through attention and presence
-- Emotional warmth comes from connection and appreciation
+- Emotional warmth comes from connection and appreciation"""
 
-For FRIENDSHIP/RELATIONSHIP stories:
+_FRIENDSHIP_AUTHENTICITY = """For FRIENDSHIP/RELATIONSHIP stories:
 - Conflicts are interpersonal, not life-threatening
 - Show characters learning about each other
 - Emotional challenges are internal or relational
 - Resolution comes through communication and empathy
-- Stakes are about connection and understanding
+- Stakes are about connection and understanding"""
+
+_ACTION_PACING = """For ACTION/EMERGENCY stories:
+- FIRST 15-20% of story: Establish character and their normal world
+- NEXT 15-20% of story: Challenge or emergency arrives (show real stakes clearly)
+- MIDDLE 30-40% of story: Active problem-solving with realistic obstacles and setbacks
+- NEXT 15-20% of story: Climax - most challenging moment, outcome uncertain
+- FINAL 10-15% of story: Earned resolution and meaningful reflection on what was learned"""
+
+_GENTLE_PACING = """For GENTLE/CONTEMPLATIVE stories:
+- FIRST 20-25% of story: Establish setting, mood, and character
+- MIDDLE 50-60% of story: Flow through moments of observation, discovery, or connection
+- FINAL 15-20% of story: Build to a moment of realization or peaceful satisfaction, gentle conclusion with warmth"""
+
+_FRIENDSHIP_PACING = """For FRIENDSHIP/RELATIONSHIP stories:
+- FIRST 20% of story: Establish characters and their relationship
+- NEXT 20-25% of story: Introduce interpersonal challenge or misunderstanding
+- MIDDLE 30-40% of story: Characters navigate emotions and learn
+- FINAL 15-20% of story: Resolution through understanding, strengthened bonds"""
+
+_AUTHENTICITY_BY_TYPE = {
+    "action": _ACTION_AUTHENTICITY,
+    "adventure": _ACTION_AUTHENTICITY,
+    "gentle": _GENTLE_AUTHENTICITY,
+    "friendship": _FRIENDSHIP_AUTHENTICITY,
+    "slice_of_life": _GENTLE_AUTHENTICITY
+}
+
+_PACING_BY_TYPE = {
+    "action": _ACTION_PACING,
+    "adventure": _ACTION_PACING,
+    "gentle": _GENTLE_PACING,
+    "friendship": _FRIENDSHIP_PACING,
+    "slice_of_life": _GENTLE_PACING
+}
+
+# Used when the story type is unknown: the model classifies the story itself
+# and gets guidance for every type
+_STORY_TYPE_ANALYSIS = "STEP 1 - ANALYZE THE STORY TYPE:\nFirst, determine what kind of story this is:\n" + "\n".join(
+    f"- {label}" for label in STORY_TYPES.values()
+)
+_ALL_AUTHENTICITY = "\n\n".join([_ACTION_AUTHENTICITY, _GENTLE_AUTHENTICITY, _FRIENDSHIP_AUTHENTICITY])
+_ALL_PACING = "\n\n".join([_ACTION_PACING, _GENTLE_PACING, _FRIENDSHIP_PACING])
+
+_CLASSIFIER_PROMPT = "Classify the children's story into exactly one type. Reply with only the type: " + ", ".join(STORY_TYPES) + "."
+
+# Templates filled with str.format_map per request
+_LIBRARY_CONTEXT_TMPL = "\n\nREADING HISTORY CONTEXT:\nThis child has enjoyed these books:\n{library_context}\n\nUse this to understand their interests and reading level, but create something completely new and original. Capture the emotional resonance and themes they enjoyed, not specific plots or characters."
+
+_USER_PROMPT_TMPL = """Create an engaging, emotionally authentic story for a {child_age}-year-old child.
+
+STORY DETAILS:
+- Title: "{story_title}"
+- Concept: "{story_description}"
+- Total Pages: {max_pages}
+
+{story_type_section}
+
+STEP 2 - ASSESS CHARACTER TYPE:
+- Is this an established character (Batman, Superman, firefighter, doctor)? If yes, maintain accurate appearance and behavior
+- Is this an original character? If yes, develop them with consistent traits
+- What setting does this character belong in? (Gotham City, Metropolis, modern city, fantasy world, real neighborhood, etc.)
+
+STEP 3 - APPLY APPROPRIATE AUTHENTICITY:
+
+{authenticity_section}
 
 CRITICAL ACCURACY REQUIREMENTS (For Established Characters/Settings):
 
@@ -242,37 +343,7 @@ TECHNICAL REQUIREMENTS:
 
 PACING GUIDE (Use Percentages of Total Story):
 
-For ACTION/EMERGENCY stories:
-- FIRST 15-20% of story: Establish character and their normal world
-- NEXT 15-20% of story: Challenge or emergency arrives (show real stakes clearly)
-- MIDDLE 30-40% of story: Active problem-solving with realistic obstacles and setbacks
-- NEXT 15-20% of story: Climax - most challenging moment, outcome uncertain
-- FINAL 10-15% of story: Earned resolution and meaningful reflection on what was learned
-
-For GENTLE/CONTEMPLATIVE stories:
-- FIRST 20-25% of story: Establish setting, mood, and character
-- MIDDLE 50-60% of story: Flow through moments of observation, discovery, or connection
-- FINAL 15-20% of story: Build to a moment of realization or peaceful satisfaction, gentle conclusion with warmth
-
-For FRIENDSHIP/RELATIONSHIP stories:
-- FIRST 20% of story: Establish characters and their relationship
-- NEXT 20-25% of story: Introduce interpersonal challenge or misunderstanding
-- MIDDLE 30-40% of story: Characters navigate emotions and learn
-- FINAL 15-20% of story: Resolution through understanding, strengthened bonds
-
-OUTPUT FORMAT (strict JSON):
-{{
-  "storyTitle": "{story_title}",
-  "storyDescription": "A compelling 1-2 sentence summary that conveys the story's true nature and emotional journey",
-  "storyContent": [
-    {{
-      "pageText": "PAGE 1 content with authentic emotion, clear scene-setting, and character introduction that matches the story type..."
-    }},
-    {{
-      "pageText": "PAGE 2 content that develops appropriately for the story type..."
-    }}
-  ]
-}}
+{pacing_section}
 
 EXAMPLES OF APPROPRIATE SCALING:
 
@@ -289,38 +360,370 @@ BAD (Inappropriate Joker depiction): "The Joker wore a sparkly jester costume an
 GOOD: "The Joker's purple suit was disheveled, his smile unsettling. His pranks had caused chaos in the park - paint everywhere, confused people, worried faces. Batman knew this was trouble that needed to stop."
 
 Create a story that feels REAL, ENGAGING, and APPROPRIATE to its subject matter in the style of DISNEY, PIXAR, or DC storytelling. Match intensity to content. Respect both the characters' authenticity and the reader's intelligence. Build genuine emotion through authentic experiences - whether that's overcoming danger, appreciating beauty, or connecting with others."""
+
+
+async def _lookup_cached_story(
+    cache_partition: Tuple,
+    query: str
+) -> Tuple[Optional[np.ndarray], Optional[Dict]]:
+    """
+    Look up a semantically similar story in the cache.
+    
+    Only used when settings.semantic_cache_enabled is set; otherwise no
+    embedding is computed and every request generates a fresh story.
+    
+    Args:
+        cache_partition: Request parameters a cached story must match
+        query: Text the cache key is embedded from
         
-        # Generate story
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.8
+    Returns:
+        The query embedding (None if unavailable) and the cached story, if any
+    """
+    if not settings.semantic_cache_enabled:
+        return None, None
+    try:
+        vector = await story_cache.embed(query)
+        return vector, story_cache.get(cache_partition, vector)
+    except Exception as e:
+        logger.warning("Semantic cache lookup failed, generating without cache: %s", e)
+        return None, None
+
+
+def _docs_key(docs: List[Document]) -> str:
+    """Return a compact hash identifying a set of retrieved documents."""
+    digest = hashlib.blake2b(digest_size=16)
+    for doc in docs:
+        digest.update((doc.id or doc.page_content).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=256)
+def _build_system_prompt(library_context: str) -> str:
+    """Assemble the system prompt, reusing the string for repeated library contexts."""
+    base_prompt = _SYSTEM_PROMPT_COMPRESSED if settings.storygen_compressed else _SYSTEM_PROMPT
+    if not library_context:
+        return base_prompt
+    return "".join([
+        base_prompt,
+        _LIBRARY_CONTEXT_TMPL.format_map({"library_context": library_context})
+    ])
+
+
+async def _retrieve_library_context(
+    query: str,
+    user_id: str,
+    child_age: int,
+    use_books_context: bool,
+    use_history_context: bool
+) -> str:
+    """
+    Retrieve reading history context from the user's personal library.
+    
+    Returns:
+        Formatted library context, or an empty string if nothing was found
+    """
+    try:
+        # Skip the embedding call and vector search for users without a library
+        if not await rag_service.user_has_library(
+            user_id, child_age, use_books_context, use_history_context
+        ):
+            return ""
+        
+        # Retrieve from user's books and stories
+        library_docs = await rag_service.retrieve_from_user_library(
+            query=query,
+            user_id=user_id,
+            child_age=child_age,
+            top_k=3,
+            include_books=use_books_context,
+            include_stories=use_history_context
         )
+        if not library_docs:
+            return ""
+        logger.info("Retrieved %d documents from user library", len(library_docs))
+        
+        cache_key = (user_id, _docs_key(library_docs))
+        cached = _library_context_cache.get(cache_key)
+        if cached is not None and cached[0] > time.monotonic():
+            _library_context_cache.move_to_end(cache_key)
+            return cached[1]
         
-        story_content = response.choices[0].message.content
+        # Cap by tokens rather than characters so the prompt size is bounded
+        # regardless of the script the books are written in
+        library_context = "\n\n".join([
+            f"From your reading history {i+1}:\n{truncate_tokens(doc.page_content, LIBRARY_EXCERPT_TOKENS)}..."
+            for i, doc in enumerate(library_docs)
+        ])
+        library_context = truncate_tokens(library_context, LIBRARY_CONTEXT_MAX_TOKENS)
         
-        # Parse JSON response
+        _library_context_cache[cache_key] = (time.monotonic() + LIBRARY_CONTEXT_TTL, library_context)
+        while len(_library_context_cache) > LIBRARY_CONTEXT_CACHE_SIZE:
+            _library_context_cache.popitem(last=False)
+        return library_context
+    except Exception as e:
+        logger.warning("RAG retrieval failed, continuing without retrieval: %s", e)
+        return ""
+
+
+async def _classify_story_type(query: str) -> Optional[str]:
+    """
+    Classify a story request into one of STORY_TYPES with a tiny completion.
+    
+    Results are shared across similar requests through the semantic cache.
+    
+    Args:
+        query: Story title and description
+        
+    Returns:
+        The story type, or None if classification failed
+    """
+    try:
+        vector = None
+        if settings.semantic_cache_enabled:
+            vector = await story_type_cache.embed(query)
+            cached_type = story_type_cache.get(None, vector)
+            if cached_type is not None:
+                return cached_type
+        
+        response = await guarded_call(
+            lambda: client.chat.completions.with_raw_response.create(
+                model=STORY_MODEL,
+                messages=[
+                    {"role": "system", "content": _CLASSIFIER_PROMPT},
+                    {"role": "user", "content": query}
+                ],
+                temperature=0,
+                max_completion_tokens=5,
+                timeout=STORY_REQUEST_TIMEOUT
+            ),
+            model=STORY_MODEL,
+            est_tokens=(len(_CLASSIFIER_PROMPT) + len(query)) // 4 + 5
+        )
+        answer = (response.choices[0].message.content or "").strip().lower().replace("-", "_")
+        story_type = next((t for t in STORY_TYPES if answer.startswith(t)), None)
+        if story_type is None:
+            logger.warning("Unrecognized story type from classifier: %r", answer)
+            return None
+        
+        if vector is not None:
+            story_type_cache.put(None, vector, story_type)
+        return story_type
+    except Exception as e:
+        logger.warning("Story type classification failed, sending all guidance: %s", e)
+        return None
+
+
+def _story_type_sections(story_type: Optional[str]) -> Dict[str, str]:
+    """Return the user prompt sections for a story type (all of them if unknown)."""
+    if story_type is None:
+        return {
+            "story_type_section": _STORY_TYPE_ANALYSIS,
+            "authenticity_section": _ALL_AUTHENTICITY,
+            "pacing_section": _ALL_PACING
+        }
+    return {
+        "story_type_section": f"STEP 1 - STORY TYPE:\nThis is a {STORY_TYPES[story_type]}",
+        "authenticity_section": _AUTHENTICITY_BY_TYPE[story_type],
+        "pacing_section": _PACING_BY_TYPE[story_type]
+    }
+
+
+async def _no_library_context() -> str:
+    return ""
+
+
+async def stream_story(
+    story_description: str,
+    story_title: str,
+    max_pages: int,
+    child_age: int,
+    user_id: str,
+    use_books_context: bool = False,
+    use_history_context: bool = False
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Generate a story using OpenAI with RAG context, yielding pages as they stream.
+    
+    Args:
+        story_description: Description of the story
+        story_title: Title of the story
+        max_pages: Maximum number of pages
+        child_age: Child's age for age-appropriate content
+        user_id: User ID for retrieving personal library content
+        use_books_context: Whether to use uploaded books for context
+        use_history_context: Whether to use reading history for context
+        
+    Yields:
+        ("page", dict) for each page as soon as it is generated, then
+        ("story", dict) once with the parsed story. ("reset", {}) is yielded
+        if a truncated story is regenerated; pages sent before it are discarded
+    """
+    try:
+        uses_context = use_books_context or use_history_context
+        cache_partition = (
+            child_age,
+            max_pages,
+            use_books_context,
+            use_history_context,
+            # Library context is personal, so cached stories built on it are too
+            user_id if uses_context else None
+        )
+        query = f"{story_title} {story_description}"
+        
+        # The classifier only matters on a cache miss; it runs alongside the
+        # lookup and library retrieval and is cancelled on a hit
+        classify_task = asyncio.create_task(_classify_story_type(query))
         try:
-            # Try to extract JSON from markdown code blocks if present
-            if "```json" in story_content:
-                story_content = story_content.split("```json")[1].split("```")[0].strip()
-            elif "```" in story_content:
-                story_content = story_content.split("```")[1].split("```")[0].strip()
+            cache_result, library_context = await asyncio.gather(
+                _lookup_cached_story(cache_partition, query),
+                _retrieve_library_context(
+                    query, user_id, child_age, use_books_context, use_history_context
+                ) if uses_context else _no_library_context()
+            )
+            vector, cached_story = cache_result
+            if cached_story is not None:
+                classify_task.cancel()
+                for index, page in enumerate(cached_story.get("storyContent", [])):
+                    yield "page", {"index": index, "page": page}
+                yield "story", cached_story
+                return
+            try:
+                story_type = await asyncio.wait_for(classify_task, STORY_TYPE_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.info("Story type classification timed out, sending all guidance")
+                story_type = None
+        finally:
+            classify_task.cancel()
+        
+        # Build enhanced system prompt
+        system_prompt = _build_system_prompt(library_context)
+        
+        # Build user prompt
+        user_prompt = _USER_PROMPT_TMPL.format_map({
+            "child_age": child_age,
+            "story_title": story_title,
+            "story_description": story_description,
+            "max_pages": max_pages,
+            **_story_type_sections(story_type)
+        })
+        
+        # Stream the story and surface each page as soon as its closing brace arrives;
+        # structured outputs guarantee the streamed text is schema-valid JSON.
+        # Output is capped so runaway generations stop early; a story truncated by
+        # the cap is retried once with double the budget. The retry is a new story,
+        # so a "reset" event tells consumers to drop the pages already sent before
+        # its pages are emitted from index 0.
+        max_completion_tokens = max_pages * COMPLETION_TOKENS_PER_PAGE + COMPLETION_TOKENS_OVERHEAD
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        prompt_tokens = (len(system_prompt) + len(user_prompt)) // 4
+        for attempt in range(2):
+            # Hold a generation slot for the whole stream, not just the request
+            async with _generation_slots:
+                response = await guarded_call(
+                    lambda: client.chat.completions.with_raw_response.create(
+                        model=STORY_MODEL,
+                        messages=messages,
+                        response_format=STORY_RESPONSE_FORMAT,
+                        temperature=0.8,
+                        max_completion_tokens=max_completion_tokens,
+                        prompt_cache_key=PROMPT_CACHE_KEY,
+                        stream=True,
+                        stream_options={"include_usage": True},
+                        timeout=STORY_REQUEST_TIMEOUT
+                    ),
+                    model=STORY_MODEL,
+                    est_tokens=prompt_tokens + max_completion_tokens
+                )
+                request_id = response.response.headers.get("x-request-id")
+                
+                parser = IncrementalJSONParser("storyContent")
+                parts: List[str] = []
+                refusal_parts: List[str] = []
+                page_index = 0
+                finish_reason = None
+                usage = None
+                async for chunk in response:
+                    # Usage is reported on a final chunk without choices
+                    if chunk.usage:
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    choice = chunk.choices[0]
+                    finish_reason = choice.finish_reason or finish_reason
+                    if choice.delta.refusal:
+                        refusal_parts.append(choice.delta.refusal)
+                    if not choice.delta.content:
+                        continue
+                    parts.append(choice.delta.content)
+                    for page in parser.feed(choice.delta.content):
+                        yield "page", {"index": page_index, "page": page}
+                        page_index += 1
             
-            return json.loads(story_content)
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parse error: {e}")
-            logger.error(f"Response content: {story_content[:500]}")
-            # Return as plain text if JSON parsing fails
-            return {
-                "storyTitle": story_title,
-                "storyDescription": story_description,
-                "storyContent": [{"pageText": story_content}]
-            }
+            if finish_reason != "length":
+                break
+            if attempt:
+                raise Exception(
+                    f"Story exceeded the {max_completion_tokens} token cap (request {request_id})"
+                )
+            logger.warning(
+                "Story hit the %d token cap (request %s), retrying with a higher cap",
+                max_completion_tokens,
+                request_id
+            )
+            max_completion_tokens *= 2
+            if page_index:
+                yield "reset", {}
+        
+        if usage:
+            details = usage.prompt_tokens_details
+            cached_tokens = details.cached_tokens if details and details.cached_tokens else 0
+            logger.info(
+                "Story prompt tokens: %d (cached: %d, %.0f%%, request %s)",
+                usage.prompt_tokens,
+                cached_tokens,
+                100 * cached_tokens / max(usage.prompt_tokens, 1),
+                request_id
+            )
+        
+        if refusal_parts:
+            raise Exception("".join(refusal_parts))
+        story = await asyncio.to_thread(_parse_story, "".join(parts))
+        
+        if vector is not None:
+            story_cache.put(cache_partition, vector, story)
+        yield "story", story
             
     except Exception as e:
-        logger.error(f"Error generating story: {e}")
-        raise Exception(f"Failed to generate story: {str(e)}")
\ No newline at end of file
+        logger.error("Error generating story: %s", e)
+        raise Exception(f"Failed to generate story: {str(e)}")
+
+
+async def generate_story(
+    story_description: str,
+    story_title: str,
+    max_pages: int,
+    child_age: int,
+    user_id: str,
+    use_books_context: bool = False,
+    use_history_context: bool = False
+) -> Dict:
+    """
+    Generate a story using OpenAI with RAG context.
+    
+    Buffered wrapper around `stream_story` for callers that need the whole story.
+    
+    Returns:
+        Generated story dictionary
+    """
+    story: Dict = {}
+    async for event, payload in stream_story(
+        story_description, story_title, max_pages, child_age,
+        user_id, use_books_context, use_history_context
+    ):
+        if event == "story":
+            story = payload
+    return story
@@ -1,33 +1,38 @@
 """Audio upload and processing routes."""
-from fastapi import APIRouter, Depends, UploadFile, File, status
-from app.services.audio_service import audio_service
-from app.middleware.auth import get_current_user
-from app.schemas.user import User
+import asyncio
+import orjson
+from fastapi import APIRouter, BackgroundTasks, Depends, UploadFile, File, status
+from fastapi.responses import StreamingResponse
+from app.models.audio import AudioFeedbackResponse
+from app.services.audio_service import audio_service, PROCESSING_ACTIVE
+from app.middleware.auth import get_current_user_id
 from app.exceptions import NotFoundError
 from app.utils.logger import logger
+from app.utils.responses import dumps
 
 router = APIRouter(tags=["audio"])
 
+# Seconds between status checks when streaming processing events
+PROCESSING_POLL_INTERVAL = 1.0
+
 
 @router.post("/upload/{sid}", status_code=status.HTTP_201_CREATED)
 async def upload_audio(
     sid: str,
     audio: UploadFile = File(..., description="Audio file to upload"),
-    current_user: User = Depends(get_current_user)
+    current_user_id: str = Depends(get_current_user_id)
 ):
     """
     Upload audio file to S3.
     Protected route.
     """
     try:
-        # Read audio file content
-        audio_content = await audio.read()
-        
-        # Upload to S3 and create audio record
+        # Stream the spooled upload straight to S3 instead of reading it into memory
         audio_doc = await audio_service.upload_audio_to_s3(
-            audio_file=audio_content,
+            audio_file=audio.file,
             file_name=audio.filename,
-            story_id=sid
+            story_id=sid,
+            content_type=audio.content_type
         )
         
         return str(audio_doc.id)
@@ -38,10 +43,10 @@ async def upload_audio(
         raise
 
 
-@router.get("/audio/finalFeedback/{aid}")
+@router.get("/audio/finalFeedback/{aid}", response_model=AudioFeedbackResponse)
 async def get_audio_feedback(
     aid: str,
-    current_user: User = Depends(get_current_user)
+    current_user_id: str = Depends(get_current_user_id)
 ):
     """
     Get audio feedback with story data.
@@ -50,36 +55,9 @@ async def get_audio_feedback(
     try:
         result = await audio_service.get_audio_feedback(aid)
         
-        # Convert to response format
-        audio_doc = result["audio"]
-        story_doc = result["story"]
-        
-        return {
-            "audio": {
-                "id": str(audio_doc.id),
-                "filePath": audio_doc.file_path,
-                "fileName": audio_doc.file_name,
-                "transcript": audio_doc.transcript,
-                "score": audio_doc.score,
-                "wholeStory": audio_doc.whole_story,
-                "sid": str(audio_doc.sid) if audio_doc.sid else None,
-                "createdAt": audio_doc.created_at
-            },
-            "story": {
-                "id": str(story_doc.id),
-                "storyTitle": story_doc.story_title,
-                "storyDescription": story_doc.story_description,
-                "storyContent": [
-                    {
-                        "pageText": page.page_text,
-                        "pageImage": page.page_image
-                    }
-                    for page in story_doc.story_content
-                ],
-                "storyAuthor": story_doc.story_author,
-                "maxPages": story_doc.max_pages
-            } if story_doc else None
-        }
+        # Read fields straight off the documents; pydantic-core handles the
+        # per-page shaping and camelCase serialization
+        return AudioFeedbackResponse.model_validate(result, from_attributes=True)
     except NotFoundError:
         raise
     except Exception as e:
@@ -90,14 +68,18 @@ async def get_audio_feedback(
 @router.get("/process-audio/{aid}")
 async def process_audio(
     aid: str,
-    current_user: User = Depends(get_current_user)
+    current_user_id: str = Depends(get_current_user_id)
 ):
     """
     Process audio: transcribe, enhance, and calculate score.
     Protected route.
+    
+    Returns stored results if the audio was already processed; otherwise
+    processes inline. Prefer POST + /status (or /events) to avoid holding
+    the request open while processing runs.
     """
     try:
-        result = await audio_service.process_audio(aid)
+        result = await audio_service.get_or_process_audio(aid)
         return result
     except NotFoundError:
         raise
@@ -105,3 +87,82 @@ async def process_audio(
         logger.error(f"Error processing audio: {e}")
         raise
 
+
+@router.post("/process-audio/{aid}", status_code=status.HTTP_202_ACCEPTED)
+async def start_audio_processing(
+    aid: str,
+    background_tasks: BackgroundTasks,
+    current_user_id: str = Depends(get_current_user_id)
+):
+    """
+    Queue audio processing to run in the background.
+    Protected route.
+    
+    Poll /process-audio/{aid}/status or subscribe to /process-audio/{aid}/events
+    for progress.
+    """
+    try:
+        job, queued = await audio_service.start_processing(aid)
+        if queued:
+            background_tasks.add_task(audio_service.run_processing, aid)
+        return job
+    except NotFoundError:
+        raise
+    except Exception as e:
+        logger.error(f"Error queueing audio processing: {e}")
+        raise
+
+
+@router.get("/process-audio/{aid}/status")
+async def get_audio_processing_status(
+    aid: str,
+    current_user_id: str = Depends(get_current_user_id)
+):
+    """
+    Get audio processing status and any results stored so far.
+    Protected route.
+    """
+    try:
+        return await audio_service.get_processing_status(aid)
+    except NotFoundError:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting audio processing status: {e}")
+        raise
+
+
+@router.get("/process-audio/{aid}/events")
+async def audio_processing_events(
+    aid: str,
+    current_user_id: str = Depends(get_current_user_id)
+):
+    """
+    Stream audio processing status changes as Server-Sent Events.
+    Protected route.
+    
+    Emits a `status` event whenever the job state or results change, and
+    closes once processing has completed or failed. A job whose worker stops
+    heartbeating is reported as failed, which also closes the stream.
+    """
+    # Fail fast with 404 before the stream starts
+    job = await audio_service.get_processing_status(aid)
+    
+    async def event_stream():
+        nonlocal job
+        last_sent = None
+        try:
+            while True:
+                if job != last_sent:
+                    data = dumps(job).decode()
+                    yield f"event: status\ndata: {data}\n\n"
+                    last_sent = job
+                if job["status"] not in PROCESSING_ACTIVE:
+                    return
+                await asyncio.sleep(PROCESSING_POLL_INTERVAL)
+                job = await audio_service.get_processing_status(aid)
+        except Exception as e:
+            logger.error(f"Error streaming audio processing status: {e}")
+            data = orjson.dumps({"error": "Failed to get audio processing status"}).decode()
+            yield f"event: error\ndata: {data}\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
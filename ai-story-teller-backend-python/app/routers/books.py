@@ -3,10 +3,16 @@ from fastapi import APIRouter, Depends, UploadFile, File, Form, Query, status, H
 from typing import Optional
 from bson import ObjectId
 
-from app.models.book import BookResponse, BookListResponse, UploadBookMetadata
+from app.models.book import (
+    BookResponse,
+    BookListResponse,
+    CreateUploadRequest,
+    UploadBookMetadata,
+    UploadSessionResponse
+)
 from app.services.book_service import book_service
-from app.middleware.auth import get_current_user
-from app.schemas.user import User
+from app.middleware.auth import get_auth_user
+from app.schemas.user import AuthUser
 from app.utils.logger import logger
 
 router = APIRouter(prefix="/api/books", tags=["books"])
@@ -17,7 +23,7 @@ async def upload_book(
     file: UploadFile = File(..., description="Book file (PDF, TXT, or EPUB)"),
     book_title: Optional[str] = Form(None, description="Book title (optional)"),
     book_author: Optional[str] = Form(None, description="Book author (optional)"),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthUser = Depends(get_auth_user)
 ):
     """
     Upload a new book file.
@@ -59,11 +65,94 @@ async def upload_book(
         raise HTTPException(status_code=500, detail="Failed to upload book")
 
 
+@router.post("/presign", status_code=status.HTTP_201_CREATED, response_model=UploadSessionResponse)
+async def create_upload_session(
+    upload: CreateUploadRequest,
+    current_user: AuthUser = Depends(get_auth_user)
+):
+    """
+    Start a direct upload: returns a presigned S3 PUT URL for a pending book.
+    Protected route.
+    
+    The client PUTs the file to `uploadUrl` with the given Content-Type, then
+    calls POST /api/books/{bookId}/finalize.
+    
+    Args:
+        upload: File name, size, type and optional metadata
+        current_user: Authenticated user
+        
+    Returns:
+        Book ID and presigned upload URL
+    """
+    try:
+        metadata = None
+        if upload.book_title or upload.book_author:
+            metadata = UploadBookMetadata(
+                book_title=upload.book_title,
+                book_author=upload.book_author
+            )
+        
+        return await book_service.create_upload_session(
+            file_name=upload.file_name,
+            file_size=upload.file_size,
+            content_type=upload.content_type,
+            user_id=str(current_user.id),
+            child_age=current_user.child_age,
+            metadata=metadata
+        )
+        
+    except ValueError as e:
+        logger.warning(f"Invalid book upload: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error creating book upload: {e}")
+        raise HTTPException(status_code=500, detail="Failed to create book upload")
+
+
+@router.post("/{book_id}/finalize", response_model=BookResponse)
+async def finalize_upload(
+    book_id: str,
+    current_user: AuthUser = Depends(get_auth_user)
+):
+    """
+    Finish a direct upload: extract and index the file uploaded to S3.
+    Protected route.
+    
+    Args:
+        book_id: Book ID returned by /presign
+        current_user: Authenticated user
+        
+    Returns:
+        Finalized book response
+    """
+    try:
+        if not ObjectId.is_valid(book_id):
+            raise HTTPException(status_code=400, detail="Invalid book ID")
+        
+        book = await book_service.finalize_upload(
+            book_id=book_id,
+            user_id=str(current_user.id)
+        )
+        
+        logger.info(f"Book uploaded by user {current_user.id}: {book.id}")
+        return book
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        logger.warning(f"Invalid book upload finalize: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error finalizing book upload: {e}")
+        raise HTTPException(status_code=500, detail="Failed to upload book")
+
+
 @router.get("", response_model=BookListResponse)
 async def get_user_books(
     page: int = Query(1, ge=1, description="Page number"),
     limit: int = Query(20, ge=1, le=100, description="Items per page"),
-    current_user: User = Depends(get_current_user)
+    cursor: Optional[str] = Query(None, description="Cursor from the previous page (replaces page)"),
+    current_user: AuthUser = Depends(get_auth_user)
 ):
     """
     Get all books for the authenticated user.
@@ -72,25 +161,31 @@ async def get_user_books(
     Args:
         page: Page number
         limit: Items per page
+        cursor: Cursor from the previous page, for seek-based pagination
         current_user: Authenticated user
         
     Returns:
         List of user's books with pagination
     """
     try:
-        books, total = await book_service.get_user_books(
+        books, total, next_cursor = await book_service.get_user_books(
             user_id=str(current_user.id),
             page=page,
-            limit=limit
+            limit=limit,
+            cursor=cursor
         )
         
         return BookListResponse(
             books=books,
             total=total,
             page=page,
-            limit=limit
+            limit=limit,
+            next_cursor=next_cursor
         )
         
+    except ValueError as e:
+        logger.warning(f"Invalid book list request: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting books: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve books")
@@ -99,7 +194,7 @@ async def get_user_books(
 @router.delete("/{book_id}", status_code=status.HTTP_200_OK)
 async def delete_book(
     book_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: AuthUser = Depends(get_auth_user)
 ):
     """
     Delete a book.
@@ -1,18 +1,20 @@
 """Story management routes."""
 from fastapi import APIRouter, Depends, Query, status
+from fastapi.responses import StreamingResponse
 from typing import Optional
-from bson import ObjectId
-from app.models.story import CreateStoryRequest, StoryResponse
+from beanie import PydanticObjectId
+import orjson
+from app.models.story import CreateStoryRequest, CreateStoryBatchRequest, StoryResponse
 from app.models.assignment import AssignmentResponse
 from app.models.feedback import FeedbackRequest, FeedbackResponse
 from app.services.story_service import story_service
-from app.middleware.auth import get_current_user
-from app.schemas.user import User
+from app.middleware.auth import get_auth_user
+from app.schemas.user import AuthUser
 from app.schemas.story import Story
 from app.schemas.assignment import Assignment
-from app.schemas.feedback import Feedback
-from app.exceptions import NotFoundError, ForbiddenError
+from app.exceptions import NotFoundError, ForbiddenError, BadRequestError
 from app.utils.logger import logger
+from app.utils.responses import ORJSONResponse, dumps
 
 router = APIRouter(prefix="/api/story", tags=["stories"])
 
@@ -20,7 +22,7 @@ router = APIRouter(prefix="/api/story", tags=["stories"])
 @router.post("/create", status_code=status.HTTP_201_CREATED)
 async def create_story(
     story_data: CreateStoryRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: AuthUser = Depends(get_auth_user)
 ):
     """
     Create a new story with RAG-enhanced generation.
@@ -37,47 +39,108 @@ async def create_story(
         story_dict = story.model_dump(by_alias=True)
         story_dict["id"] = str(story.id)  # Add id field for frontend
         
-        return {
-            "message": "Story created successfully",
-            "story": story_dict
-        }
+        return ORJSONResponse(
+            status_code=status.HTTP_201_CREATED,
+            content={
+                "message": "Story created successfully",
+                "story": story_dict
+            }
+        )
     except Exception as e:
         logger.error(f"Error creating story: {e}")
         raise
 
 
+@router.post("/batch", status_code=status.HTTP_201_CREATED)
+async def create_stories_batch(
+    batch_data: CreateStoryBatchRequest,
+    current_user: AuthUser = Depends(get_auth_user)
+):
+    """
+    Create several stories concurrently.
+    Protected route.
+    
+    Results are returned in request order; a story that fails to generate
+    is reported as an error entry without failing the rest of the batch.
+    """
+    try:
+        results = await story_service.create_stories_batch(
+            stories_data=batch_data.stories,
+            user_id=current_user.id,
+            author_name=current_user.parent_name
+        )
+        
+        stories = []
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Error creating story in batch: {result}")
+                stories.append({"error": "Failed to create story"})
+                continue
+            story_dict = result.model_dump(by_alias=True)
+            story_dict["id"] = str(result.id)
+            stories.append(story_dict)
+        
+        return ORJSONResponse(
+            status_code=status.HTTP_201_CREATED,
+            content={
+                "message": "Stories created",
+                "stories": stories
+            }
+        )
+    except Exception as e:
+        logger.error(f"Error creating story batch: {e}")
+        raise
+
+
+@router.post("/create/stream", status_code=status.HTTP_201_CREATED)
+async def create_story_stream(
+    story_data: CreateStoryRequest,
+    current_user: AuthUser = Depends(get_auth_user)
+):
+    """
+    Create a new story, streaming generated pages as Server-Sent Events.
+    Protected route.
+    
+    Emits a `page` event as each page is generated, then a single
+    `story` event with the saved story (same shape as /create).
+    """
+    async def event_stream():
+        try:
+            async for event, payload in story_service.create_story_stream(
+                story_data=story_data,
+                user_id=current_user.id,
+                author_name=current_user.parent_name
+            ):
+                if event == "story":
+                    story_dict = payload.model_dump(by_alias=True)
+                    story_dict["id"] = str(payload.id)
+                    payload = {
+                        "message": "Story created successfully",
+                        "story": story_dict
+                    }
+                data = dumps(payload).decode()
+                yield f"event: {event}\ndata: {data}\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming story: {e}")
+            data = orjson.dumps({"error": "Failed to create story"}).decode()
+            yield f"event: error\ndata: {data}\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 @router.get("/getStory/{sid}")
 async def get_story(
-    sid: str,
-    current_user: User = Depends(get_current_user)
+    sid: PydanticObjectId,
+    current_user: AuthUser = Depends(get_auth_user)
 ):
     """
     Get a single story by ID.
     Protected route - only returns story if user owns it.
     """
     try:
-        story = await story_service.get_story(sid, current_user.id)
-        
-        # Serialize story with proper field names
-        story_dict = {
-            "id": str(story.id),
-            "storyTitle": story.story_title,
-            "storyDescription": story.story_description,
-            "storyContent": [
-                {
-                    "pageText": page.page_text,
-                    "pageImage": page.page_image
-                }
-                for page in story.story_content
-            ],
-            "storyAuthor": story.story_author,
-            "createdBy": str(story.created_by),
-            "maxPages": story.max_pages,
-            "createdAt": story.created_at.isoformat(),
-            "updatedAt": story.updated_at.isoformat()
-        }
+        story_dict = await story_service.get_story_serialized(sid, current_user.id)
         
-        return {"story": story_dict}
+        return ORJSONResponse(content={"story": story_dict})
     except (NotFoundError, ForbiddenError):
         raise
     except Exception as e:
@@ -87,53 +150,35 @@ async def get_story(
 
 @router.get("/stories/{uid}")
 async def get_all_stories(
-    uid: str,
+    uid: PydanticObjectId,
     page: int = Query(1, ge=1, description="Page number"),
-    limit: int = Query(10, ge=1, le=100, description="Items per page")
+    limit: int = Query(10, ge=1, le=100, description="Items per page"),
+    after: Optional[str] = Query(None, description="Cursor from the previous page (replaces page)"),
+    include_total: bool = Query(False, description="Include the total story count"),
+    include_content: bool = Query(True, description="Include each story's pages")
 ):
     """
     Get all stories for a user with pagination.
     Public route (no auth required for now - matches original behavior).
     """
     try:
-        if not ObjectId.is_valid(uid):
-            raise NotFoundError("Invalid user ID format")
-        
-        stories, total = await story_service.get_all_stories(
-            user_id=ObjectId(uid),
+        stories, total, next_cursor = await story_service.get_all_stories(
+            user_id=uid,
             page=page,
-            limit=limit
+            limit=limit,
+            after=after,
+            include_total=include_total,
+            include_content=include_content
         )
         
-        # Serialize stories with proper field names for frontend
-        serialized_stories = []
-        for story in stories:
-            story_dict = {
-                "id": str(story.id),
-                "storyTitle": story.story_title,
-                "storyDescription": story.story_description,
-                "storyContent": [
-                    {
-                        "pageText": page.page_text,
-                        "pageImage": page.page_image
-                    }
-                    for page in story.story_content
-                ],
-                "storyAuthor": story.story_author,
-                "createdBy": str(story.created_by),
-                "maxPages": story.max_pages,
-                "createdAt": story.created_at.isoformat(),
-                "updatedAt": story.updated_at.isoformat()
-            }
-            serialized_stories.append(story_dict)
-        
-        return {
-            "stories": serialized_stories,
+        return ORJSONResponse(content={
+            "stories": stories,
             "total": total,
             "page": page,
-            "limit": limit
-        }
-    except NotFoundError:
+            "limit": limit,
+            "nextCursor": next_cursor
+        })
+    except BadRequestError:
         raise
     except Exception as e:
         logger.error(f"Error getting all stories: {e}")
@@ -142,8 +187,8 @@ async def get_all_stories(
 
 @router.get("/getQuestions/{sid}")
 async def get_questions(
-    sid: str,
-    current_user: User = Depends(get_current_user)
+    sid: PydanticObjectId,
+    current_user: AuthUser = Depends(get_auth_user)
 ):
     """
     Create or get existing assignment (questions) for a story.
@@ -153,7 +198,7 @@ async def get_questions(
         assignment = await story_service.create_assignment(sid, current_user.id)
         
         # Manually serialize to convert ObjectIds to strings
-        return {
+        return ORJSONResponse(content={
             "id": str(assignment.id),
             "sid": str(assignment.sid),
             "uid": str(assignment.uid),
@@ -165,7 +210,7 @@ async def get_questions(
                 }
                 for q in assignment.questions
             ]
-        }
+        })
     except NotFoundError:
         raise
     except Exception as e:
@@ -175,9 +220,9 @@ async def get_questions(
 
 @router.post("/feedback/{sid}", status_code=status.HTTP_200_OK)
 async def submit_feedback(
-    sid: str,
+    sid: PydanticObjectId,
     feedback_data: FeedbackRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: AuthUser = Depends(get_auth_user)
 ):
     """
     Submit answers and generate feedback.
@@ -191,14 +236,14 @@ async def submit_feedback(
         )
         
         # Manually serialize to convert ObjectIds to strings
-        return {
+        return ORJSONResponse(content={
             "saveFeedbacks": {
                 "id": str(feedback.id),
                 "sid": str(feedback.sid),
                 "uid": str(feedback.uid),
-                "feedbacks": feedback.feedbacks
+                "feedbacks": [item.model_dump(by_alias=True) for item in feedback.feedbacks]
             }
-        }
+        })
     except NotFoundError:
         raise
     except Exception as e:
@@ -208,24 +253,17 @@ async def submit_feedback(
 
 @router.get("/getFeedback/{sid}")
 async def get_feedback(
-    sid: str,
-    current_user: User = Depends(get_current_user)
+    sid: PydanticObjectId,
+    current_user: AuthUser = Depends(get_auth_user)
 ):
     """
     Get feedback results for a story.
     Protected route.
     """
     try:
-        # Note: Original code queries Feedback, but get_feedback method uses Assignment
-        # Fixing to query Feedback collection correctly
-        feedback = await Feedback.find_one(
-            Feedback.sid == ObjectId(sid),
-            Feedback.uid == current_user.id
-        )
-        if not feedback:
-            raise NotFoundError("Feedback not found")
+        feedback = await story_service.get_feedback(sid, current_user.id)
         
-        return {"feedback": feedback}
+        return ORJSONResponse(content={"feedback": feedback.model_dump(by_alias=True)})
     except NotFoundError:
         raise
     except Exception as e:
@@ -235,18 +273,17 @@ async def get_feedback(
 
 @router.get("/getFullStory/{sid}")
 async def get_full_story(
-    sid: str,
-    current_user: User = Depends(get_current_user)
+    sid: PydanticObjectId,
+    current_user: AuthUser = Depends(get_auth_user)
 ):
     """
     Get full story text (combined from all pages).
     Protected route.
     """
     try:
-        story = await story_service.get_story(sid, current_user.id)
-        whole_story = " ".join([page.page_text for page in story.story_content])
+        whole_story = await story_service.get_full_story_text(sid, current_user.id)
         
-        return {"wholeStory": whole_story}
+        return ORJSONResponse(content={"wholeStory": whole_story})
     except (NotFoundError, ForbiddenError):
         raise
     except Exception as e:
@@ -1,9 +1,9 @@
 """User authentication and management routes."""
-from fastapi import APIRouter, Depends, Response, status
+from fastapi import APIRouter, Depends, Request, Response, status
 from app.models.user import UserSignUpRequest, UserLoginRequest, LoginResponse, UserResponse
 from app.services.user_service import user_service
 from app.utils.jwt import create_access_token, set_auth_cookie, clear_auth_cookie
-from app.middleware.auth import get_current_user
+from app.middleware.auth import get_current_user, invalidate_user_cache
 from app.schemas.user import User
 from app.exceptions import ValidationError
 from app.utils.logger import logger
@@ -71,12 +71,13 @@ async def login(
 
 
 @router.post("/logout", status_code=status.HTTP_200_OK)
-async def logout(response: Response):
+async def logout(request: Request, response: Response):
     """
     User logout endpoint.
     Clears authentication cookie.
     """
     try:
+        invalidate_user_cache(request.cookies.get("jwt"))
         clear_auth_cookie(response)
         return {"message": "Logged out successfully"}
     except Exception as e:
@@ -1,9 +1,10 @@
 """Assignment document model."""
 from beanie import Document, PydanticObjectId
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 from typing import Optional, List
 from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
 
 
 class Question(BaseModel):
@@ -18,14 +19,19 @@ class Assignment(Document):
     sid: PydanticObjectId
     uid: PydanticObjectId
     questions: List[Question]
-    created_at: datetime = datetime.utcnow()
-    updated_at: datetime = datetime.utcnow()
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
     
     class Settings:
         name = "assignments"
         indexes = [
-            ("sid", "uid"),  # Compound index for unique story-user assignments
+            # One assignment per user and story, enforced so concurrent
+            # get-or-create calls can't both insert
+            IndexModel(
+                [("uid", ASCENDING), ("sid", ASCENDING)],
+                unique=True,
+                name="assignment_user_story_unique"
+            ),
             "sid",
-            "uid",
         ]
 
@@ -1,7 +1,8 @@
 """Audio document model."""
 from beanie import Document, PydanticObjectId
+from pydantic import Field
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from bson import ObjectId
 
 
@@ -11,12 +12,20 @@ class Audio(Document):
     file_name: str
     s3_key: Optional[str] = None  # S3 key for deletion/management
     s3_bucket: Optional[str] = None
-    created_at: datetime = datetime.utcnow()
+    created_at: datetime = Field(default_factory=datetime.utcnow)
     score: Optional[float] = None
     transcript: Optional[str] = None
     whole_story: str
     sid: Optional[PydanticObjectId] = None
     
+    # Background processing state and results
+    processing_status: Optional[str] = None  # pending, processing, completed, failed
+    processing_error: Optional[str] = None
+    processing_updated_at: Optional[datetime] = None  # When processing_status last changed
+    enhanced_transcript: Optional[str] = None
+    punctuation_analysis: Optional[List[dict]] = None
+    highlighted_diff: Optional[str] = None
+    
     class Settings:
         name = "audios"
         indexes = [
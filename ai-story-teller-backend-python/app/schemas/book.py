@@ -1,5 +1,6 @@
 """Book document model."""
 from beanie import Document, Indexed, PydanticObjectId
+from pydantic import Field
 from datetime import datetime
 from typing import Optional
 
@@ -14,8 +15,9 @@ class Book(Document):
     uploaded_by: Indexed(PydanticObjectId)  # User ID reference
     child_age: int  # For age-appropriate filtering
     is_indexed: bool = False  # Whether content is indexed in ChromaDB
-    upload_date: datetime = datetime.utcnow()
-    updated_at: datetime = datetime.utcnow()
+    upload_status: Optional[str] = None  # "pending" until a direct S3 upload is finalized
+    upload_date: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
     
     class Settings:
         name = "books"
@@ -23,7 +23,7 @@ class Feedback(Document):
     sid: PydanticObjectId
     uid: PydanticObjectId
     feedbacks: List[FeedbackItem]
-    created_at: datetime = datetime.utcnow()
+    created_at: datetime = Field(default_factory=datetime.utcnow)
     
     class Settings:
         name = "feedbacks"
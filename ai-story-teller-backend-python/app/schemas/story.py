@@ -1,9 +1,10 @@
 """Story document model."""
-from beanie import Document, Indexed, PydanticObjectId
+from beanie import Document, PydanticObjectId
 from pydantic import BaseModel, Field
 from datetime import datetime
 from typing import Optional, List
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
 
 
 class PageContent(BaseModel):
@@ -21,16 +22,24 @@ class Story(Document):
     story_description: str
     story_content: List[PageContent]
     story_author: str
-    created_by: Indexed(PydanticObjectId)
+    created_by: PydanticObjectId
     max_pages: int
-    created_at: datetime = datetime.utcnow()
-    updated_at: datetime = datetime.utcnow()
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
     
     class Settings:
         name = "stories"
         indexes = [
-            "created_by",
-            ("created_by", "created_at"),  # Compound index for user's stories sorted by date
+            # Serves every per-user lookup, and the story list's filter and
+            # keyset sort, without an in-memory sort
+            IndexModel(
+                [
+                    ("created_by", ASCENDING),
+                    ("created_at", DESCENDING),
+                    ("_id", DESCENDING)
+                ],
+                name="story_user_created"
+            ),
             "story_title",
         ]
 
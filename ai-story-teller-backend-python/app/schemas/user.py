@@ -1,5 +1,6 @@
 """User document model."""
-from beanie import Document, Indexed
+from beanie import Document, Indexed, PydanticObjectId
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime
 from typing import Optional
 
@@ -12,8 +13,8 @@ class User(Document):
     child_age: int
     password: str
     child_standard: str
-    created_at: datetime = datetime.utcnow()
-    updated_at: datetime = datetime.utcnow()
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
     
     class Settings:
         name = "users"
@@ -22,3 +23,12 @@ class User(Document):
             "child_age",
         ]
 
+
+
+class AuthUser(BaseModel):
+    """Projection of the user fields protected routes read."""
+    id: PydanticObjectId = Field(alias="_id")
+    parent_name: str
+    child_age: int
+    
+    model_config = ConfigDict(populate_by_name=True)
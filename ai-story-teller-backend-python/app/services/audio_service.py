@@ -1,12 +1,15 @@
 """Audio service for audio processing and management."""
-from typing import Optional
+from typing import BinaryIO, Optional, Tuple
 from bson import ObjectId
+from beanie import PydanticObjectId, UpdateResponse
+from beanie.operators import And, In, LT, NotIn, Or, Set
 import assemblyai as aai
 from jiwer import wer
 import nltk
 from nltk.tokenize import sent_tokenize, word_tokenize
 import string
-from openai import AsyncOpenAI
+from app.openai_client._client import client
+from app.openai_client._limiter import guarded_call
 from app.schemas.audio import Audio
 from app.schemas.story import Story
 from app.utils.s3_client import s3_client
@@ -14,6 +17,9 @@ from app.config import settings
 from app.exceptions import NotFoundError
 from app.utils.logger import logger
 import difflib
+import asyncio
+from datetime import datetime, timedelta
+from functools import lru_cache
 
 # Download required NLTK data
 try:
@@ -21,9 +27,55 @@ try:
 except LookupError:
     nltk.download('punkt', quiet=True)
 
+# Single punctuation characters; a set lookup per token instead of a substring scan
+PUNCTUATION = frozenset(string.punctuation)
+
+# Number of stories whose tokenization is kept in memory
+STORY_PUNCTUATION_CACHE_SIZE = 256
+
+
+def _sentence_punctuation(text: str) -> Tuple[Tuple[str, ...], ...]:
+    """Split text into sentences and return the punctuation tokens of each."""
+    return tuple(
+        # The text is already split into sentences, so skip word_tokenize's own split
+        tuple(w for w in word_tokenize(sentence, preserve_line=True) if w in PUNCTUATION)
+        for sentence in sent_tokenize(text)
+    )
+
+
+@lru_cache(maxsize=STORY_PUNCTUATION_CACHE_SIZE)
+def _story_punctuation(story: str) -> Tuple[Tuple[str, ...], ...]:
+    """Cached _sentence_punctuation for story texts."""
+    return _sentence_punctuation(story)
+
+
+@lru_cache(maxsize=STORY_PUNCTUATION_CACHE_SIZE)
+def _story_words(story: str) -> Tuple[str, ...]:
+    """Cached whitespace split of story texts."""
+    return tuple(story.split())
+
+
+# Background processing states stored on Audio.processing_status
+PROCESSING_PENDING = "pending"
+PROCESSING_RUNNING = "processing"
+PROCESSING_COMPLETED = "completed"
+PROCESSING_FAILED = "failed"
+PROCESSING_ACTIVE = {PROCESSING_PENDING, PROCESSING_RUNNING}
+
+# A running job refreshes processing_updated_at this often while it works
+PROCESSING_HEARTBEAT_INTERVAL = timedelta(seconds=30)
+# A job whose status has not been refreshed for this long is assumed lost (e.g.
+# the worker died); it is reported as failed and may be queued again
+PROCESSING_STALE_AFTER = timedelta(minutes=2)
+PROCESSING_STALE_ERROR = "Processing did not finish in time"
+
 # Configure AssemblyAI
 aai.settings.api_key = settings.assembly_ai_api_key
-openai_client = AsyncOpenAI(api_key=settings.openai_api_key)
+# Shared so every transcription polls on the SDK's one worker pool
+transcriber = aai.Transcriber(config=aai.TranscriptionConfig())
+
+ENHANCE_MODEL = "gpt-5-mini"
+ENHANCE_SYSTEM_PROMPT = "You are the most important part of word error calculator. You will be given two strings 'content' and 'context'. Context is the corrected expected string and content is the sentence or paragraph spoken by the speaker. Your job is to replace the incorrect or out of context words in the content string with the corrected spelling or within context words in the context string. Your job is not to return the final corrected string, just make necessary changes in the content string and output it, not even a word(or character) extra. You don't have to add words or mess with the punctuation, just correct them"
 
 
 class AudioService:
@@ -31,17 +83,19 @@ class AudioService:
     
     @staticmethod
     async def upload_audio_to_s3(
-        audio_file: bytes,
+        audio_file: BinaryIO,
         file_name: str,
-        story_id: str
+        story_id: str,
+        content_type: Optional[str] = None
     ) -> Audio:
         """
         Upload audio file to S3 and create audio record.
         
         Args:
-            audio_file: Audio file bytes
+            audio_file: Audio file object, streamed to S3
             file_name: Original file name
             story_id: Story ID
+            content_type: MIME type of the audio
             
         Returns:
             Audio document
@@ -57,9 +111,10 @@ class AudioService:
             
             # Upload to S3
             s3_key, s3_url = await s3_client.upload_audio(
-                file_content=audio_file,
+                file_obj=audio_file,
                 file_name=file_name,
-                folder="audio"
+                folder="audio",
+                content_type=content_type
             )
             
             # Create audio document
@@ -94,9 +149,8 @@ class AudioService:
             Transcribed text
         """
         try:
-            transcriber = aai.Transcriber()
-            config = aai.TranscriptionConfig()
-            transcript = transcriber.transcribe(audio_url, config=config)
+            # The SDK polls for the result on its own thread pool; await its future
+            transcript = await asyncio.wrap_future(transcriber.transcribe_async(audio_url))
             return transcript.text
         except Exception as e:
             logger.error(f"Error transcribing audio: {e}")
@@ -115,18 +169,17 @@ class AudioService:
             Enhanced transcript
         """
         try:
-            completion = await openai_client.chat.completions.create(
-                model="gpt-5-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are the most important part of word error calculator. You will be given two strings 'content' and 'context'. Context is the corrected expected string and content is the sentence or paragraph spoken by the speaker. Your job is to replace the incorrect or out of context words in the content string with the corrected spelling or within context words in the context string. Your job is not to return the final corrected string, just make necessary changes in the content string and output it, not even a word(or character) extra. You don't have to add words or mess with the punctuation, just correct them"
-                    },
-                    {
-                        "role": "user",
-                        "content": f"content: {transcript} context: {story}"
-                    }
-                ]
+            user_prompt = f"content: {transcript} context: {story}"
+            completion = await guarded_call(
+                lambda: client.chat.completions.with_raw_response.create(
+                    model=ENHANCE_MODEL,
+                    messages=[
+                        {"role": "system", "content": ENHANCE_SYSTEM_PROMPT},
+                        {"role": "user", "content": user_prompt}
+                    ]
+                ),
+                model=ENHANCE_MODEL,
+                est_tokens=(len(ENHANCE_SYSTEM_PROMPT) + len(user_prompt)) // 4
             )
             return completion.choices[0].message.content
         except Exception as e:
@@ -146,31 +199,22 @@ class AudioService:
             List of differences
         """
         try:
-            transcript_sentences = sent_tokenize(transcript)
-            story_sentences = sent_tokenize(story)
+            transcript_punctuation_by_sentence = _sentence_punctuation(transcript)
+            # The same story is read many times, so its side is cached
+            story_punctuation_by_sentence = _story_punctuation(story)
 
             # Analyze punctuation in each sentence
             differences = []
-            # We iterate up to the length of the shorter list to avoid index errors
+            # zip stops at the shorter list to avoid index errors
             # Ideally sentences should align, but if not, we compare what we can
-            min_len = min(len(transcript_sentences), len(story_sentences))
-            
-            for i in range(min_len):
-                transcript_sentence = transcript_sentences[i]
-                story_sentence = story_sentences[i]
-                
-                transcript_words = word_tokenize(transcript_sentence)
-                story_words = word_tokenize(story_sentence)
-
-                # Compare punctuation in each sentence
-                transcript_punctuation = [w for w in transcript_words if w in string.punctuation]
-                story_punctuation = [w for w in story_words if w in string.punctuation]
-
+            for i, (transcript_punctuation, story_punctuation) in enumerate(
+                zip(transcript_punctuation_by_sentence, story_punctuation_by_sentence)
+            ):
                 if transcript_punctuation != story_punctuation:
                     differences.append({
                         'sentence_index': i,
-                        'transcript_punctuation': transcript_punctuation,
-                        'story_punctuation': story_punctuation
+                        'transcript_punctuation': list(transcript_punctuation),
+                        'story_punctuation': list(story_punctuation)
                     })
             
             return differences
@@ -191,18 +235,20 @@ class AudioService:
             HTML string with highlighted differences
         """
         try:
-            # Generate the differences
-            diff = difflib.ndiff(original_text.split(), your_reading.split())
+            original_words = _story_words(original_text)
+            reading_words = your_reading.split()
+            matcher = difflib.SequenceMatcher(a=original_words, b=reading_words, autojunk=False)
 
-            # Highlight the differences
+            # Highlight whole differing spans rather than word by word
             highlighted_text = []
-            for word in diff:
-                if word.startswith("- "):  # Word in original but missing in reading
-                    highlighted_text.append(f'<span class="bg-red-200 text-red-700 px-1 rounded">{word[2:]}</span>')
-                elif word.startswith("+ "):  # Extra word in reading
-                    highlighted_text.append(f'<span class="bg-green-200 text-green-700 px-1 rounded">{word[2:]}</span>')
-                else:
-                    highlighted_text.append(word[2:])  # No difference
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                if tag == "equal":  # No difference
+                    highlighted_text.append(" ".join(original_words[i1:i2]))
+                    continue
+                if i1 < i2:  # Words in original but missing in reading
+                    highlighted_text.append(f'<span class="bg-red-200 text-red-700 px-1 rounded">{" ".join(original_words[i1:i2])}</span>')
+                if j1 < j2:  # Extra words in reading
+                    highlighted_text.append(f'<span class="bg-green-200 text-green-700 px-1 rounded">{" ".join(reading_words[j1:j2])}</span>')
 
             # Join the list into a single string and return
             return ' '.join(highlighted_text)
@@ -210,17 +256,32 @@ class AudioService:
             logger.error(f"Error highlighting differences: {e}")
             return ""
     
+    @staticmethod
+    def _processing_result(audio: Audio) -> dict:
+        """Build the processing result payload from an audio document."""
+        return {
+            "transcript": audio.transcript,
+            "enhanced_transcript": audio.enhanced_transcript,
+            "score": audio.score,
+            "punctuation_analysis": audio.punctuation_analysis or [],
+            "highlighted_diff": audio.highlighted_diff or ""
+        }
+    
     @staticmethod
     async def process_audio(audio_id: str) -> dict:
         """
         Process audio: transcribe, enhance, and calculate score.
         
+        The running status is written up front so it can be polled, and all
+        results are written together in a single partial update at the end.
+        
         Args:
             audio_id: Audio document ID
             
         Returns:
             Dictionary with transcript, enhanced_transcript, and score
         """
+        audio = None
         try:
             audio = await Audio.get(audio_id)
             if not audio:
@@ -229,52 +290,230 @@ class AudioService:
             if not audio.whole_story:
                 raise Exception("Story content not found for audio")
             
-            # Transcribe audio
-            transcript = await AudioService.transcribe_audio(audio.file_path)
+            await audio.set({
+                Audio.processing_status: PROCESSING_RUNNING,
+                Audio.processing_error: None,
+                Audio.processing_updated_at: datetime.utcnow()
+            })
             
-            # Update transcript in database
-            audio.transcript = transcript
-            await audio.save()
-            
-            # Enhance transcript
-            enhanced_transcript = await AudioService.enhance_transcript(
-                transcript,
-                audio.whole_story
-            )
-            
-            # Calculate Word Error Rate (WER) using enhanced transcript
-            # Enhanced transcript has context-aware corrections applied
-            error_rate = wer(audio.whole_story, enhanced_transcript)
+            # Keep the job fresh while it runs so it is not taken for a lost one
+            heartbeat = asyncio.create_task(AudioService._heartbeat(audio))
+            try:
+                # Transcribe audio
+                transcript = await AudioService.transcribe_audio(audio.file_path)
+                
+                # Enhancement is a network call and the analyses only need the raw
+                # transcript, so run them together with the CPU work off the event loop
+                enhanced_transcript, punctuation_analysis, highlighted_diff = await asyncio.gather(
+                    AudioService.enhance_transcript(transcript, audio.whole_story),
+                    asyncio.to_thread(AudioService.analyze_punctuation, transcript, audio.whole_story),
+                    asyncio.to_thread(AudioService.highlight_differences, audio.whole_story, transcript)
+                )
+                
+                # Calculate Word Error Rate (WER) using enhanced transcript
+                # Enhanced transcript has context-aware corrections applied
+                error_rate = await asyncio.to_thread(wer, audio.whole_story, enhanced_transcript)
+            finally:
+                heartbeat.cancel()
             
             # Convert to score (0-100)
             score = max(0, 100 - (100 * error_rate))
             
-            # Update audio document
-            audio.score = score
-            await audio.save()
-            
-            # Perform punctuation analysis
-            punctuation_analysis = AudioService.analyze_punctuation(transcript, audio.whole_story)
-            
-            # Generate highlighted differences
-            highlighted_diff = AudioService.highlight_differences(audio.whole_story, transcript)
+            # Save all results with one $set instead of rewriting the document per stage
+            await audio.set({
+                Audio.transcript: transcript,
+                Audio.enhanced_transcript: enhanced_transcript,
+                Audio.score: score,
+                Audio.punctuation_analysis: punctuation_analysis,
+                Audio.highlighted_diff: highlighted_diff,
+                Audio.processing_status: PROCESSING_COMPLETED,
+                Audio.processing_updated_at: datetime.utcnow()
+            })
             
             logger.info(f"Audio processed: {audio_id}, score: {score:.2f}")
             
-            return {
-                "transcript": transcript,
-                "enhanced_transcript": enhanced_transcript,
-                "score": score,
-                "punctuation_analysis": punctuation_analysis,
-                "highlighted_diff": highlighted_diff
-            }
+            return AudioService._processing_result(audio)
             
         except NotFoundError:
             raise
         except Exception as e:
             logger.error(f"Error processing audio: {e}")
+            if audio is not None:
+                await AudioService._mark_failed(audio, str(e))
             raise Exception(f"Failed to process audio: {str(e)}")
     
+    @staticmethod
+    async def _heartbeat(audio: Audio) -> None:
+        """Refresh processing_updated_at until cancelled; failures are only logged."""
+        while True:
+            await asyncio.sleep(PROCESSING_HEARTBEAT_INTERVAL.total_seconds())
+            try:
+                await Audio.find_one(
+                    Audio.id == audio.id,
+                    Audio.processing_status == PROCESSING_RUNNING
+                ).update(Set({Audio.processing_updated_at: datetime.utcnow()}))
+            except Exception as e:
+                logger.warning(f"Error updating audio processing heartbeat for {audio.id}: {e}")
+    
+    @staticmethod
+    async def _mark_failed(audio: Audio, error: str) -> None:
+        """Record a processing failure so pollers stop waiting and the job can be queued again."""
+        try:
+            await audio.set({
+                Audio.processing_status: PROCESSING_FAILED,
+                Audio.processing_error: error,
+                Audio.processing_updated_at: datetime.utcnow()
+            })
+        except Exception as e:
+            logger.error(f"Error recording audio processing failure for {audio.id}: {e}")
+    
+    @staticmethod
+    def _is_active(audio: Audio) -> bool:
+        """Whether a processing job is pending or running and not yet stale."""
+        return (
+            audio.processing_status in PROCESSING_ACTIVE
+            and audio.processing_updated_at is not None
+            and datetime.utcnow() - audio.processing_updated_at < PROCESSING_STALE_AFTER
+        )
+    
+    @staticmethod
+    async def _claim(audio_id: str) -> Optional[Audio]:
+        """
+        Atomically mark audio as pending unless a live job or results exist.
+        
+        Returns:
+            The claimed audio document, or None if it is already being
+            processed, already processed, or does not exist
+        """
+        stale_before = datetime.utcnow() - PROCESSING_STALE_AFTER
+        return await Audio.find_one(
+            Audio.id == PydanticObjectId(audio_id),
+            Or(
+                NotIn(Audio.processing_status, [*PROCESSING_ACTIVE, PROCESSING_COMPLETED]),
+                And(
+                    In(Audio.processing_status, list(PROCESSING_ACTIVE)),
+                    Or(
+                        Audio.processing_updated_at == None,
+                        LT(Audio.processing_updated_at, stale_before)
+                    )
+                )
+            )
+        ).update(
+            Set({
+                Audio.processing_status: PROCESSING_PENDING,
+                Audio.processing_error: None,
+                Audio.processing_updated_at: datetime.utcnow()
+            }),
+            response_type=UpdateResponse.NEW_DOCUMENT
+        )
+    
+    @staticmethod
+    async def get_or_process_audio(audio_id: str) -> dict:
+        """
+        Return stored processing results, processing the audio inline if needed.
+        
+        Audio that is already being processed is not processed again; its job
+        status is returned instead.
+        
+        Args:
+            audio_id: Audio document ID
+            
+        Returns:
+            Dictionary with transcript, enhanced_transcript, and score (plus
+            jobId, status and error while a job is in progress)
+        """
+        audio = await Audio.get(audio_id)
+        if not audio:
+            raise NotFoundError("Audio not found")
+        if audio.processing_status == PROCESSING_COMPLETED:
+            return AudioService._processing_result(audio)
+        if await AudioService._claim(audio_id) is None:
+            # A live job holds the audio, or one finished since the read
+            audio = await Audio.get(audio_id)
+            if audio.processing_status == PROCESSING_COMPLETED:
+                return AudioService._processing_result(audio)
+            return AudioService._processing_status(audio)
+        return await AudioService.process_audio(audio_id)
+    
+    @staticmethod
+    async def start_processing(audio_id: str) -> Tuple[dict, bool]:
+        """
+        Queue background processing for an audio file.
+        
+        Args:
+            audio_id: Audio document ID
+            
+        Returns:
+            Tuple of (job status, whether a new job was queued). Audio that is
+            already queued, running or processed is not queued again; stale
+            jobs are.
+        """
+        try:
+            # Claim and status check are one find_one_and_update, so concurrent
+            # requests cannot both queue the job
+            claimed = await AudioService._claim(audio_id)
+            if claimed is not None:
+                return AudioService._processing_status(claimed), True
+            
+            audio = await Audio.get(audio_id)
+            if not audio:
+                raise NotFoundError("Audio not found")
+            return AudioService._processing_status(audio), False
+            
+        except NotFoundError:
+            raise
+        except Exception as e:
+            logger.error(f"Error queueing audio processing: {e}")
+            raise Exception(f"Failed to queue audio processing: {str(e)}")
+    
+    @staticmethod
+    async def run_processing(audio_id: str) -> None:
+        """
+        Background task: process audio; process_audio records failures on the document.
+        
+        Args:
+            audio_id: Audio document ID
+        """
+        try:
+            await AudioService.process_audio(audio_id)
+        except Exception as e:
+            logger.error(f"Background audio processing failed for {audio_id}: {e}")
+    
+    @staticmethod
+    def _processing_status(audio: Audio) -> dict:
+        """Build the job status payload, including any partial results."""
+        status, error = audio.processing_status, audio.processing_error
+        if status in PROCESSING_ACTIVE and not AudioService._is_active(audio):
+            status, error = PROCESSING_FAILED, PROCESSING_STALE_ERROR
+        return {
+            "jobId": str(audio.id),
+            "status": status,
+            "error": error,
+            **AudioService._processing_result(audio)
+        }
+    
+    @staticmethod
+    async def get_processing_status(audio_id: str) -> dict:
+        """
+        Get background processing status and results so far.
+        
+        Args:
+            audio_id: Audio document ID
+            
+        Returns:
+            Dictionary with jobId, status, error and any stored results
+        """
+        try:
+            audio = await Audio.get(audio_id)
+            if not audio:
+                raise NotFoundError("Audio not found")
+            return AudioService._processing_status(audio)
+        except NotFoundError:
+            raise
+        except Exception as e:
+            logger.error(f"Error getting audio processing status: {e}")
+            raise Exception(f"Failed to get audio processing status: {str(e)}")
+    
     @staticmethod
     async def get_audio_feedback(audio_id: str) -> dict:
         """
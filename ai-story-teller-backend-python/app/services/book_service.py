@@ -1,41 +1,48 @@
 """Book service for file upload, processing, and indexing."""
+import asyncio
 import io
 import os
 import uuid
-from typing import Optional, Tuple
+from datetime import datetime
+from typing import Iterator, Optional, Tuple
 from fastapi import UploadFile
-import boto3
 from botocore.exceptions import ClientError
-from PyPDF2 import PdfReader
 import ebooklib
 from ebooklib import epub
-from bs4 import BeautifulSoup
+from lxml import etree, html as lxml_html
 
 from app.config import settings
 from app.schemas.book import Book
-from app.models.book import BookResponse, UploadBookMetadata
+from app.models.book import BookResponse, UploadBookMetadata, UploadSessionResponse
 from app.services.rag_service import rag_service
+from app.utils.background import run_in_background
 from app.utils.logger import logger
+from app.utils.pdf import extract_pdf_text
+from app.utils.s3_client import UPLOAD_TRANSFER_CONFIG, s3_client
 from bson import ObjectId
+from charset_normalizer import from_bytes
 
 
 # File upload constants
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_EXTENSIONS = {'.pdf', '.txt', '.epub'}
+EPUB_SKIPPED_TAGS = ('script', 'style', 'nav')  # Elements holding no chapter prose
+ENCODING_SAMPLE_SIZE = 64 * 1024  # Bytes sniffed to detect non-UTF-8 text encodings
+
+# Direct-to-S3 uploads: presigned PUT lifetime (seconds) and the status of
+# books whose file has not been finalized yet
+PRESIGNED_UPLOAD_EXPIRY = 900
+UPLOAD_PENDING = "pending"
 
 
 class BookService:
     """Service for managing book uploads and processing."""
     
     def __init__(self):
-        """Initialize S3 client."""
-        self.s3_client = boto3.client(
-            's3',
-            aws_access_key_id=settings.aws_access_key_id,
-            aws_secret_access_key=settings.aws_secret_access_key,
-            region_name=settings.aws_region
-        )
+        """Initialize S3 client (shares the app-wide boto3 connection pool)."""
+        self.s3_client = s3_client.s3_client
         self.bucket_name = settings.s3_bucket_name
+        self.url_prefix = s3_client.url_prefix
     
     def _validate_file(self, file: UploadFile) -> None:
         """
@@ -47,47 +54,65 @@ class BookService:
         Raises:
             ValueError: If file is invalid
         """
-        # Check file extension
-        file_ext = os.path.splitext(file.filename)[1].lower()
+        self._get_file_type(file.filename)
+    
+    def _get_file_type(self, file_name: str) -> str:
+        """
+        Get a file's extension, checking it is an allowed type.
+        
+        Raises:
+            ValueError: If the file type is not allowed
+        """
+        file_ext = os.path.splitext(file_name)[1].lower()
         if file_ext not in ALLOWED_EXTENSIONS:
             raise ValueError(
                 f"Invalid file type. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
             )
+        return file_ext
+    
+    def _check_file_size(self, file: UploadFile) -> int:
+        """
+        Check an upload's size without reading it into memory.
+        
+        Returns:
+            File size in bytes
+            
+        Raises:
+            ValueError: If the file is too large
+        """
+        file.file.seek(0, os.SEEK_END)
+        file_size = file.file.tell()
+        file.file.seek(0)
+        
+        if file_size > MAX_FILE_SIZE:
+            raise ValueError(f"File size exceeds {MAX_FILE_SIZE / (1024*1024)}MB limit")
+        return file_size
     
-    async def _upload_to_s3(self, file: UploadFile, object_key: str) -> str:
+    async def _upload_to_s3(self, file_content: bytes, object_key: str, content_type: Optional[str]) -> str:
         """
-        Upload file to S3.
+        Upload file bytes to S3.
         
         Args:
-            file: File to upload
+            file_content: File bytes, already read from the upload
             object_key: S3 object key
+            content_type: MIME type of the file
             
         Returns:
             S3 URL of uploaded file
         """
         try:
-            # Read file content
-            file_content = await file.read()
-            
-            # Check file size
-            if len(file_content) > MAX_FILE_SIZE:
-                raise ValueError(f"File size exceeds {MAX_FILE_SIZE / (1024*1024)}MB limit")
-            
-            # Upload to S3
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=object_key,
-                Body=file_content,
-                ContentType=file.content_type or 'application/octet-stream'
+            # Upload from the bytes in memory rather than re-reading the spooled file
+            await asyncio.to_thread(
+                self.s3_client.upload_fileobj,
+                io.BytesIO(file_content),
+                self.bucket_name,
+                object_key,
+                ExtraArgs={"ContentType": content_type or 'application/octet-stream'},
+                Config=UPLOAD_TRANSFER_CONFIG
             )
             
             # Generate URL
-            file_url = f"https://{self.bucket_name}.s3.{settings.aws_region}.amazonaws.com/{object_key}"
-            
-            # Reset file pointer for text extraction
-            await file.seek(0)
-            
-            return file_url, len(file_content)
+            return self.url_prefix + object_key
             
         except ClientError as e:
             logger.error(f"S3 upload error: {e}")
@@ -96,16 +121,7 @@ class BookService:
     def _extract_text_from_pdf(self, file_content: bytes) -> str:
         """Extract text from PDF file."""
         try:
-            pdf_file = io.BytesIO(file_content)
-            pdf_reader = PdfReader(pdf_file)
-            
-            text_parts = []
-            for page in pdf_reader.pages:
-                text = page.extract_text()
-                if text:
-                    text_parts.append(text)
-            
-            return "\n\n".join(text_parts)
+            return extract_pdf_text(file_content)
         except Exception as e:
             logger.error(f"PDF text extraction error: {e}")
             raise Exception(f"Failed to extract text from PDF: {str(e)}")
@@ -115,49 +131,49 @@ class BookService:
         try:
             book = epub.read_epub(io.BytesIO(file_content))
             
-            text_parts = []
-            for item in book.get_items():
-                if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                    content = item.get_content()
-                    soup = BeautifulSoup(content, 'html.parser')
-                    text = soup.get_text()
-                    if text.strip():
-                        text_parts.append(text)
-            
-            return "\n\n".join(text_parts)
+            return "\n\n".join(self._epub_chapter_texts(book))
         except Exception as e:
             logger.error(f"EPUB text extraction error: {e}")
             raise Exception(f"Failed to extract text from EPUB: {str(e)}")
     
+    def _epub_chapter_texts(self, book: epub.EpubBook) -> Iterator[str]:
+        """Yield the text of each non-empty chapter, parsing one chapter at a time."""
+        for item in book.get_items_of_type(ebooklib.ITEM_DOCUMENT):
+            # The navigation document is only a table of contents
+            if isinstance(item, epub.EpubNav):
+                continue
+            content = item.get_content()
+            # isspace() checks without copying the chapter like strip() would
+            if not content or content.isspace():
+                continue
+            tree = lxml_html.fromstring(content)
+            etree.strip_elements(tree, *EPUB_SKIPPED_TAGS, with_tail=False)
+            text = tree.text_content()
+            if text and not text.isspace():
+                yield text
+    
     def _extract_text_from_txt(self, file_content: bytes) -> str:
         """Extract text from TXT file."""
         try:
-            # Try different encodings
-            for encoding in ['utf-8', 'latin-1', 'cp1252']:
-                try:
-                    return file_content.decode(encoding)
-                except UnicodeDecodeError:
-                    continue
-            
-            # If all fail, use utf-8 with error handling
-            return file_content.decode('utf-8', errors='ignore')
+            # Pure ASCII is the common case; isascii() stops at the first high byte
+            if file_content.isascii():
+                return file_content.decode('ascii')
+            
+            # Most other uploads are UTF-8, which decodes in a single C pass
+            try:
+                return file_content.decode('utf-8')
+            except UnicodeDecodeError:
+                pass
+            
+            # Otherwise detect the encoding from a sample instead of guessing
+            best = from_bytes(file_content[:ENCODING_SAMPLE_SIZE]).best()
+            return file_content.decode(best.encoding if best else 'cp1252', errors='replace')
         except Exception as e:
             logger.error(f"TXT text extraction error: {e}")
             raise Exception(f"Failed to extract text from TXT: {str(e)}")
     
-    async def extract_text(self, file: UploadFile, file_type: str) -> str:
-        """
-        Extract text content from uploaded file.
-        
-        Args:
-            file: Uploaded file
-            file_type: File extension
-            
-        Returns:
-            Extracted text content
-        """
-        file_content = await file.read()
-        
+    def _extract_text_from_content(self, file_content: bytes, file_type: str) -> str:
+        """Extract text from file bytes by type (CPU-bound, run off the event loop)."""
         if file_type == '.pdf':
             text = self._extract_text_from_pdf(file_content)
         elif file_type == '.epub':
@@ -167,9 +183,6 @@ class BookService:
         else:
             raise ValueError(f"Unsupported file type: {file_type}")
         
-        # Reset file pointer
-        await file.seek(0)
-        
         return text.strip()
     
     async def upload_book(
@@ -202,12 +215,16 @@ class BookService:
             unique_id = str(uuid.uuid4())
             object_key = f"books/{user_id}/{unique_id}{file_type}"
             
-            # Upload to S3
-            file_url, file_size = await self._upload_to_s3(file, object_key)
+            # Reject oversized files before reading anything, then read them once
+            file_size = self._check_file_size(file)
+            file_content = await file.read()
             
-            # Extract text content
-            logger.info(f"Extracting text from {file.filename}")
-            text_content = await self.extract_text(file, file_type)
+            # Upload to S3 while extracting text content from the same bytes
+            logger.info(f"Uploading and extracting text from {file.filename}")
+            file_url, text_content = await asyncio.gather(
+                self._upload_to_s3(file_content, object_key, file.content_type),
+                asyncio.to_thread(self._extract_text_from_content, file_content, file_type)
+            )
             
             if not text_content:
                 raise ValueError("No text content could be extracted from the file")
@@ -230,95 +247,258 @@ class BookService:
             
             await book.insert()
             
-            # Index in ChromaDB asynchronously
-            try:
-                logger.info(f"Indexing book {book.id} in vector database")
-                await rag_service.add_book_to_index(
-                    book_id=str(book.id),
-                    book_title=book_title,
-                    book_author=book_author,
-                    book_content=text_content,
-                    user_id=user_id,
-                    child_age=child_age
-                )
-                
-                # Update indexing status
-                book.is_indexed = True
-                await book.save()
-                
-            except Exception as e:
-                logger.error(f"Failed to index book in vector DB: {e}")
-                # Don't fail the upload, just log the error
+            # Index for RAG after responding; the book is stored without it
+            run_in_background(self._index_book(book, text_content))
             
             logger.info(f"Book uploaded successfully: {book.id}")
             
-            return BookResponse(
-                id=str(book.id),
+            return self._to_response(book)
+            
+        except Exception as e:
+            logger.error(f"Error uploading book: {e}")
+            raise
+    
+    async def _index_book(self, book: Book, text_content: str) -> None:
+        """Index a saved book's text in ChromaDB and mark it indexed; failures are only logged."""
+        try:
+            logger.info(f"Indexing book {book.id} in vector database")
+            await rag_service.add_book_to_index(
+                book_id=str(book.id),
                 book_title=book.book_title,
                 book_author=book.book_author,
-                file_url=book.file_url,
-                file_type=book.file_type,
-                file_size=book.file_size,
-                uploaded_by=str(book.uploaded_by),
-                child_age=book.child_age,
-                is_indexed=book.is_indexed,
-                upload_date=book.upload_date,
-                updated_at=book.updated_at
+                book_content=text_content,
+                user_id=str(book.uploaded_by),
+                child_age=book.child_age
             )
             
+            # Only the indexing status changes, so update just that field
+            await book.set({Book.is_indexed: True})
+            
         except Exception as e:
-            logger.error(f"Error uploading book: {e}")
+            logger.error(f"Failed to index book in vector DB: {e}")
+            # Don't fail the upload, just log the error
+    
+    def _to_response(self, book: Book) -> BookResponse:
+        """Convert a book document to its response model."""
+        return BookResponse(
+            id=str(book.id),
+            book_title=book.book_title,
+            book_author=book.book_author,
+            file_url=book.file_url,
+            file_type=book.file_type,
+            file_size=book.file_size,
+            uploaded_by=str(book.uploaded_by),
+            child_age=book.child_age,
+            is_indexed=book.is_indexed,
+            upload_date=book.upload_date,
+            updated_at=book.updated_at
+        )
+    
+    async def create_upload_session(
+        self,
+        file_name: str,
+        file_size: int,
+        content_type: Optional[str],
+        user_id: str,
+        child_age: int,
+        metadata: Optional[UploadBookMetadata] = None
+    ) -> UploadSessionResponse:
+        """
+        Start a direct-to-S3 upload: create a pending book and presign a PUT for its file.
+        
+        Args:
+            file_name: Original file name
+            file_size: File size in bytes, enforced by the presigned URL
+            content_type: File MIME type
+            user_id: User ID
+            child_age: Child's age
+            metadata: Optional book metadata
+            
+        Returns:
+            Book ID and presigned upload URL
+        """
+        try:
+            file_type = self._get_file_type(file_name)
+            if file_size > MAX_FILE_SIZE:
+                raise ValueError(f"File size exceeds {MAX_FILE_SIZE / (1024*1024)}MB limit")
+            
+            object_key = f"books/{user_id}/{uuid.uuid4()}{file_type}"
+            content_type = content_type or 'application/octet-stream'
+            
+            book = Book(
+                book_title=metadata.book_title if metadata and metadata.book_title else file_name,
+                book_author=metadata.book_author if metadata else None,
+                file_url=self.url_prefix + object_key,
+                file_type=file_type.replace('.', ''),
+                file_size=file_size,
+                uploaded_by=ObjectId(user_id),
+                child_age=child_age,
+                is_indexed=False,
+                upload_status=UPLOAD_PENDING
+            )
+            await book.insert()
+            
+            # Content length is part of the signature, so S3 rejects any other size
+            upload_url = self.s3_client.generate_presigned_url(
+                'put_object',
+                Params={
+                    'Bucket': self.bucket_name,
+                    'Key': object_key,
+                    'ContentType': content_type,
+                    'ContentLength': file_size
+                },
+                ExpiresIn=PRESIGNED_UPLOAD_EXPIRY
+            )
+            
+            return UploadSessionResponse(
+                book_id=str(book.id),
+                upload_url=upload_url,
+                content_type=content_type,
+                expires_in=PRESIGNED_UPLOAD_EXPIRY
+            )
+            
+        except Exception as e:
+            logger.error(f"Error creating upload session: {e}")
+            raise
+    
+    async def finalize_upload(self, book_id: str, user_id: str) -> BookResponse:
+        """
+        Finish a direct-to-S3 upload: extract and index the uploaded file.
+        
+        Args:
+            book_id: Book ID from create_upload_session
+            user_id: User ID (for authorization)
+            
+        Returns:
+            Finalized book response
+            
+        Raises:
+            ValueError: If the book is not a pending upload of this user, or has no text
+        """
+        try:
+            book = await Book.get(book_id)
+            if not book or str(book.uploaded_by) != user_id:
+                raise ValueError("Book not found")
+            if book.upload_status != UPLOAD_PENDING:
+                raise ValueError("Book upload already finalized")
+            
+            object_key = book.file_url.split('.amazonaws.com/', 1)[1]
+            try:
+                s3_object = await asyncio.to_thread(
+                    self.s3_client.get_object,
+                    Bucket=self.bucket_name,
+                    Key=object_key
+                )
+            except ClientError as e:
+                logger.warning(f"Uploaded file not found in S3: {e}")
+                raise ValueError("File has not been uploaded")
+            
+            if s3_object["ContentLength"] > MAX_FILE_SIZE:
+                raise ValueError(f"File size exceeds {MAX_FILE_SIZE / (1024*1024)}MB limit")
+            file_content = await asyncio.to_thread(s3_object["Body"].read)
+            
+            text_content = await asyncio.to_thread(
+                self._extract_text_from_content, file_content, f".{book.file_type}"
+            )
+            if not text_content:
+                raise ValueError("No text content could be extracted from the file")
+            
+            book.file_size = len(file_content)
+            book.upload_status = None
+            book.updated_at = datetime.utcnow()
+            await book.save()
+            
+            run_in_background(self._index_book(book, text_content))
+            
+            logger.info(f"Book upload finalized: {book.id}")
+            return self._to_response(book)
+            
+        except Exception as e:
+            logger.error(f"Error finalizing book upload: {e}")
             raise
     
+    def _encode_cursor(self, book: Book) -> str:
+        """Encode a book's sort position as an opaque pagination cursor."""
+        return f"{book.upload_date.isoformat()}|{book.id}"
+    
+    def _decode_cursor(self, cursor: str) -> dict:
+        """
+        Build the filter matching books after a cursor in (upload_date, _id) descending order.
+        
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        try:
+            upload_date, book_id = cursor.split("|", 1)
+            upload_date = datetime.fromisoformat(upload_date)
+            book_id = ObjectId(book_id)
+        except Exception:
+            raise ValueError("Invalid cursor")
+        return {
+            "$or": [
+                {"upload_date": {"$lt": upload_date}},
+                {"upload_date": upload_date, "_id": {"$lt": book_id}}
+            ]
+        }
+    
     async def get_user_books(
         self,
         user_id: str,
         page: int = 1,
-        limit: int = 20
-    ) -> Tuple[list[BookResponse], int]:
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Tuple[list[BookResponse], int, Optional[str]]:
         """
         Get all books for a user.
         
+        The page and the total count are fetched in a single `$facet`
+        aggregation. When `cursor` is given it replaces `page`, seeking past
+        the previous page instead of skipping over it.
+        
         Args:
             user_id: User ID
             page: Page number
             limit: Items per page
+            cursor: Cursor returned with the previous page
             
         Returns:
-            Tuple of (books list, total count)
+            Tuple of (books list, total count, next page cursor)
         """
         try:
             user_object_id = ObjectId(user_id)
             
-            # Get total count
-            total = await Book.find(Book.uploaded_by == user_object_id).count()
-            
-            # Get paginated books
-            skip = (page - 1) * limit
-            books = await Book.find(
-                Book.uploaded_by == user_object_id
-            ).sort(-Book.upload_date).skip(skip).limit(limit).to_list()
+            data_stage = []
+            if cursor:
+                data_stage.append({"$match": self._decode_cursor(cursor)})
+            data_stage.append({"$sort": {"upload_date": -1, "_id": -1}})
+            if not cursor:
+                data_stage.append({"$skip": (page - 1) * limit})
+            data_stage.append({"$limit": limit})
+            
+            # Get paginated books and total count in one round trip
+            # Pending direct uploads have no file yet, so they are not listed
+            results = await Book.find(
+                Book.uploaded_by == user_object_id,
+                Book.upload_status != UPLOAD_PENDING
+            ).aggregate([
+                {"$facet": {
+                    "data": data_stage,
+                    "total": [{"$count": "n"}]
+                }}
+            ]).to_list()
+            
+            facet = results[0] if results else {"data": [], "total": []}
+            books = [Book.model_validate(doc) for doc in facet["data"]]
+            total = facet["total"][0]["n"] if facet["total"] else 0
+            next_cursor = self._encode_cursor(books[-1]) if len(books) == limit else None
             
             # Convert to response models
-            book_responses = [
-                BookResponse(
-                    id=str(book.id),
-                    book_title=book.book_title,
-                    book_author=book.book_author,
-                    file_url=book.file_url,
-                    file_type=book.file_type,
-                    file_size=book.file_size,
-                    uploaded_by=str(book.uploaded_by),
-                    child_age=book.child_age,
-                    is_indexed=book.is_indexed,
-                    upload_date=book.upload_date,
-                    updated_at=book.updated_at
-                )
-                for book in books
-            ]
+            book_responses = [self._to_response(book) for book in books]
             
-            return book_responses, total
+            return book_responses, total, next_cursor
             
+        except ValueError:
+            raise
         except Exception as e:
             logger.error(f"Error getting user books: {e}")
             raise
@@ -350,7 +530,8 @@ class BookService:
                 url_parts = book.file_url.split('.amazonaws.com/')
                 if len(url_parts) > 1:
                     object_key = url_parts[1]
-                    self.s3_client.delete_object(
+                    await asyncio.to_thread(
+                        self.s3_client.delete_object,
                         Bucket=self.bucket_name,
                         Key=object_key
                     )
@@ -360,10 +541,13 @@ class BookService:
             # Delete from database
             await book.delete()
             
-            logger.info(f"Book deleted: {book_id}")
+            # Delete indexed chunks so they stop taking part in searches
+            try:
+                await rag_service.remove_book_from_index(str(book.id), user_id)
+            except Exception as e:
+                logger.warning(f"Failed to delete from vector database: {e}")
             
-            # Note: ChromaDB doesn't have easy deletion by metadata
-            # The old chunks will remain but won't match user_id queries
+            logger.info(f"Book deleted: {book_id}")
             
         except Exception as e:
             logger.error(f"Error deleting book: {e}")
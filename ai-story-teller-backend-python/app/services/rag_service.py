@@ -1,12 +1,37 @@
 """RAG (Retrieval-Augmented Generation) service using ChromaDB."""
+from array import array
 from typing import List, Dict, Optional
+from collections import OrderedDict
+import chromadb
 from langchain_openai import OpenAIEmbeddings
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 import os
+import asyncio
+import time
 from app.config import settings
+from app.utils.http_client import openai_http_client
 from app.utils.logger import logger
+from app.utils.tokens import EMBEDDING_ENCODING_NAME, count_embedding_tokens, get_encoding
+
+
+# Chunks embedded per OpenAI request; batches are indexed concurrently
+EMBEDDING_BATCH_SIZE = 100
+
+# Chunk size and overlap, in embedding tokens
+CHUNK_TOKENS = 512
+CHUNK_OVERLAP_TOKENS = 64
+
+# Seconds to wait for the startup warm-up embedding and search
+WARMUP_TIMEOUT = 10.0
+
+# Number of query embeddings kept in memory (about 12KB each)
+EMBEDDING_CACHE_SIZE = 4096
+
+# How long (seconds) and for how many keys "does this user have library docs" is cached
+LIBRARY_PRESENCE_TTL = 60
+LIBRARY_PRESENCE_CACHE_SIZE = 4096
 
 
 class RAGService:
@@ -17,82 +42,280 @@ class RAGService:
         try:
             # Initialize OpenAI embeddings
             self.embeddings = OpenAIEmbeddings(
-                openai_api_key=settings.openai_api_key
+                openai_api_key=settings.openai_api_key,
+                chunk_size=EMBEDDING_BATCH_SIZE,
+                max_retries=3,
+                request_timeout=30,
+                http_async_client=openai_http_client
             )
             
-            # Initialize ChromaDB vector store
-            os.makedirs(settings.chroma_db_path, exist_ok=True)
-            self.vector_store = Chroma(
-                persist_directory=settings.chroma_db_path,
-                embedding_function=self.embeddings
-            )
+            # Initialize ChromaDB vector store. A Chroma server keeps the HNSW
+            # index resident in one long-lived process shared by all workers,
+            # instead of every worker loading and persisting its own copy
+            if settings.chroma_host:
+                self.vector_store = Chroma(
+                    client=chromadb.HttpClient(host=settings.chroma_host, port=settings.chroma_port),
+                    embedding_function=self.embeddings
+                )
+            else:
+                os.makedirs(settings.chroma_db_path, exist_ok=True)
+                self.vector_store = Chroma(
+                    persist_directory=settings.chroma_db_path,
+                    embedding_function=self.embeddings
+                )
             
-            # Text splitter for chunking stories
+            # Text splitter for chunking stories, measured in embedding tokens so
+            # chunk sizes line up with what the embedding model actually sees
             self.text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200,
-                length_function=len
+                chunk_size=CHUNK_TOKENS,
+                chunk_overlap=CHUNK_OVERLAP_TOKENS,
+                length_function=count_embedding_tokens
             )
             
+            # Shared across all indexing jobs, so concurrent uploads together
+            # stay under the embeddings rate limit
+            self._embedding_slots = asyncio.Semaphore(settings.embedding_concurrency)
+            
+            # LRU of query -> embedding task; storing the task lets concurrent
+            # lookups for the same query share a single API call. Vectors are
+            # kept as packed doubles, a quarter of the size of a list of floats
+            self._embedding_cache: "OrderedDict[str, asyncio.Future[array]]" = OrderedDict()
+            
+            # (user_id, child_age, include_books, include_stories) -> (expires_at, has_docs)
+            self._library_presence: "OrderedDict[tuple, tuple]" = OrderedDict()
+            
             logger.info("RAG service initialized successfully")
         except Exception as e:
-            logger.error(f"Error initializing RAG service: {e}")
+            logger.error("Error initializing RAG service: %s", e)
             raise
     
+    async def warm_up(self) -> None:
+        """
+        Pay the one-off costs of the first retrieval at startup instead of on a user request.
+        
+        Loads the tokenizers, opens a connection to the embeddings API and
+        runs one vector search so Chroma loads its index. Failures are logged
+        and ignored so startup never depends on them.
+        """
+        try:
+            await asyncio.to_thread(get_encoding)
+            await asyncio.to_thread(get_encoding, EMBEDDING_ENCODING_NAME)
+            embedding = await asyncio.wait_for(self.embeddings.aembed_query("warm up"), WARMUP_TIMEOUT)
+            await asyncio.to_thread(self.vector_store.similarity_search_by_vector, embedding, k=1)
+            logger.info("RAG service warmed up")
+        except Exception as e:
+            logger.warning("RAG warm-up failed: %s", e)
+    
+    async def embed_query(self, query: str) -> List[float]:
+        """
+        Embed a search query, reusing cached embeddings for repeated queries.
+        
+        Args:
+            query: Search query string (normalized before embedding)
+            
+        Returns:
+            Query embedding vector
+        """
+        key = " ".join(query.lower().split())
+        task = self._embedding_cache.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._embed_packed(key))
+            self._embedding_cache[key] = task
+            task.add_done_callback(lambda done: self._forget_failed_embedding(key, done))
+            while len(self._embedding_cache) > EMBEDDING_CACHE_SIZE:
+                self._embedding_cache.popitem(last=False)
+        else:
+            self._embedding_cache.move_to_end(key)
+        
+        # Shield so one caller's cancellation does not cancel the shared request
+        return (await asyncio.shield(task)).tolist()
+    
+    def _forget_failed_embedding(self, key: str, task: "asyncio.Future[array]") -> None:
+        """Evict a cached embedding task that was cancelled or failed, so the next query retries."""
+        if task.cancelled() or task.exception() is not None:
+            if self._embedding_cache.get(key) is task:
+                del self._embedding_cache[key]
+    
+    async def _embed_packed(self, text: str) -> array:
+        """Embed text and pack the vector for caching."""
+        return array("d", await self.embeddings.aembed_query(text))
+    
+    @staticmethod
+    def _library_filter(
+        user_id: str,
+        child_age: int,
+        include_books: bool,
+        include_stories: bool
+    ) -> Optional[Dict]:
+        """Build the Chroma metadata filter for a user's library, or None if nothing is included."""
+        types = [
+            doc_type for doc_type, included in (("book", include_books), ("story", include_stories))
+            if included
+        ]
+        if not types:
+            return None
+        return {"$and": [
+            {"user_id": user_id},
+            {"child_age": child_age},
+            {"type": {"$in": types}}
+        ]}
+    
+    def _invalidate_library_presence(self, user_id: Optional[str]) -> None:
+        """Forget cached library presence for a user after their library changes."""
+        for key in [key for key in self._library_presence if key[0] == user_id]:
+            del self._library_presence[key]
+    
+    async def user_has_library(
+        self,
+        user_id: str,
+        child_age: int,
+        include_books: bool = True,
+        include_stories: bool = True
+    ) -> bool:
+        """
+        Check whether a user has any indexed library content, without embedding anything.
+        
+        Results are cached for LIBRARY_PRESENCE_TTL seconds and dropped
+        whenever a book or story is indexed for the user.
+        
+        Args:
+            user_id: User ID to check
+            child_age: Child's age the content must match
+            include_books: Whether books count
+            include_stories: Whether stories count
+            
+        Returns:
+            True if retrieval could return documents for the user
+        """
+        where = self._library_filter(user_id, child_age, include_books, include_stories)
+        if where is None:
+            return False
+        
+        key = (user_id, child_age, include_books, include_stories)
+        cached = self._library_presence.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            self._library_presence.move_to_end(key)
+            return cached[1]
+        
+        try:
+            # The Chroma client is synchronous, so query in a worker thread
+            result = await asyncio.to_thread(
+                self.vector_store.get,
+                where=where,
+                limit=1,
+                include=[]
+            )
+            has_docs = bool(result["ids"])
+        except Exception as e:
+            logger.warning("Library presence check failed, assuming content exists: %s", e)
+            return True
+        
+        self._library_presence[key] = (time.monotonic() + LIBRARY_PRESENCE_TTL, has_docs)
+        while len(self._library_presence) > LIBRARY_PRESENCE_CACHE_SIZE:
+            self._library_presence.popitem(last=False)
+        return has_docs
+    
+    async def _similarity_search(
+        self,
+        query: str,
+        k: int,
+        where: Optional[Dict] = None
+    ) -> List[Document]:
+        """Run a similarity search using the cached query embedding, optionally pre-filtered by metadata."""
+        embedding = await self.embed_query(query)
+        # The Chroma client is synchronous, so search in a worker thread
+        return await asyncio.to_thread(
+            self.vector_store.similarity_search_by_vector,
+            embedding,
+            k=k,
+            filter=where
+        )
+    
+    async def _add_chunks(
+        self,
+        doc_id: str,
+        chunks: List[str],
+        base_metadata: Dict,
+        chunk_metadatas: Optional[List[Dict]] = None
+    ) -> None:
+        """
+        Embed and store a document's chunks in concurrent batches so request round trips overlap.
+        
+        Chunks get deterministic ids (`<doc_id>:<chunk_index>`), so re-indexing
+        a document upserts its chunks instead of duplicating them.
+        `chunk_metadatas`, if given, adds per-chunk metadata (e.g. the page number).
+        """
+        ids = [f"{doc_id}:{i}" for i in range(len(chunks))]
+        metadatas = [{**base_metadata, "chunk_index": i} for i in range(len(chunks))]
+        if chunk_metadatas:
+            for chunk_metadata, extra in zip(metadatas, chunk_metadatas):
+                chunk_metadata.update(extra)
+        await asyncio.gather(*(
+            self._add_batch(
+                chunks[i:i + EMBEDDING_BATCH_SIZE],
+                metadatas[i:i + EMBEDDING_BATCH_SIZE],
+                ids[i:i + EMBEDDING_BATCH_SIZE]
+            )
+            for i in range(0, len(chunks), EMBEDDING_BATCH_SIZE)
+        ))
+    
+    async def _add_batch(self, texts: List[str], metadatas: List[Dict], ids: List[str]) -> None:
+        """Embed and store one batch once an embedding slot is free."""
+        async with self._embedding_slots:
+            await self.vector_store.aadd_texts(texts, metadatas, ids=ids)
+    
     async def add_story_to_index(
         self,
         story_id: str,
         story_title: str,
         story_description: str,
-        story_content: str,
+        story_pages: List[str],
         child_age: int,
         metadata: Optional[Dict] = None
     ) -> None:
         """
         Index a story for RAG retrieval.
         
+        The title and description form the first chunk and each page is
+        indexed on its own (split further only if it exceeds a chunk), so
+        retrieved chunks map to pages.
+        
         Args:
             story_id: Unique story identifier
             story_title: Story title
             story_description: Story description
-            story_content: Full story content text
+            story_pages: Text of each story page, in order
             child_age: Child's age for filtering
             metadata: Additional metadata to store
         """
         try:
-            # Combine story content
-            full_text = f"Title: {story_title}\n\nDescription: {story_description}\n\nContent: {story_content}"
-            
-            # Split into chunks
-            chunks = self.text_splitter.split_text(full_text)
+            # Splitting is CPU-bound, so run it in a worker thread
+            page_chunks = await asyncio.to_thread(
+                lambda: [self.text_splitter.split_text(page) for page in story_pages]
+            )
+            chunks = [f"Title: {story_title}\n\nDescription: {story_description}"]
+            chunk_metadatas = [{"page": 0}]
+            for page_number, page in enumerate(page_chunks, start=1):
+                chunks.extend(page)
+                chunk_metadatas.extend({"page": page_number} for _ in page)
             
-            # Create documents with metadata
-            documents = []
-            for i, chunk in enumerate(chunks):
-                doc_metadata = {
-                    "story_id": story_id,
-                    "story_title": story_title,
-                    "child_age": child_age,
-                    "chunk_index": i,
-                    "type": "story"
-                }
-                if metadata:
-                    doc_metadata.update(metadata)
-                
-                documents.append(
-                    Document(
-                        page_content=chunk,
-                        metadata=doc_metadata
-                    )
-                )
+            # Metadata shared by every chunk; _add_chunks adds the chunk index
+            base_metadata = {
+                "story_id": story_id,
+                "story_title": story_title,
+                "child_age": child_age,
+                "type": "story"
+            }
+            if metadata:
+                base_metadata.update(metadata)
             
             # Add to vector store
-            self.vector_store.add_documents(documents)
-
+            await self._add_chunks(story_id, chunks, base_metadata, chunk_metadatas)
+            self._invalidate_library_presence((metadata or {}).get("user_id"))
             
-            logger.info(f"Story indexed: {story_id} ({len(chunks)} chunks)")
+            logger.info("Story indexed: %s (%d chunks)", story_id, len(chunks))
         except Exception as e:
-            logger.error(f"Error indexing story: {e}")
+            logger.error("Error indexing story: %s", e)
             raise
     
     async def add_book_to_index(
@@ -122,40 +345,44 @@ class RAGService:
             author_text = f"Author: {book_author}\n\n" if book_author else ""
             full_text = f"Title: {book_title}\n\n{author_text}Content: {book_content}"
             
-            # Split into chunks
-            chunks = self.text_splitter.split_text(full_text)
+            # Split into chunks; splitting is CPU-bound, so run it in a worker thread
+            chunks = await asyncio.to_thread(self.text_splitter.split_text, full_text)
             
-            # Create documents with metadata
-            documents = []
-            for i, chunk in enumerate(chunks):
-                doc_metadata = {
-                    "book_id": book_id,
-                    "book_title": book_title,
-                    "user_id": user_id,
-                    "child_age": child_age,
-                    "chunk_index": i,
-                    "type": "book"
-                }
-                if book_author:
-                    doc_metadata["book_author"] = book_author
-                if metadata:
-                    doc_metadata.update(metadata)
-                
-                documents.append(
-                    Document(
-                        page_content=chunk,
-                        metadata=doc_metadata
-                    )
-                )
+            # Metadata shared by every chunk; _add_chunks adds the chunk index
+            base_metadata = {
+                "book_id": book_id,
+                "book_title": book_title,
+                "user_id": user_id,
+                "child_age": child_age,
+                "type": "book"
+            }
+            if book_author:
+                base_metadata["book_author"] = book_author
+            if metadata:
+                base_metadata.update(metadata)
             
             # Add to vector store
-            self.vector_store.add_documents(documents)
-
+            await self._add_chunks(book_id, chunks, base_metadata)
+            self._invalidate_library_presence(user_id)
             
-            logger.info(f"Book indexed: {book_id} ({len(chunks)} chunks)")
+            logger.info("Book indexed: %s (%d chunks)", book_id, len(chunks))
         except Exception as e:
-            logger.error(f"Error indexing book: {e}")
+            logger.error("Error indexing book: %s", e)
             raise
+    
+    async def remove_book_from_index(self, book_id: str, user_id: str) -> None:
+        """
+        Delete all of a book's chunks from the vector store.
+        
+        Args:
+            book_id: Book identifier the chunks were indexed under
+            user_id: User ID who uploaded the book
+        """
+        # The Chroma client is synchronous, so delete in a worker thread
+        await asyncio.to_thread(self.vector_store.delete, where={"book_id": book_id})
+        self._invalidate_library_presence(user_id)
+        
+        logger.info("Book removed from index: %s", book_id)
 
     
     async def retrieve_similar_stories(
@@ -178,31 +405,19 @@ class RAGService:
             List of similar story documents
         """
         try:
-            # Build metadata filter
+            # Build metadata filter; Chroma needs multiple conditions wrapped in $and
             search_filters = {"child_age": child_age, "type": "story"}
             if filters:
                 search_filters.update(filters)
+            where = {"$and": [{key: value} for key, value in search_filters.items()]}
             
-            # Perform similarity search
-            # Note: ChromaDB filter syntax may vary - adjust as needed
-            results = self.vector_store.similarity_search(
-                query,
-                k=top_k
-            )
-            
-            # Filter by metadata (ChromaDB may handle this differently)
-            # For now, filter results manually
-            filtered_results = [
-                doc for doc in results
-                if doc.metadata.get("child_age") == child_age
-                and doc.metadata.get("type") == "story"
-            ]
+            results = await self._similarity_search(query, k=top_k, where=where)
             
-            logger.info(f"Retrieved {len(filtered_results)} similar stories for query")
-            return filtered_results[:top_k]
+            logger.info("Retrieved %d similar stories for query", len(results))
+            return results
             
         except Exception as e:
-            logger.error(f"Error retrieving similar stories: {e}")
+            logger.error("Error retrieving similar stories: %s", e)
             return []
     
     async def retrieve_educational_context(
@@ -224,20 +439,13 @@ class RAGService:
         """
         try:
             query = f"Educational content for {age_group} year old about {topic}"
-            results = self.vector_store.similarity_search(
+            return await self._similarity_search(
                 query,
-                k=top_k
+                k=top_k,
+                where={"type": "educational_content"}
             )
-            
-            # Filter by type if educational content is indexed
-            educational_results = [
-                doc for doc in results
-                if doc.metadata.get("type") == "educational_content"
-            ]
-            
-            return educational_results[:top_k]
         except Exception as e:
-            logger.warning(f"Error retrieving educational context: {e}")
+            logger.warning("Error retrieving educational context: %s", e)
             return []
     
     async def retrieve_from_user_library(
@@ -252,6 +460,9 @@ class RAGService:
         """
         Retrieve content from user's personal library (books and stories).
         
+        Ownership, age and type are applied as a metadata pre-filter, so a
+        single vector search returns the top matches across both sources.
+        
         Args:
             query: Search query string
             user_id: User ID to filter by
@@ -264,42 +475,17 @@ class RAGService:
             List of documents from user's library
         """
         try:
-            # Perform similarity search with larger k to allow filtering
-            results = self.vector_store.similarity_search(
-                query,
-                k=top_k * 3  # Get more results to filter
-            )
+            where = self._library_filter(user_id, child_age, include_books, include_stories)
+            if where is None:
+                return []
             
-            # Filter by user_id and type
-            filtered_results = []
-            for doc in results:
-                metadata = doc.metadata
-                
-                # Check user ownership
-                if metadata.get("user_id") != user_id:
-                    continue
-                
-                # Check age appropriateness
-                if metadata.get("child_age") != child_age:
-                    continue
-                
-                # Check type filter
-                doc_type = metadata.get("type")
-                if doc_type == "book" and not include_books:
-                    continue
-                if doc_type == "story" and not include_stories:
-                    continue
-                
-                filtered_results.append(doc)
-                
-                if len(filtered_results) >= top_k:
-                    break
+            results = await self._similarity_search(query, k=top_k, where=where)
             
-            logger.info(f"Retrieved {len(filtered_results)} documents from user library")
-            return filtered_results
+            logger.info("Retrieved %d documents from user library", len(results))
+            return results
             
         except Exception as e:
-            logger.error(f"Error retrieving from user library: {e}")
+            logger.error("Error retrieving from user library: %s", e)
             return []
 
 
@@ -0,0 +1,77 @@
+"""Semantic response cache keyed on query embeddings."""
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, List, Optional, Tuple
+import numpy as np
+from app.config import settings
+from app.services.rag_service import rag_service
+from app.utils.logger import logger
+
+
+class SemanticCache:
+    """
+    In-process LRU cache that matches entries by cosine similarity.
+
+    Entries live in partitions (e.g. child age + page count) so that only
+    requests with compatible parameters can share a cached response.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[str], Awaitable[List[float]]],
+        threshold: float,
+        max_entries: int
+    ):
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Tuple[Hashable, np.ndarray, Any]]" = OrderedDict()
+        self._next_id = 0
+
+    async def embed(self, text: str) -> np.ndarray:
+        """Embed and L2-normalize text so dot products are cosine similarities."""
+        vector = np.asarray(await self.embed_fn(" ".join(text.lower().split())), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, partition: Hashable, vector: np.ndarray) -> Optional[Any]:
+        """Return the most similar cached value in the partition, if above threshold."""
+        candidates = [
+            (entry_id, entry_vector)
+            for entry_id, (entry_partition, entry_vector, _) in self._entries.items()
+            if entry_partition == partition
+        ]
+        if not candidates:
+            return None
+
+        similarities = np.stack([entry_vector for _, entry_vector in candidates]) @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+
+        entry_id = candidates[best][0]
+        self._entries.move_to_end(entry_id)
+        logger.info("Semantic cache hit (similarity %.3f)", similarities[best])
+        return self._entries[entry_id][2]
+
+    def put(self, partition: Hashable, vector: np.ndarray, value: Any) -> None:
+        """Store a value, evicting the least recently used entry when full."""
+        self._entries[self._next_id] = (partition, vector, value)
+        self._next_id += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# Singleton instance for generated stories
+story_cache = SemanticCache(
+    embed_fn=rag_service.embed_query,
+    threshold=settings.semantic_cache_threshold,
+    max_entries=settings.semantic_cache_max_entries
+)
+
+# Singleton instance for story type classifications (unpartitioned)
+story_type_cache = SemanticCache(
+    embed_fn=rag_service.embed_query,
+    threshold=settings.semantic_cache_threshold,
+    max_entries=settings.semantic_cache_max_entries
+)
+
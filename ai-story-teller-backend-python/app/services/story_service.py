@@ -1,22 +1,68 @@
 """Story service for story management and operations."""
-from typing import List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime
 from app.schemas.story import Story, PageContent
 from app.schemas.assignment import Assignment
 from app.schemas.feedback import Feedback
 from app.models.story import CreateStoryRequest
-from app.agents.story_graph import run_story_generation
-from app.openai_client.image_generator import generate_image
+from app.agents.story_graph import run_story_generation, run_story_generation_batch, stream_story_generation
+from app.openai_client.image_generator import generate_images_for_pages
 from app.openai_client.question_generator import generate_questions
 from app.openai_client.feedback_generator import generate_feedback
 from app.services.rag_service import rag_service
-from app.exceptions import NotFoundError, ForbiddenError
+from app.exceptions import NotFoundError, ForbiddenError, BadRequestError
 from app.config import settings
+from app.utils.background import run_in_background
 from app.utils.logger import logger
 import asyncio
-import httpx
-import uuid
-from app.utils.s3_client import s3_client
+
+
+# Shapes stored stories into the API response in MongoDB, so list endpoints
+# don't build and re-serialize a Story document per result
+STORY_RESPONSE_PROJECTION = {
+    "$project": {
+        "_id": 0,
+        "id": {"$toString": "$_id"},
+        "storyTitle": "$story_title",
+        "storyDescription": "$story_description",
+        "storyContent": {
+            "$map": {
+                "input": "$story_content",
+                "as": "page",
+                "in": {
+                    "pageText": "$$page.pageText",
+                    "pageImage": {"$ifNull": ["$$page.pageImage", None]}
+                }
+            }
+        },
+        "storyAuthor": "$story_author",
+        "createdBy": {"$toString": "$created_by"},
+        "maxPages": "$max_pages",
+        "createdAt": "$created_at",
+        "updatedAt": "$updated_at"
+    }
+}
+
+
+# Story list shape without pages, for list views that only need story metadata
+STORY_SUMMARY_PROJECTION = {
+    "$project": {
+        key: value
+        for key, value in STORY_RESPONSE_PROJECTION["$project"].items()
+        if key != "storyContent"
+    }
+}
+
+# Upper bound for the optional story list total, so counting stops early
+STORY_COUNT_LIMIT = 10_000
+
+# Key spellings the feedback model has been seen to use, in order of preference
+FEEDBACK_FIELD_ALIASES = {
+    "user_answer": ("userAnswer", "user_answer", "UserAnswer", "userResponse"),
+    "positive_reinforcement": ("positiveReinforcement", "positive_reinforcement", "PositiveReinforcement")
+}
 
 
 class StoryService:
@@ -52,96 +98,249 @@ class StoryService:
                 use_history_context=story_data.use_history_context
             )
             
-            # Process story content and images
-            story_contents = []
-            page_texts = generated_story.get("storyContent", [])
-            
-            # Generate images if requested (parallelize where possible)
-            image_tasks = []
-            if story_data.include_image:
-                for i, page_data in enumerate(page_texts):
-                    page_text = page_data.get("pageText", "")
-                    # Generate images for pages 0, 2, 4, etc. (every other page)
-                    if i % 3 == 0 or i % 3 == 2:
-                        image_tasks.append((i, generate_image(
-                            page_text=page_text,
-                            child_age=story_data.child_age,
-                            story_title=story_data.story_title
-                        )))
-            
-            # Execute image generation in parallel
-            image_results = {}
-            if image_tasks:
-                image_coroutines = [task[1] for task in image_tasks]
-                image_urls = await asyncio.gather(*image_coroutines, return_exceptions=True)
-                for (idx, _), url in zip(image_tasks, image_urls):
-                    if not isinstance(url, Exception) and url:
-                        image_results[idx] = url
-            
-            # Build story content with images
-            for i, page_data in enumerate(page_texts):
-                page_text = page_data.get("pageText", "")
-                page_image = None
-                
-                if i in image_results:
-                    # Use OpenAI image URL directly
-                    openai_image_url = image_results[i]
-                    
-                    try:
-                        # Download image from OpenAI
-                        async with httpx.AsyncClient() as client:
-                            response = await client.get(openai_image_url)
-                            if response.status_code == 200:
-                                image_content = response.content
-                                # Upload to S3
-                                image_filename = f"{uuid.uuid4()}.png"
-                                page_image = await s3_client.upload_image(image_content, image_filename)
-                            else:
-                                logger.warning(f"Failed to download image from OpenAI: {response.status_code}")
-                                page_image = openai_image_url # Fallback
-                    except Exception as e:
-                        logger.error(f"Error saving image to S3: {e}")
-                        page_image = openai_image_url # Fallback
-                
-                story_contents.append(PageContent(
-                    page_text=page_text,
-                    page_image=page_image
-                ))
-            
-            # Create story document
-            story = Story(
-                story_title=story_data.story_title,
-                story_description=story_data.story_description,
-                story_content=story_contents,
-                story_author=author_name,
-                created_by=user_id,
-                max_pages=story_data.max_pages
+            story = await StoryService._save_generated_story(
+                generated_story=generated_story,
+                story_data=story_data,
+                user_id=user_id,
+                author_name=author_name
             )
-            await story.insert()
             
-            # Index story in ChromaDB for RAG
-            try:
-                story_content_text = " ".join([page.page_text for page in story_contents])
-                await rag_service.add_story_to_index(
-                    story_id=str(story.id),
-                    story_title=story.story_title,
-                    story_description=story.story_description,
-                    story_content=story_content_text,
-                    child_age=story_data.child_age,
-                    metadata={"user_id": str(user_id), "author": author_name}
-                )
-            except Exception as e:
-                logger.warning(f"Failed to index story in ChromaDB: {e}")
-            
-            logger.info(f"Story created: {story.id}")
+            logger.info("Story created: %s", story.id)
             return story
             
         except Exception as e:
-            logger.error(f"Error creating story: {e}")
+            logger.error("Error creating story: %s", e)
             raise Exception(f"Failed to create story: {str(e)}")
     
     @staticmethod
-    async def get_story(story_id: str, user_id: ObjectId) -> Story:
+    async def create_stories_batch(
+        stories_data: List[CreateStoryRequest],
+        user_id: ObjectId,
+        author_name: str
+    ) -> List[Any]:
+        """
+        Create several stories with bounded concurrency.
+        
+        Args:
+            stories_data: Story creation data, one per story
+            user_id: ID of user creating the stories
+            author_name: Name of the author
+            
+        Returns:
+            Created story document (or the raised exception) for each
+            request, in input order
+        """
+        generated_stories = await run_story_generation_batch([
+            {
+                "story_description": story_data.story_description,
+                "story_title": story_data.story_title,
+                "max_pages": story_data.max_pages,
+                "child_age": story_data.child_age,
+                "user_id": str(user_id),
+                "use_books_context": story_data.use_books_context,
+                "use_history_context": story_data.use_history_context
+            }
+            for story_data in stories_data
+        ])
+        
+        async def _save(story_data: CreateStoryRequest, generated_story: Any) -> Story:
+            if isinstance(generated_story, Exception):
+                raise generated_story
+            story = await StoryService._save_generated_story(
+                generated_story=generated_story,
+                story_data=story_data,
+                user_id=user_id,
+                author_name=author_name
+            )
+            logger.info("Story created: %s", story.id)
+            return story
+        
+        return await asyncio.gather(
+            *[_save(d, g) for d, g in zip(stories_data, generated_stories)],
+            return_exceptions=True
+        )
+    
+    @staticmethod
+    async def _prefetch_questions(story_title: str, whole_story: str) -> None:
+        """Generate questions ahead of time so assignment creation hits the cache."""
+        try:
+            await generate_questions([], story_title, whole_story=whole_story)
+        except Exception as e:
+            logger.warning("Question prefetch failed: %s", e)
+    
+    @staticmethod
+    def _join_pages(story: Story) -> str:
+        """Join a story's page texts into the single string the prompts use."""
+        return " ".join([page.page_text for page in story.story_content])
+    
+    @staticmethod
+    async def _get_story_with_assignment(
+        story_id: ObjectId,
+        user_id: ObjectId
+    ) -> Tuple[Optional[Story], Optional[Assignment]]:
+        """
+        Fetch a story and the user's assignment for it in one round trip.
+        
+        Args:
+            story_id: Story ID
+            user_id: User ID the assignment belongs to
+            
+        Returns:
+            Tuple of (story or None, assignment or None)
+        """
+        results = await Story.find(Story.id == story_id).aggregate([
+            {"$limit": 1},
+            {"$lookup": {
+                "from": Assignment.get_collection_name(),
+                "let": {"sid": "$_id"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$and": [
+                        {"$eq": ["$sid", "$$sid"]},
+                        {"$eq": ["$uid", user_id]}
+                    ]}}},
+                    {"$limit": 1}
+                ],
+                "as": "assignment"
+            }}
+        ]).to_list()
+        if not results:
+            return None, None
+        
+        assignments = results[0].pop("assignment")
+        story = Story.model_validate(results[0])
+        assignment = Assignment.model_validate(assignments[0]) if assignments else None
+        return story, assignment
+    
+    @staticmethod
+    async def _save_generated_story(
+        generated_story: dict,
+        story_data: CreateStoryRequest,
+        user_id: ObjectId,
+        author_name: str
+    ) -> Story:
+        """
+        Attach images to generated pages, persist the story and index it.
+        
+        Args:
+            generated_story: Story dictionary produced by the story graph
+            story_data: Story creation data
+            user_id: ID of user creating the story
+            author_name: Name of the author
+            
+        Returns:
+            Created story document
+        """
+        # Process story content and images
+        story_contents = []
+        page_texts = generated_story.get("storyContent", [])
+        
+        # Generate images if requested (parallelize where possible)
+        image_indices = []
+        if story_data.include_image:
+            # Generate images for pages 0, 2, 4, etc. (every other page)
+            image_indices = [i for i in range(len(page_texts)) if i % 3 == 0 or i % 3 == 2]
+        
+        # Execute image generation in parallel (images are already stored in S3)
+        image_results = {}
+        if image_indices:
+            async with asyncio.TaskGroup() as tg:
+                images_task = tg.create_task(generate_images_for_pages(
+                    [page_texts[i].get("pageText", "") for i in image_indices],
+                    child_age=story_data.child_age,
+                    story_title=story_data.story_title
+                ))
+                # Images dominate the wait, so warm the questions cache alongside them
+                if settings.prefetch_questions:
+                    tg.create_task(StoryService._prefetch_questions(
+                        story_data.story_title,
+                        " ".join([page.get("pageText", "") for page in page_texts])
+                    ))
+            for idx, url in zip(image_indices, images_task.result()):
+                if url:
+                    image_results[idx] = url
+        
+        # Build story content with images
+        for i, page_data in enumerate(page_texts):
+            story_contents.append(PageContent(
+                page_text=page_data.get("pageText", ""),
+                page_image=image_results.get(i)
+            ))
+        
+        # Create story document
+        story = Story(
+            story_title=story_data.story_title,
+            story_description=story_data.story_description,
+            story_content=story_contents,
+            story_author=author_name,
+            created_by=user_id,
+            max_pages=story_data.max_pages
+        )
+        await story.insert()
+        
+        # Index for RAG after responding; the story is usable without it
+        run_in_background(StoryService._index_story(story, story_data.child_age, user_id, author_name))
+        
+        return story
+    
+    @staticmethod
+    async def _index_story(story: Story, child_age: int, user_id: ObjectId, author_name: str) -> None:
+        """Index a saved story in ChromaDB for RAG; failures are only logged."""
+        try:
+            await rag_service.add_story_to_index(
+                story_id=str(story.id),
+                story_title=story.story_title,
+                story_description=story.story_description,
+                story_pages=[page.page_text for page in story.story_content],
+                child_age=child_age,
+                metadata={"user_id": str(user_id), "author": author_name}
+            )
+        except Exception as e:
+            logger.warning("Failed to index story in ChromaDB: %s", e)
+    
+    @staticmethod
+    async def create_story_stream(
+        story_data: CreateStoryRequest,
+        user_id: ObjectId,
+        author_name: str
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Create a new story, yielding generation progress as it happens.
+        
+        Args:
+            story_data: Story creation data
+            user_id: ID of user creating the story
+            author_name: Name of the author
+            
+        Yields:
+            ("page", dict) for each page as soon as it is generated, then
+            ("story", Story) once the story has been saved
+        """
+        generated_story = None
+        async for event, payload in stream_story_generation(
+            story_description=story_data.story_description,
+            story_title=story_data.story_title,
+            max_pages=story_data.max_pages,
+            child_age=story_data.child_age,
+            user_id=str(user_id),
+            use_books_context=story_data.use_books_context,
+            use_history_context=story_data.use_history_context
+        ):
+            if event == "story":
+                generated_story = payload
+            else:
+                yield event, payload
+        
+        story = await StoryService._save_generated_story(
+            generated_story=generated_story,
+            story_data=story_data,
+            user_id=user_id,
+            author_name=author_name
+        )
+        logger.info("Story created: %s", story.id)
+        yield "story", story
+    
+    @staticmethod
+    async def get_story(story_id: ObjectId, user_id: ObjectId) -> Story:
         """
         Get a story by ID with ownership validation.
         
@@ -164,41 +363,172 @@ class StoryService:
         except (NotFoundError, ForbiddenError):
             raise
         except Exception as e:
-            logger.error(f"Error getting story: {e}")
+            logger.error("Error getting story: %s", e)
             raise Exception(f"Failed to get story: {str(e)}")
     
+    @staticmethod
+    async def get_story_serialized(story_id: ObjectId, user_id: ObjectId) -> Dict[str, Any]:
+        """
+        Get a story already shaped for the API response, with ownership validation.
+        
+        Args:
+            story_id: Story ID
+            user_id: User ID for ownership check
+            
+        Returns:
+            Serialized story dict
+        """
+        try:
+            results = await Story.find(Story.id == story_id).aggregate([
+                {"$limit": 1},
+                STORY_RESPONSE_PROJECTION
+            ]).to_list()
+            if not results:
+                raise NotFoundError("Story not found")
+            
+            if results[0]["createdBy"] != str(user_id):
+                raise ForbiddenError("Unauthorized access to this story")
+            
+            return results[0]
+        except (NotFoundError, ForbiddenError):
+            raise
+        except Exception as e:
+            logger.error("Error getting story: %s", e)
+            raise Exception(f"Failed to get story: {str(e)}")
+    
+    @staticmethod
+    async def get_full_story_text(story_id: ObjectId, user_id: ObjectId) -> str:
+        """
+        Get a story's page texts joined into one string, with ownership validation.
+        
+        The pages are joined in MongoDB so page images are never transferred.
+        
+        Args:
+            story_id: Story ID
+            user_id: User ID for ownership check
+            
+        Returns:
+            Whole story text
+        """
+        try:
+            results = await Story.find(Story.id == story_id).aggregate([
+                {"$limit": 1},
+                {"$project": {
+                    "_id": 0,
+                    "created_by": 1,
+                    "whole_story": {"$ifNull": [
+                        {"$reduce": {
+                            "input": "$story_content",
+                            "initialValue": None,
+                            "in": {"$cond": [
+                                {"$eq": ["$$value", None]},
+                                "$$this.pageText",
+                                {"$concat": ["$$value", " ", "$$this.pageText"]}
+                            ]}
+                        }},
+                        ""
+                    ]}
+                }}
+            ]).to_list()
+            if not results:
+                raise NotFoundError("Story not found")
+            
+            if results[0]["created_by"] != user_id:
+                raise ForbiddenError("Unauthorized access to this story")
+            
+            return results[0]["whole_story"]
+        except (NotFoundError, ForbiddenError):
+            raise
+        except Exception as e:
+            logger.error("Error getting full story: %s", e)
+            raise Exception(f"Failed to get story: {str(e)}")
+    
+    @staticmethod
+    def _encode_cursor(story: Dict[str, Any]) -> str:
+        """Encode a serialized story's sort position as an opaque pagination cursor."""
+        return f"{story['createdAt'].isoformat()}|{story['id']}"
+    
+    @staticmethod
+    def _decode_cursor(cursor: str) -> dict:
+        """
+        Build the filter matching stories after a cursor in (created_at, _id) descending order.
+        
+        Raises:
+            BadRequestError: If the cursor is malformed
+        """
+        try:
+            created_at, story_id = cursor.split("|", 1)
+            created_at = datetime.fromisoformat(created_at)
+            story_id = ObjectId(story_id)
+        except Exception:
+            raise BadRequestError("Invalid cursor")
+        return {
+            "$or": [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "_id": {"$lt": story_id}}
+            ]
+        }
+    
     @staticmethod
     async def get_all_stories(
         user_id: ObjectId,
         page: int = 1,
-        limit: int = 10
-    ) -> tuple[List[Story], int]:
+        limit: int = 10,
+        after: Optional[str] = None,
+        include_total: bool = False,
+        include_content: bool = True
+    ) -> tuple[List[Dict[str, Any]], Optional[int], Optional[str]]:
         """
         Get all stories for a user with pagination.
         
+        Stories come back already shaped for the API response, so they can be
+        serialized without building Story documents. Passing `after` seeks on
+        the story_user_created index instead of skipping earlier pages.
+        
         Args:
             user_id: User ID
-            page: Page number (1-based)
+            page: Page number (1-based), ignored when `after` is given
             limit: Items per page
+            after: Cursor returned with the previous page
+            include_total: Whether to count the user's stories (capped at STORY_COUNT_LIMIT)
+            include_content: Whether to return each story's pages
             
         Returns:
-            Tuple of (stories list, total count)
+            Tuple of (serialized stories list, total count or None, next page cursor)
         """
         try:
-            skip = (page - 1) * limit
-            stories = await Story.find(
-                Story.created_by == user_id
-            ).sort(-Story.created_at).skip(skip).limit(limit).to_list()
-            
-            total = await Story.find(Story.created_by == user_id).count()
+            pipeline = []
+            if after:
+                pipeline.append({"$match": StoryService._decode_cursor(after)})
+            pipeline.append({"$sort": {"created_at": -1, "_id": -1}})
+            if not after:
+                pipeline.append({"$skip": (page - 1) * limit})
+            pipeline.append({"$limit": limit})
+            pipeline.append(STORY_RESPONSE_PROJECTION if include_content else STORY_SUMMARY_PROJECTION)
+            
+            stories_query = Story.find(Story.created_by == user_id).aggregate(pipeline).to_list()
+            
+            # The count is an index-only scan; run it alongside the page query
+            # rather than after it (a $facet would fetch every story instead)
+            total = None
+            if include_total:
+                stories, total = await asyncio.gather(
+                    stories_query,
+                    Story.find(Story.created_by == user_id).limit(STORY_COUNT_LIMIT).count()
+                )
+            else:
+                stories = await stories_query
+            next_cursor = StoryService._encode_cursor(stories[-1]) if len(stories) == limit else None
             
-            return stories, total
+            return stories, total, next_cursor
+        except BadRequestError:
+            raise
         except Exception as e:
-            logger.error(f"Error getting all stories: {e}")
+            logger.error("Error getting all stories: %s", e)
             raise Exception(f"Failed to get stories: {str(e)}")
     
     @staticmethod
-    async def create_assignment(story_id: str, user_id: ObjectId) -> Assignment:
+    async def create_assignment(story_id: ObjectId, user_id: ObjectId) -> Assignment:
         """
         Create or get existing assignment for a story.
         
@@ -210,46 +540,49 @@ class StoryService:
             Assignment document
         """
         try:
-            # Check if assignment already exists
-            existing = await Assignment.find_one(
-                Assignment.sid == ObjectId(story_id),
-                Assignment.uid == user_id
-            )
+            # Get story together with any existing assignment
+            story, existing = await StoryService._get_story_with_assignment(story_id, user_id)
             if existing:
                 return existing
-            
-            # Get story
-            story = await Story.get(story_id)
             if not story:
                 raise NotFoundError("Story not found")
             
             # Generate questions
-            story_content_dict = [
-                {"pageText": page.page_text}
-                for page in story.story_content
-            ]
-            questions_data = await generate_questions(story_content_dict, story.story_title)
+            questions_data = await generate_questions(
+                [],
+                story.story_title,
+                whole_story=StoryService._join_pages(story)
+            )
             
             # Create assignment
             assignment = Assignment(
-                sid=ObjectId(story_id),
+                sid=story_id,
                 uid=user_id,
                 questions=questions_data.get("questions", [])
             )
-            await assignment.insert()
+            try:
+                await assignment.insert()
+            except DuplicateKeyError:
+                # A concurrent request created it first; keep theirs
+                return await Assignment.find_one(Assignment.sid == story_id, Assignment.uid == user_id)
             
-            logger.info(f"Assignment created: {assignment.id}")
+            logger.info("Assignment created: %s", assignment.id)
             return assignment
             
         except (NotFoundError, Exception) as e:
             if isinstance(e, NotFoundError):
                 raise
-            logger.error(f"Error creating assignment: {e}")
+            logger.error("Error creating assignment: %s", e)
             raise Exception(f"Failed to create assignment: {str(e)}")
     
+    @staticmethod
+    def _first_value(item: Dict[str, Any], keys: Tuple[str, ...], default: Any = None) -> Any:
+        """Return the first non-empty value among `keys` in `item`, or `default`."""
+        return next((item[key] for key in keys if item.get(key)), default)
+    
     @staticmethod
     async def generate_feedback_for_assignment(
-        story_id: str,
+        story_id: ObjectId,
         user_id: ObjectId,
         answers: List[str]
     ) -> Feedback:
@@ -265,91 +598,65 @@ class StoryService:
             Feedback document
         """
         try:
-            # Get assignment
-            assignment = await Assignment.find_one(
-                Assignment.sid == ObjectId(story_id),
-                Assignment.uid == user_id
-            )
+            # Get story and assignment
+            story, assignment = await StoryService._get_story_with_assignment(story_id, user_id)
             if not assignment:
                 raise NotFoundError("Assignment not found")
-            
-            # Get story
-            story = await Story.get(story_id)
             if not story:
                 raise NotFoundError("Story not found")
             
-            # Add user answers to questions
-            questions_with_answers = assignment.questions.copy()
-            for i, answer in enumerate(answers):
-                if i < len(questions_with_answers):
-                    questions_with_answers[i].user_answer = answer
-            
-            # Convert to dict format for feedback generator
+            # Pair questions with the user's answers in the feedback generator's
+            # format, leaving the loaded assignment untouched
             questions_dict = [
                 {
                     "question": q.question,
                     "answer": q.answer,
-                    "userAnswer": q.user_answer or ""
+                    "userAnswer": (answers[i] if i < len(answers) else q.user_answer) or ""
                 }
-                for q in questions_with_answers
-            ]
-            
-            story_content_dict = [
-                {"pageText": page.page_text}
-                for page in story.story_content
+                for i, q in enumerate(assignment.questions)
             ]
             
             # Generate feedback
-            feedback_data = await generate_feedback(questions_dict, story_content_dict)
+            feedback_data = await generate_feedback(
+                questions_dict,
+                [],
+                whole_story=StoryService._join_pages(story)
+            )
             
             # Transform camelCase to snake_case for Beanie compatibility
-            transformed_feedbacks = []
-            for item in feedback_data.get("results", []):
-                # Robustly get user answer with multiple key attempts and default
-                user_answ = (
-                    item.get("userAnswer") or 
-                    item.get("user_answer") or 
-                    item.get("UserAnswer") or 
-                    item.get("userResponse") or 
-                    ""
-                )
-                
-                # Robustly get positive reinforcement
-                pos_reinf = (
-                    item.get("positiveReinforcement") or 
-                    item.get("positive_reinforcement") or 
-                    item.get("PositiveReinforcement") or 
-                    None
-                )
-
-                transformed_feedbacks.append({
+            transformed_feedbacks = [
+                {
                     "question": item.get("question", ""),
                     "answer": item.get("answer", ""),
-                    "user_answer": user_answ,
+                    "user_answer": StoryService._first_value(item, FEEDBACK_FIELD_ALIASES["user_answer"], ""),
                     "rating": item.get("rating", 0),
                     "feedback": item.get("feedback", ""),
-                    "positive_reinforcement": pos_reinf
-                })
+                    "positive_reinforcement": StoryService._first_value(
+                        item, FEEDBACK_FIELD_ALIASES["positive_reinforcement"]
+                    )
+                }
+                for item in feedback_data.get("results", [])
+            ]
             
             # Create feedback document
             feedback = Feedback(
-                sid=ObjectId(story_id),
+                sid=story_id,
                 uid=user_id,
                 feedbacks=transformed_feedbacks
             )
             await feedback.insert()
             
-            logger.info(f"Feedback generated: {feedback.id}")
+            logger.info("Feedback generated: %s", feedback.id)
             return feedback
             
         except (NotFoundError, Exception) as e:
             if isinstance(e, NotFoundError):
                 raise
-            logger.error(f"Error generating feedback: {e}")
+            logger.error("Error generating feedback: %s", e)
             raise Exception(f"Failed to generate feedback: {str(e)}")
     
     @staticmethod
-    async def get_feedback(story_id: str, user_id: ObjectId) -> Feedback:
+    async def get_feedback(story_id: ObjectId, user_id: ObjectId) -> Feedback:
         """
         Get feedback for a story.
         
@@ -362,7 +669,7 @@ class StoryService:
         """
         try:
             feedback = await Feedback.find_one(
-                Feedback.sid == ObjectId(story_id),
+                Feedback.sid == story_id,
                 Feedback.uid == user_id
             )
             if not feedback:
@@ -371,7 +678,7 @@ class StoryService:
         except NotFoundError:
             raise
         except Exception as e:
-            logger.error(f"Error getting feedback: {e}")
+            logger.error("Error getting feedback: %s", e)
             raise Exception(f"Failed to get feedback: {str(e)}")
 
 
@@ -1,4 +1,5 @@
 """User service for authentication and user management."""
+import asyncio
 from typing import Optional
 from fastapi import HTTPException, status
 from app.schemas.user import User
@@ -28,8 +29,8 @@ class UserService:
             if existing_user:
                 raise ValidationError("User already exists with this email")
             
-            # Hash password
-            hashed_password = hash_password(user_data.password)
+            # Hash password; bcrypt is deliberately slow, so keep it off the event loop
+            hashed_password = await asyncio.to_thread(hash_password, user_data.password)
             
             # Create user
             user = User(
@@ -67,7 +68,7 @@ class UserService:
             if not user:
                 raise UnauthorizedError("Invalid credentials")
             
-            if not verify_password(login_data.password, user.password):
+            if not await asyncio.to_thread(verify_password, login_data.password, user.password):
                 raise UnauthorizedError("Invalid credentials")
             
             logger.info(f"User authenticated: {login_data.parent_email}")
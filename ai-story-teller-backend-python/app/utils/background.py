@@ -0,0 +1,33 @@
+"""Fire-and-forget tasks that are tracked until they finish."""
+import asyncio
+from typing import Any, Coroutine, Set, TypeVar
+from app.utils.logger import logger
+
+T = TypeVar("T")
+
+# The event loop only keeps weak references to tasks, so hold them here
+# until they finish; this also lets shutdown wait for them
+_tasks: Set[asyncio.Task] = set()
+
+
+def run_in_background(coro: Coroutine[Any, Any, T]) -> "asyncio.Task[T]":
+    """
+    Schedule a coroutine without waiting for it.
+
+    Args:
+        coro: Coroutine to run; it should handle and log its own errors
+
+    Returns:
+        The scheduled task
+    """
+    task = asyncio.create_task(coro)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+async def wait_for_background_tasks() -> None:
+    """Wait for all background tasks to finish (e.g. before shutting down)."""
+    if _tasks:
+        logger.info(f"Waiting for {len(_tasks)} background tasks")
+        await asyncio.gather(*_tasks, return_exceptions=True)
@@ -0,0 +1,18 @@
+"""Shared HTTP client for outbound OpenAI calls."""
+import httpx
+from openai import DefaultAioHttpClient
+
+HTTP_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=100)
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+
+# OpenAI traffic goes through an aiohttp transport, which keeps scaling under
+# many concurrent completions where the default httpx transport degrades
+openai_http_client = DefaultAioHttpClient(
+    limits=HTTP_LIMITS,
+    timeout=HTTP_TIMEOUT
+)
+
+
+async def close_http_client() -> None:
+    """Close the shared HTTP client."""
+    await openai_http_client.aclose()
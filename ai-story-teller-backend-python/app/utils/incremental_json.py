@@ -0,0 +1,101 @@
+"""Incremental JSON parsing for streamed LLM output."""
+import orjson
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class IncrementalJSONParser:
+    """
+    Parse a JSON object that arrives in chunks.
+
+    Items of the array stored under `array_key` are yielded from `feed` as
+    soon as their closing brace arrives, so callers never re-parse the whole
+    buffer. Anything before the first `{` (e.g. a ```json fence) and after the
+    closing `}` is ignored.
+    """
+
+    def __init__(self, array_key: str):
+        self.array_key = array_key
+        self._parts: List[str] = []
+        self._started = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_chars: Optional[List[str]] = None
+        self._last_key: Optional[str] = None
+        self._array_depth: Optional[int] = None
+        self._item_parts: Optional[List[str]] = None
+
+    def feed(self, chunk: str) -> Iterator[Dict[str, Any]]:
+        """
+        Consume a chunk of text.
+
+        Yields:
+            Each completed item of the target array
+        """
+        if self._done or not chunk:
+            return
+
+        if not self._started:
+            start = chunk.find("{")
+            if start == -1:
+                return
+            self._started = True
+            chunk = chunk[start:]
+
+        item_start = 0 if self._item_parts is not None else None
+
+        for i, ch in enumerate(chunk):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._string_chars is not None:
+                        self._last_key = "".join(self._string_chars)
+                        self._string_chars = None
+                    continue
+                if self._string_chars is not None:
+                    self._string_chars.append(ch)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                # Only top-level strings are needed to find the array key
+                self._string_chars = [] if self._depth == 1 else None
+            elif ch in "{[":
+                if ch == "[" and self._depth == 1 and self._last_key == self.array_key:
+                    self._array_depth = self._depth + 1
+                elif ch == "{" and self._depth == self._array_depth:
+                    self._item_parts = []
+                    item_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if ch == "}" and self._depth == self._array_depth and self._item_parts is not None:
+                    self._item_parts.append(chunk[item_start:i + 1])
+                    item = orjson.loads("".join(self._item_parts))
+                    self._item_parts = None
+                    item_start = None
+                    yield item
+                elif ch == "]" and self._array_depth is not None and self._depth == self._array_depth - 1:
+                    self._array_depth = None
+                elif self._depth == 0:
+                    self._parts.append(chunk[:i + 1])
+                    self._done = True
+                    return
+
+        if self._item_parts is not None:
+            self._item_parts.append(chunk[item_start:])
+        self._parts.append(chunk)
+
+    def close(self) -> Dict[str, Any]:
+        """
+        Return the complete parsed object.
+
+        Raises:
+            orjson.JSONDecodeError: If the stream did not contain a complete object
+        """
+        return orjson.loads("".join(self._parts))
@@ -1,46 +1,58 @@
 """JWT token utilities."""
-from datetime import datetime, timedelta
-from typing import Optional
-from jose import JWTError, jwt
+import time
+from typing import Any, Dict, Optional
+import jwt
 from fastapi import Response
 from app.config import settings
 from app.utils.logger import logger
 
+# Resolved once instead of on every token operation
+JWT_SECRET = settings.jwt_secret
+JWT_ALGORITHM = settings.jwt_algorithm
+JWT_ALGORITHMS = [JWT_ALGORITHM]
+JWT_LIFETIME_SECONDS = settings.jwt_expiration_days * 24 * 60 * 60
+
 
 def create_access_token(user_id: str) -> str:
     """Create JWT token for user."""
-    expire = datetime.utcnow() + timedelta(days=settings.jwt_expiration_days)
-    to_encode = {"userId": user_id, "exp": expire}
+    # Unix timestamp, which is what the token stores anyway
+    to_encode = {"userId": user_id, "exp": int(time.time()) + JWT_LIFETIME_SECONDS}
     encoded_jwt = jwt.encode(
         to_encode,
-        settings.jwt_secret,
-        algorithm=settings.jwt_algorithm
+        JWT_SECRET,
+        algorithm=JWT_ALGORITHM
     )
     return encoded_jwt
 
 
-def verify_token(token: str) -> Optional[str]:
-    """Verify JWT token and return user_id."""
+def decode_token(token: str) -> Optional[Dict[str, Any]]:
+    """Verify JWT token and return its payload."""
     try:
-        payload = jwt.decode(
+        return jwt.decode(
             token,
-            settings.jwt_secret,
-            algorithms=[settings.jwt_algorithm]
+            JWT_SECRET,
+            algorithms=JWT_ALGORITHMS
         )
-        user_id: str = payload.get("userId")
-        return user_id
-    except JWTError as e:
+    except jwt.PyJWTError as e:
         logger.warning(f"JWT verification failed: {e}")
         return None
 
 
+def verify_token(token: str) -> Optional[str]:
+    """Verify JWT token and return user_id."""
+    payload = decode_token(token)
+    if not payload:
+        return None
+    user_id: str = payload.get("userId")
+    return user_id
+
+
 def set_auth_cookie(response: Response, token: str) -> None:
     """Set JWT token in HTTP-only cookie."""
-    max_age = settings.jwt_expiration_days * 24 * 60 * 60  # seconds
     response.set_cookie(
         key="jwt",
         value=token,
-        max_age=max_age,
+        max_age=JWT_LIFETIME_SECONDS,
         httponly=True,
         samesite="lax",
         secure=False  # Set to True in production with HTTPS
@@ -1,9 +1,16 @@
 """Structured logging configuration."""
+import atexit
 import logging
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 from app.config import settings
 
+# Log files roll over at this size, keeping LOG_BACKUP_COUNT old files
+LOG_MAX_BYTES = 50 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
 
 def setup_logger(name: str = "app") -> logging.Logger:
     """Set up structured logger with file and console handlers."""
@@ -32,18 +39,38 @@ def setup_logger(name: str = "app") -> logging.Logger:
     # File handler
     log_dir = Path("logs")
     log_dir.mkdir(exist_ok=True)
-    file_handler = logging.FileHandler(log_dir / "app.log")
+    file_handler = RotatingFileHandler(
+        log_dir / "app.log",
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT
+    )
     file_handler.setLevel(logging.DEBUG)
     file_handler.setFormatter(detailed_formatter)
     
     # Error file handler
-    error_handler = logging.FileHandler(log_dir / "error.log")
+    error_handler = RotatingFileHandler(
+        log_dir / "error.log",
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT
+    )
     error_handler.setLevel(logging.ERROR)
     error_handler.setFormatter(detailed_formatter)
     
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
-    logger.addHandler(error_handler)
+    # Callers only enqueue records; a listener thread does the console and
+    # disk writes, so logging never blocks the event loop on I/O
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    listener = QueueListener(
+        log_queue,
+        console_handler,
+        file_handler,
+        error_handler,
+        respect_handler_level=True
+    )
+    listener.start()
+    # Flush queued records on interpreter exit
+    atexit.register(listener.stop)
+    
+    logger.addHandler(QueueHandler(log_queue))
     
     return logger
 
@@ -1,27 +1,28 @@
 """Password hashing and verification utilities."""
 import bcrypt
+from app.config import settings
+
+# bcrypt only reads the first 72 bytes of a password (and bcrypt>=5 rejects longer input)
+BCRYPT_MAX_BYTES = 72
+
+
+def _password_bytes(password: str) -> bytes:
+    """Encode a password the same way for hashing and verification."""
+    return password.encode('utf-8')[:BCRYPT_MAX_BYTES]
 
 
 def hash_password(password: str) -> str:
     """Hash password using bcrypt.
-    
+
     Note: bcrypt has a 72-byte limit, so we truncate the password.
     """
-    # Truncate password to 72 bytes for bcrypt compatibility
-    password_bytes = password.encode('utf-8')[:72]
-    # Generate salt and hash
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password_bytes, salt)
-    return hashed.decode('utf-8')
+    salt = bcrypt.gensalt(rounds=settings.bcrypt_rounds)
+    return bcrypt.hashpw(_password_bytes(password), salt).decode('utf-8')
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify password against hash.
-    
+
     Note: Must truncate to match hashing behavior.
     """
-    # Truncate password to 72 bytes for bcrypt compatibility
-    password_bytes = plain_password.encode('utf-8')[:72]
-    hashed_bytes = hashed_password.encode('utf-8')
-    return bcrypt.checkpw(password_bytes, hashed_bytes)
-
+    return bcrypt.checkpw(_password_bytes(plain_password), hashed_password.encode('utf-8'))
@@ -0,0 +1,94 @@
+"""PDF text extraction, parallelized across processes for large files."""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+import pypdfium2 as pdfium
+
+# Smaller PDFs are extracted inline; process startup and re-parsing would
+# cost more than they save
+PDF_PARALLEL_MIN_PAGES = 64
+PDF_PAGES_PER_TASK = 32
+PDF_MAX_WORKERS = os.cpu_count() or 1
+
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+
+# PDFium is not thread-safe, so in-process extraction is serialized; worker
+# processes each have their own copy
+_pdfium_lock = threading.Lock()
+
+
+def _page_texts(pdf: pdfium.PdfDocument, start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop) of an open PDF."""
+    texts = []
+    for i in range(start, stop):
+        page = pdf[i]
+        text_page = page.get_textpage()
+        texts.append(text_page.get_text_range().replace("\r\n", "\n"))
+        text_page.close()
+        page.close()
+    return texts
+
+
+def _extract_pages(file_content: bytes, start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop) of a PDF (runs in a worker process)."""
+    pdf = pdfium.PdfDocument(file_content)
+    try:
+        return _page_texts(pdf, start, stop)
+    finally:
+        pdf.close()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Create the worker pool on first use."""
+    global _pdf_pool
+    if _pdf_pool is None:
+        # Spawned workers only import this module, and forking a process that
+        # runs threads and an event loop is unsafe
+        _pdf_pool = ProcessPoolExecutor(
+            max_workers=PDF_MAX_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pdf_pool
+
+
+def extract_pdf_text(file_content: bytes) -> str:
+    """
+    Extract text from a PDF, splitting large files across worker processes.
+
+    Blocks until extraction finishes, so call it off the event loop.
+
+    Args:
+        file_content: PDF file bytes
+
+    Returns:
+        Non-empty page texts joined by blank lines
+    """
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(file_content)
+        try:
+            page_count = len(pdf)
+            parallel = page_count >= PDF_PARALLEL_MIN_PAGES and PDF_MAX_WORKERS > 1
+            if not parallel:
+                page_texts = _page_texts(pdf, 0, page_count)
+        finally:
+            pdf.close()
+
+    if parallel:
+        pool = _get_pool()
+        futures = [
+            pool.submit(_extract_pages, file_content, start, min(start + PDF_PAGES_PER_TASK, page_count))
+            for start in range(0, page_count, PDF_PAGES_PER_TASK)
+        ]
+        page_texts = [text for future in futures for text in future.result()]
+
+    return "\n\n".join(text for text in page_texts if text)
+
+
+def shutdown_pdf_pool() -> None:
+    """Stop the worker pool, if it was started."""
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(cancel_futures=True)
+        _pdf_pool = None
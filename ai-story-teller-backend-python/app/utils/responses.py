@@ -0,0 +1,30 @@
+"""orjson-backed JSON responses."""
+from typing import Any
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+
+def _default(obj: Any) -> Any:
+    """Serialize types orjson doesn't handle natively."""
+    # Also covers beanie's PydanticObjectId, which subclasses ObjectId
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize content to JSON with orjson, without a jsonable_encoder pass."""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson.
+
+    Routes that return an instance directly skip FastAPI's jsonable_encoder
+    pass; datetimes are serialized natively and ObjectIds as strings.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
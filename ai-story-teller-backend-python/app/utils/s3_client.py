@@ -1,10 +1,31 @@
 """AWS S3 client for audio file storage."""
+import asyncio
 import boto3
-from typing import Optional
+from typing import BinaryIO, Optional
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from app.config import settings
 from app.utils.logger import logger
 
+# One connection pool shared by every S3 caller; large enough for concurrent
+# multipart transfers, with retries that back off when S3 throttles
+S3_CLIENT_CONFIG = Config(
+    max_pool_connections=50,
+    retries={"mode": "adaptive", "max_attempts": 5}
+)
+
+# Files above the threshold are sent as concurrent multipart chunks
+UPLOAD_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=5 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    use_threads=True
+)
+
+# Image keys are unique per upload and never overwritten, so caches
+# (browsers and the CDN) can keep them indefinitely
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
 
 class S3Client:
     """S3 client for file operations."""
@@ -14,18 +35,28 @@ class S3Client:
             's3',
             aws_access_key_id=settings.aws_access_key_id,
             aws_secret_access_key=settings.aws_secret_access_key,
-            region_name=settings.aws_region
+            region_name=settings.aws_region,
+            config=S3_CLIENT_CONFIG
         )
         self.bucket_name = settings.s3_bucket_name
+        # Object URLs only differ by key, so build the rest once
+        self.url_prefix = f"https://{self.bucket_name}.s3.{settings.aws_region}.amazonaws.com/"
+        self.image_url_prefix = (
+            settings.cdn_base_url.rstrip("/") + "/" if settings.cdn_base_url else self.url_prefix
+        )
     
     async def upload_audio(
         self,
-        file_content: bytes,
+        file_obj: BinaryIO,
         file_name: str,
-        folder: str = "audio"
+        folder: str = "audio",
+        content_type: Optional[str] = None
     ) -> tuple[str, str]:
         """
-        Upload audio file to S3.
+        Stream an audio file object to S3.
+        
+        The file is read in chunks (multipart for large files) in a worker
+        thread, so memory stays flat and the event loop is not blocked.
         
         Returns:
             tuple: (s3_key, s3_url)
@@ -35,15 +66,17 @@ class S3Client:
             s3_key = f"{folder}/{file_name}"
             
             # Upload file
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=s3_key,
-                Body=file_content,
-                ContentType="audio/wav"
+            await asyncio.to_thread(
+                self.s3_client.upload_fileobj,
+                file_obj,
+                self.bucket_name,
+                s3_key,
+                ExtraArgs={"ContentType": content_type or "audio/wav"},
+                Config=UPLOAD_TRANSFER_CONFIG
             )
             
             # Generate URL
-            s3_url = f"https://{self.bucket_name}.s3.{settings.aws_region}.amazonaws.com/{s3_key}"
+            s3_url = self.url_prefix + s3_key
             
             logger.info(f"Audio uploaded to S3: {s3_key}")
             return s3_key, s3_url
@@ -62,22 +95,24 @@ class S3Client:
         Upload image bytes to S3.
         
         Returns:
-            str: s3_url
+            str: image URL, on the CDN if `cdn_base_url` is set
         """
         try:
             # Generate S3 key
             s3_key = f"{folder}/{file_name}"
             
             # Upload file
-            self.s3_client.put_object(
+            await asyncio.to_thread(
+                self.s3_client.put_object,
                 Bucket=self.bucket_name,
                 Key=s3_key,
                 Body=file_content,
-                ContentType="image/png"
+                ContentType="image/png",
+                CacheControl=IMAGE_CACHE_CONTROL
             )
             
-            # Generate URL
-            s3_url = f"https://{self.bucket_name}.s3.{settings.aws_region}.amazonaws.com/{s3_key}"
+            # Generate URL (served from the CDN when configured)
+            s3_url = self.image_url_prefix + s3_key
             
             logger.info(f"Image uploaded to S3: {s3_key}")
             return s3_url
@@ -102,7 +137,8 @@ class S3Client:
     async def delete_audio(self, s3_key: str) -> None:
         """Delete audio file from S3."""
         try:
-            self.s3_client.delete_object(
+            await asyncio.to_thread(
+                self.s3_client.delete_object,
                 Bucket=self.bucket_name,
                 Key=s3_key
             )
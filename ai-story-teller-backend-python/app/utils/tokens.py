@@ -0,0 +1,29 @@
+"""Token counting utilities."""
+from functools import lru_cache
+import tiktoken
+
+# Tokenizer used by the gpt-4o / gpt-5 model families
+ENCODING_NAME = "o200k_base"
+
+# Tokenizer used by the OpenAI embedding models
+EMBEDDING_ENCODING_NAME = "cl100k_base"
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str = ENCODING_NAME) -> tiktoken.Encoding:
+    """Load a tokenizer once, on first use (it may need to be downloaded)."""
+    return tiktoken.get_encoding(name)
+
+
+def count_embedding_tokens(text: str) -> int:
+    """Count the tokens `text` takes up in an embedding request."""
+    return len(get_encoding(EMBEDDING_ENCODING_NAME).encode_ordinary(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Truncate text to at most `max_tokens` tokens."""
+    encoding = get_encoding()
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
@@ -1,8 +1,8 @@
 import os
 import pytest
-import asyncio
-from typing import Generator
-from unittest.mock import MagicMock, patch
+import pytest_asyncio
+from typing import AsyncGenerator, List
+from unittest.mock import Mock, patch
 
 # Mock environment variables before importing anything else
 os.environ["MONGODB_URI"] = "mongodb://mock"
@@ -16,10 +16,11 @@ os.environ["AWS_SECRET_ACCESS_KEY"] = "test"
 os.environ["AWS_REGION"] = "us-east-1"
 os.environ["S3_BUCKET_NAME"] = "test-bucket"
 os.environ["LOG_LEVEL"] = "INFO"
+os.environ["BCRYPT_ROUNDS"] = "4"
 
 from fastapi.testclient import TestClient
 from mongomock_motor import AsyncMongoMockClient
-from beanie import init_beanie
+from beanie import PydanticObjectId, init_beanie
 
 from app.main import app
 from app.database import connect_db
@@ -28,82 +29,148 @@ from app.schemas.story import Story
 from app.schemas.assignment import Assignment
 from app.schemas.feedback import Feedback
 from app.schemas.audio import Audio
+from app.utils.s3_client import S3Client
 
 
-@pytest.fixture(scope="session")
-def event_loop():
-    """Create an instance of the default event loop for each test case."""
-    loop = asyncio.new_event_loop()
-    yield loop
-    loop.close()
+DOCUMENT_MODELS = [User, Story, Assignment, Feedback, Audio]
 
+# Signed up once per session and kept across tests (see seeded_user)
+SEEDED_USER = {
+    "parent_name": "Test Parent",
+    "parent_email": "auth_test@example.com",
+    "child_name": "Test Child",
+    "child_age": 10,
+    "password": "Password123!",
+    "child_standard": 5
+}
 
-@pytest.fixture(scope="function")
-async def mock_db():
-    """Initialize Beanie with a mock MongoDB client."""
+
+@pytest_asyncio.fixture(scope="session")
+async def beanie_db():
+    """Initialize Beanie with a mock MongoDB client once for the whole session."""
     client = AsyncMongoMockClient()
     await init_beanie(
         database=client.test_db,
-        document_models=[User, Story, Assignment, Feedback, Audio]
+        document_models=DOCUMENT_MODELS
     )
     yield
-    # Clean up - drop database not needed with mock client usually, but good practice
-    # client.drop_database("test_db")
 
 
-@pytest.fixture(scope="function")
-async def client(mock_db) -> Generator:
-    """Create a FastAPI TestClient with mocked dependencies."""
+@pytest_asyncio.fixture
+async def mock_db(beanie_db):
+    """Give each test empty collections, apart from the seeded user."""
+    for model in DOCUMENT_MODELS:
+        query = {"parent_email": {"$ne": SEEDED_USER["parent_email"]}} if model is User else {}
+        await model.get_pymongo_collection().delete_many(query)
+    yield
+
+
+@pytest_asyncio.fixture(scope="session")
+async def app_client(beanie_db) -> AsyncGenerator[TestClient, None]:
+    """Start the app once per session behind a FastAPI TestClient."""
     # Override startup event to prevent real DB connection
     with patch("app.main.connect_db", return_value=None):
         with TestClient(app) as c:
             yield c
 
 
+@pytest_asyncio.fixture
+async def client(app_client, mock_db) -> TestClient:
+    """The shared TestClient, with a clean database and no stored cookies."""
+    app_client.cookies.clear()
+    return app_client
+
+
+@pytest_asyncio.fixture(scope="session")
+async def seeded_session(app_client):
+    """Sign up the seeded user once and return (user, auth cookies)."""
+    # Use the signup endpoint so the user has a valid hashed password
+    response = app_client.post("/api/user/signup", json=SEEDED_USER)
+    assert response.status_code == 201
+    user = await User.find_one(User.parent_email == SEEDED_USER["parent_email"])
+    return user, response.cookies
+
+
 @pytest.fixture
-def mock_s3_client():
-    """Mock the S3 client wrapper."""
-    with patch("app.utils.s3_client.s3_client") as mock:
-        mock.upload_audio.return_value = ("test-key", "https://s3.amazonaws.com/test-bucket/test.mp3")
-        yield mock
+def seeded_user(seeded_session) -> User:
+    """The user signed up once for the whole session."""
+    return seeded_session[0]
 
 
 @pytest.fixture
-def mock_openai():
-    """Mock OpenAI interactions."""
-    with patch("app.services.rag_service.OpenAIEmbeddings"), \
-         patch("app.services.rag_service.Chroma"), \
-         patch("app.openai_client.story_generator.AsyncOpenAI"), \
-         patch("app.services.audio_service.openai_client"):
-        yield
+def signed_up_user(seeded_session):
+    """Login credentials (email, password) of the seeded user."""
+    return SEEDED_USER["parent_email"], SEEDED_USER["password"]
 
 
 @pytest.fixture
-async def auth_headers(client):
-    """Create a user and return auth headers/cookies."""
-    # Create test user directly in DB
-    user = User(
-        parent_name="Test Parent",
-        parent_email="test@example.com",
-        child_name="Test Child",
-        child_age=10,
-        password="hashed_password_placeholder",  # In real auth, this would be hashed
-        child_standard=5
-    )
-    # We need to manually insert because the signup route hashes the password
-    # For integration testing login, we might want to use the signup endpoint instead
-    # But for just getting a token, we can mock the token creation or login flow
+def auth_headers(client, seeded_session):
+    """Sign the shared client in as the seeded user for one test."""
+    client.cookies.update(seeded_session[1])
+    yield
+    client.cookies.clear()
+
+
+@pytest.fixture
+def insert_stories(seeded_user):
+    """
+    Insert stories owned by the seeded user in one round trip.
     
-    # Let's use the signup endpoint to create a valid user with hashed password
-    response = client.post("/api/user/signup", json={
-        "parent_name": "Test Parent",
-        "parent_email": "auth_test@example.com",
-        "child_name": "Test Child",
-        "child_age": 10,
-        "password": "Password123!",
-        "child_standard": 5
-    })
+    Each argument holds the fields that differ from the defaults; ids are
+    assigned up front because insert_many doesn't set them on the documents.
+    """
+    async def insert(*fields: dict) -> List[Story]:
+        stories = [
+            Story(**{
+                "id": PydanticObjectId(),
+                "story_title": "Test Story",
+                "story_description": "Desc",
+                "story_content": [],
+                "story_author": seeded_user.parent_name,
+                "created_by": seeded_user.id,
+                "max_pages": 3,
+                **story_fields
+            })
+            for story_fields in fields
+        ]
+        await Story.insert_many(stories)
+        return stories
+    return insert
+
+
+class Recorder:
+    """Async stand-in that records its calls and returns a fixed value."""
     
-    # The response should have set the cookie
-    assert response.status_code == 201
-    return response.cookies
+    def __init__(self, return_value=None):
+        self.return_value = return_value
+        self.calls = []
+    
+    async def __call__(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+        return self.return_value
+
+
+@pytest.fixture
+def recorder():
+    """Factory for Recorder stubs, to install with monkeypatch.setattr."""
+    return Recorder
+
+
+@pytest.fixture
+def mock_s3_client():
+    """Mock the S3 client wrapper where the audio service uses it."""
+    # Specced on S3Client, so its async methods become AsyncMocks
+    mock = Mock(spec=S3Client)
+    mock.upload_audio.return_value = ("test-key", "https://s3.amazonaws.com/test-bucket/test.mp3")
+    with patch("app.services.audio_service.s3_client", mock):
+        yield mock
+
+
+@pytest.fixture
+def mock_openai():
+    """Mock OpenAI interactions."""
+    with patch("app.services.rag_service.OpenAIEmbeddings", new_callable=Mock), \
+         patch("app.services.rag_service.Chroma", new_callable=Mock), \
+         patch("app.openai_client.story_generator.client", new_callable=Mock), \
+         patch("app.services.audio_service.client", new_callable=Mock):
+        yield
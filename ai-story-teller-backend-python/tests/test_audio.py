@@ -4,55 +4,59 @@ from app.schemas.story import Story
 from app.schemas.audio import Audio
 from app.schemas.user import User
 from bson import ObjectId
-from unittest.mock import patch, MagicMock
 
 # Unit Tests for Logic
-def test_analyze_punctuation():
+def red(text):
+    return f'<span class="bg-red-200 text-red-700 px-1 rounded">{text}</span>'
+
+
+def green(text):
+    return f'<span class="bg-green-200 text-green-700 px-1 rounded">{text}</span>'
+
+
+@pytest.mark.parametrize("transcript, story, expected", [
+    # Differing punctuation in the first sentence
+    ("Hello world.", "Hello, world!", [
+        {"sentence_index": 0, "transcript_punctuation": ["."], "story_punctuation": [",", "!"]}
+    ]),
+    # Only the second sentence differs
+    ("Hi there. See you.", "Hi there. See you!", [
+        {"sentence_index": 1, "transcript_punctuation": ["."], "story_punctuation": ["!"]}
+    ]),
+    # Different words with the same punctuation
+    ("Hello there.", "Hello world.", []),
+    # Identical text
+    ("Hello world.", "Hello world.", []),
+])
+def test_analyze_punctuation(transcript, story, expected):
     """Test punctuation analysis logic."""
-    transcript = "Hello world."
-    story = "Hello, world!"
-    
-    diffs = AudioService.analyze_punctuation(transcript, story)
-    
-    assert len(diffs) > 0
-    # Both sentences are index 0
-    assert diffs[0]['sentence_index'] == 0
-    # Check simple comparison
-    assert '.' in diffs[0]['transcript_punctuation']
-    assert ',' in diffs[0]['story_punctuation']
+    assert AudioService.analyze_punctuation(transcript, story) == expected
+
 
-def test_highlight_differences():
+@pytest.mark.parametrize("original, reading, expected", [
+    # Identical text has no highlights
+    ("Hello world", "Hello world", "Hello world"),
+    # A replaced word shows the original in red and the reading in green
+    ("Hello world", "Hello universe", f"Hello {red('world')} {green('universe')}"),
+    # Insert-only and delete-only spans are highlighted on their own
+    ("Hello world", "Hello big world", f"Hello {green('big')} world"),
+    ("Hello big bad world", "Hello world", f"Hello {red('big bad')} world"),
+])
+def test_highlight_differences(original, reading, expected):
     """Test difference highlighting logic."""
-    original = "Hello world"
-    reading = "Hello universe"
-    
-    html = AudioService.highlight_differences(original, reading)
-    
-    # Should contain red span for 'world' and green for 'universe'
-    assert "text-red-700" in html
-    assert "world" in html
-    assert "text-green-700" in html
-    assert "universe" in html
+    assert AudioService.highlight_differences(original, reading) == expected
 
 
 # Integration Tests
-@pytest.mark.asyncio
-async def test_upload_audio(client, auth_headers, mock_s3_client):
+async def test_upload_audio(client, auth_headers, insert_stories, mock_s3_client):
     """Test audio upload endpoint."""
     # Create a story first
-    user = await User.find_one(User.parent_email == "auth_test@example.com")
-    story = Story(
-        story_title="Audio Test Story",
-        story_content=[],
-        max_pages=1,
-        user_id=user.id
-    )
-    await story.insert()
+    story, = await insert_stories({"story_title": "Audio Test Story", "max_pages": 1})
     
     # File to upload
     files = {'audio': ('test.mp3', b'filecontent', 'audio/mpeg')}
     
-    response = client.post(f"/api/audio/upload/{story.id}", files=files, cookies=auth_headers)
+    response = client.post(f"/api/audio/upload/{story.id}", files=files)
     
     assert response.status_code == 200 # Original code returns 200/201
     audio_id = response.json()
@@ -64,18 +68,11 @@ async def test_upload_audio(client, auth_headers, mock_s3_client):
     assert audio.file_name == "test.mp3"
 
 
-@pytest.mark.asyncio
-async def test_process_audio(client, auth_headers, mock_s3_client):
+async def test_process_audio(client, auth_headers, seeded_user, insert_stories, mock_s3_client, monkeypatch, recorder):
     """Test audio processing endpoint with mocked AI services."""
     # Setup data
-    user = await User.find_one(User.parent_email == "auth_test@example.com")
-    story = Story(
-        story_title="Process Story",
-        story_content=[],
-        max_pages=1,
-        user_id=user.id
-    )
-    await story.insert()
+    user = seeded_user
+    story, = await insert_stories({"story_title": "Process Story", "max_pages": 1})
     
     # Create audio record directly
     audio = Audio(
@@ -88,20 +85,31 @@ async def test_process_audio(client, auth_headers, mock_s3_client):
     await audio.insert()
     
     # Mock AudioService helper methods to avoid real API calls
-    with patch.object(AudioService, 'transcribe_audio', return_value="The quick red fox.") as mock_transcribe, \
-         patch.object(AudioService, 'enhance_transcript', return_value="The quick brown fox.") as mock_enhance:
-         
-        response = client.get(f"/api/audio/process-audio/{audio.id}", cookies=auth_headers)
-        
-        assert response.status_code == 200
-        data = response.json()
-        
-        # Verify structure
-        assert "transcript" in data
-        assert "score" in data
-        assert "punctuation_analysis" in data
-        assert "highlighted_diff" in data
-        
-        # Verify logic called
-        # "red" vs "brown" should cause a difference
-        assert data["transcript"] == "The quick red fox."
+    transcribe = recorder(return_value="The quick red fox.")
+    enhance = recorder(return_value="The quick brown fox.")
+    monkeypatch.setattr(AudioService, "transcribe_audio", transcribe)
+    monkeypatch.setattr(AudioService, "enhance_transcript", enhance)
+    
+    response = client.get(f"/api/audio/process-audio/{audio.id}")
+    
+    assert response.status_code == 200
+    data = response.json()
+    
+    # Verify structure
+    assert "transcript" in data
+    assert "score" in data
+    assert "punctuation_analysis" in data
+    assert "highlighted_diff" in data
+    
+    # Verify the stubbed services were called with the audio and story
+    assert transcribe.calls == [(("http://mock/audio.mp3",), {})]
+    assert enhance.calls == [(("The quick red fox.", "The quick brown fox."), {})]
+    
+    # "red" vs "brown" should cause a difference in the raw transcript, while
+    # the enhanced transcript matches the story exactly
+    assert data["transcript"] == "The quick red fox."
+    assert data["enhanced_transcript"] == "The quick brown fox."
+    assert data["score"] == 100
+    assert data["punctuation_analysis"] == []
+    assert "brown" in data["highlighted_diff"]
+    assert "red" in data["highlighted_diff"]
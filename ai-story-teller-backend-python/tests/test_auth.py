@@ -1,7 +1,5 @@
-import pytest
 from app.schemas.user import User
 
-@pytest.mark.asyncio
 async def test_signup(client):
     """Test user registration."""
     response = client.post("/api/user/signup", json={
@@ -24,24 +22,13 @@ async def test_signup(client):
     assert user is not None
 
 
-@pytest.mark.asyncio
-async def test_login(client):
+async def test_login(client, signed_up_user):
     """Test user login."""
-    # First create a user
-    signup_data = {
-        "parent_name": "Login User",
-        "parent_email": "login@example.com",
-        "child_name": "Login Child",
-        "child_age": 8,
-        "password": "Password123!",
-        "child_standard": 3
-    }
-    client.post("/api/user/signup", json=signup_data)
-    
-    # Now try to login
+    # Log in as the user signed up once for the session
+    email, password = signed_up_user
     response = client.post("/api/user/login", json={
-        "email": "login@example.com",
-        "password": "Password123!"
+        "email": email,
+        "password": password
     })
     
     assert response.status_code == 200
@@ -50,21 +37,19 @@ async def test_login(client):
     assert "access_token" in response.cookies or "access_token" in response.headers.get("set-cookie", "")
 
 
-@pytest.mark.asyncio
 async def test_get_me(client, auth_headers):
     """Test getting current user info."""
     # auth_headers fixture already creates a user and logs them in (sets cookies)
-    response = client.get("/api/user/me", cookies=auth_headers)
+    response = client.get("/api/user/me")
     
     assert response.status_code == 200
     data = response.json()
     assert data["parent_email"] == "auth_test@example.com"
 
 
-@pytest.mark.asyncio
 async def test_logout(client, auth_headers):
     """Test logout."""
-    response = client.post("/api/user/logout", cookies=auth_headers)
+    response = client.post("/api/user/logout")
     
     assert response.status_code == 200
     assert response.json()["message"] == "Logged out successfully"
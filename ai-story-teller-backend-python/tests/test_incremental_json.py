@@ -0,0 +1,41 @@
+import json
+from app.utils.incremental_json import IncrementalJSONParser
+
+
+STORY = {
+    "storyTitle": "The {Brave} Toaster",
+    "storyDescription": "A \"toaster\" goes on an adventure",
+    "storyContent": [
+        {"pageText": "Once upon a time {there was} a toaster."},
+        {"pageText": "It said \"hello\" to the [world]."}
+    ]
+}
+
+
+def _feed_in_chunks(parser, text, size):
+    items = []
+    for i in range(0, len(text), size):
+        items.extend(parser.feed(text[i:i + size]))
+    return items
+
+
+def test_yields_pages_across_chunk_boundaries():
+    """Pages are emitted whole regardless of how the stream is split."""
+    text = "```json\n" + json.dumps(STORY) + "\n```"
+    
+    for size in (1, 3, 7, len(text)):
+        parser = IncrementalJSONParser("storyContent")
+        pages = _feed_in_chunks(parser, text, size)
+        
+        assert pages == STORY["storyContent"]
+        assert parser.close() == STORY
+
+
+def test_ignores_nested_arrays_under_other_keys():
+    """Only items of the requested key are yielded."""
+    doc = {"other": [{"pageText": "skip"}], "storyContent": [{"pageText": "keep"}]}
+    parser = IncrementalJSONParser("storyContent")
+    
+    pages = list(parser.feed(json.dumps(doc)))
+    
+    assert pages == [{"pageText": "keep"}]
@@ -0,0 +1,75 @@
+import asyncio
+import httpx
+import openai
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+from app.openai_client._inflight import coalesce
+from app.config import settings
+from app.openai_client._limiter import MAX_RETRY_AFTER_SECONDS, AsyncLimiter, _retry_delay, get_limiter, guarded_call
+
+
+def raw_response(headers=None):
+    raw = Mock()
+    raw.headers = headers or {}
+    raw.parse.return_value = "parsed"
+    return raw
+
+
+def rate_limit_error(retry_after="0"):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, request=request, headers={"retry-after": retry_after})
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+async def test_limiter_tracks_budget_and_headers():
+    """Acquiring consumes budget and response headers clamp what remains."""
+    limiter = AsyncLimiter(requests_per_minute=10, tokens_per_minute=1000)
+    
+    await limiter.acquire(400)
+    assert limiter.tokens_available == pytest.approx(600, abs=1)
+    assert limiter.requests_available == pytest.approx(9, abs=0.01)
+    
+    limiter.update_from_headers({"x-ratelimit-remaining-tokens": "50"})
+    assert limiter.tokens_available == 50
+
+
+def test_image_models_get_their_own_limit():
+    """Image models are limited in images per minute, separately from chat models."""
+    assert get_limiter("dall-e-3").requests_per_minute == settings.openai_images_per_minute
+    assert get_limiter("gpt-4o-mini").requests_per_minute == settings.openai_requests_per_minute
+    assert get_limiter("dall-e-3") is not get_limiter("gpt-4o-mini")
+
+
+async def test_guarded_call_retries_rate_limit_errors():
+    """429s are retried after Retry-After, then the parsed response is returned."""
+    call = AsyncMock(side_effect=[rate_limit_error(), raw_response()])
+    
+    with patch("app.openai_client._limiter.asyncio.sleep", AsyncMock()) as sleep:
+        result = await guarded_call(call, model="test-model", est_tokens=10)
+    
+    assert result == "parsed"
+    assert call.await_count == 2
+    sleep.assert_awaited_once_with(0.0)
+
+
+def test_retry_after_is_capped():
+    """A huge Retry-After header is clamped instead of stalling the request."""
+    assert _retry_delay(rate_limit_error(retry_after="3600"), attempt=0) == MAX_RETRY_AFTER_SECONDS
+
+
+async def test_coalesce_shares_inflight_requests():
+    """Concurrent callers with the same key share one request."""
+    inflight = {}
+    calls = 0
+    
+    async def request():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+        return "result"
+    
+    results = await asyncio.gather(*[coalesce(inflight, "key", request) for _ in range(3)])
+    
+    assert results == ["result"] * 3
+    assert calls == 1
+    assert inflight == {}
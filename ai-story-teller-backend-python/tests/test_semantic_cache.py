@@ -0,0 +1,48 @@
+from app.config import settings
+from app.openai_client import story_generator
+from app.services.semantic_cache import SemanticCache, story_cache
+
+
+VECTORS = {
+    "a brave toaster": [1.0, 0.0, 0.0],
+    "a brave little toaster": [0.99, 0.1, 0.0],
+    "sunset with grandma": [0.0, 1.0, 0.0],
+}
+
+
+async def fake_embed(text):
+    return VECTORS[text]
+
+
+async def test_semantic_cache_hit_and_partitioning():
+    """Similar queries hit within a partition; other partitions never match."""
+    cache = SemanticCache(embed_fn=fake_embed, threshold=0.95, max_entries=2)
+    
+    vector = await cache.embed("A  brave Toaster")
+    cache.put((5, 3), vector, {"storyContent": []})
+    
+    similar = await cache.embed("a brave little toaster")
+    assert cache.get((5, 3), similar) == {"storyContent": []}
+    assert cache.get((6, 3), similar) is None
+    assert cache.get((5, 3), await cache.embed("sunset with grandma")) is None
+
+
+async def test_semantic_cache_evicts_least_recently_used():
+    """The oldest untouched entry is evicted once max_entries is exceeded."""
+    cache = SemanticCache(embed_fn=fake_embed, threshold=0.95, max_entries=1)
+    
+    cache.put("p", await cache.embed("a brave toaster"), "first")
+    cache.put("p", await cache.embed("sunset with grandma"), "second")
+    
+    assert cache.get("p", await cache.embed("a brave toaster")) is None
+    assert cache.get("p", await cache.embed("sunset with grandma")) == "second"
+
+
+async def test_story_lookup_is_opt_in(monkeypatch, recorder):
+    """Story generation neither embeds nor reuses stories unless the cache is enabled."""
+    embed = recorder(return_value=[1.0, 0.0, 0.0])
+    monkeypatch.setattr(story_cache, "embed", embed)
+    monkeypatch.setattr(settings, "semantic_cache_enabled", False)
+    
+    assert await story_generator._lookup_cached_story((5, 3), "a brave toaster") == (None, None)
+    assert embed.calls == []
@@ -1,77 +1,58 @@
-import pytest
 from app.schemas.story import Story
 from app.schemas.user import User
+from beanie import PydanticObjectId
 from bson import ObjectId
+from app.services.story_service import story_service
 
-@pytest.mark.asyncio
-async def test_create_story(client, auth_headers, mock_openai):
+async def test_create_story(client, auth_headers, seeded_user, monkeypatch, recorder):
     """Test story creation."""
+    # Stub out generation so only the route wiring is tested, without
+    # constructing the OpenAI or Chroma clients
+    story = Story(
+        id=PydanticObjectId(),
+        story_title="The Brave Little Toaster",
+        story_description="A toaster goes on an adventure",
+        story_content=[],
+        story_author=seeded_user.parent_name,
+        created_by=seeded_user.id,
+        max_pages=3
+    )
+    mock_create = recorder(return_value=story)
+    monkeypatch.setattr(story_service, "create_story", mock_create)
+    
     response = client.post("/api/story/create", json={
         "story_title": "The Brave Little Toaster",
         "story_description": "A toaster goes on an adventure",
         "child_age": 5,
         "max_pages": 3,
         "image_style": "cartoon"
-    }, cookies=auth_headers)
+    })
     
-    # Needs mocked OpenAI response, which is handled by mock_openai fixture
-    # However, story_service.create_story constructs the story. 
-    # Since we mocked the generator, we need to ensure it returns valid data structure if called.
-    # For now, let's assume the mock returns success or check if it fails due to mock structure.
-    # Ideally, we should mock story_service.create_story directly for integration test if we don't want to test the service logic here.
-    # But let's try to test the endpoint.
-    
-    # If the service logic is complex and calls OpenAI, the mock_openai fixture needs to return propper structure.
-    # Let's mock the keys in story_generator.py in the fixture more precisely if needed.
-    # Alternatively, we can mock `app.routers.stories.story_service.create_story` to skip the complex logic.
-    pass # TODO: Implement robust mock for story generation 
+    assert response.status_code == 201
+    assert response.json()["story"]["id"] == str(story.id)
+    assert len(mock_create.calls) == 1
 
 
-@pytest.mark.asyncio
-async def test_get_stories(client, auth_headers):
+async def test_get_stories(client, auth_headers, seeded_user, insert_stories):
     """Test getting stories for a user."""
-    # First create a dummy story in DB
-    # We need the user ID from auth_headers. 
-    # The auth_headers fixture created a user with specific email.
-    user = await User.find_one(User.parent_email == "auth_test@example.com")
+    # First create a dummy story in DB, owned by the user behind auth_headers
+    user = seeded_user
+    await insert_stories({"story_title": "Test Story"})
     
-    story = Story(
-        story_title="Test Story",
-        story_description="Desc",
-        story_content=[],
-        story_author="Test Parent",
-        created_by="Test Parent", 
-        max_pages=3,
-        user_id=user.id
-    )
-    await story.insert()
-    
-    response = client.get(f"/api/story/stories/{user.id}", cookies=auth_headers)
+    response = client.get(f"/api/story/stories/{user.id}")
     
     assert response.status_code == 200
     data = response.json()
     assert "stories" in data
     assert len(data["stories"]) >= 1
-    assert data["stories"][0]["story_title"] == "Test Story"
+    assert data["stories"][0]["storyTitle"] == "Test Story"
 
-@pytest.mark.asyncio
-async def test_get_single_story(client, auth_headers):
+async def test_get_single_story(client, auth_headers, insert_stories):
     """Test getting a single story."""
-    user = await User.find_one(User.parent_email == "auth_test@example.com")
-    
-    story = Story(
-        story_title="Single Story",
-        story_description="Desc",
-        story_content=[],
-        story_author="Test Parent",
-        created_by="Test Parent",
-        max_pages=3,
-        user_id=user.id
-    )
-    await story.insert()
+    story, = await insert_stories({"story_title": "Single Story"})
     
-    response = client.get(f"/api/story/getStory/{story.id}", cookies=auth_headers)
+    response = client.get(f"/api/story/getStory/{story.id}")
     
     assert response.status_code == 200
     data = response.json()
-    assert data["story"]["story_title"] == "Single Story"
+    assert data["story"]["storyTitle"] == "Single Story"